@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import argparse
+import ipaddress
+
+import netaddr
+
+from cidre.cidrs import cidr_ranges
+
+
+def generate(records: int, seed: int):
+    rng = random.Random(seed)
+
+    lines = []
+    for _ in range(records):
+        if rng.random() < 0.8:
+            start = ipaddress.IPv4Address(rng.getrandbits(23) << 8)
+            count = rng.choice([256, 512, 768, 1024, 2560, 4096, 65536])
+            lines.append(f"ripencc|DE|ipv4|{start}|{count}|20100101|allocated|x")
+        else:
+            start = ipaddress.IPv6Address((0x2000 << 112) | (rng.getrandbits(32) << 80))
+            count = rng.choice([29, 32, 48])
+            lines.append(f"ripencc|DE|ipv6|{start}|{count}|20100101|allocated|x")
+
+    return lines
+
+
+def convert_netaddr(lines):
+    cidrs = []
+    for line in lines:
+        _registry, _cc, _ip_version, start_ip, value, _date, _status = line.split("|")[
+            :7
+        ]
+
+        count = int(value)
+        start_ip_obj = ipaddress.ip_address(start_ip)
+        end_ip_obj = ipaddress.ip_address(int(start_ip_obj) + count - 1)
+
+        cidrs.extend(netaddr.iprange_to_cidrs(str(start_ip_obj), str(end_ip_obj)))
+
+    return [str(cidr) for cidr in cidrs]
+
+
+def convert_int(lines):
+    cidrs = []
+    for line in lines:
+        _registry, _cc, ip_version, start_ip, value, _date, _status = line.split("|")[
+            :7
+        ]
+
+        for start, prefixlen in cidr_ranges.range_to_cidrs(
+            cidr_ranges.parse_ip(start_ip, ip_version), int(value), ip_version
+        ):
+            cidrs.append((start, prefixlen, ip_version))
+
+    return [
+        cidr_ranges.format_cidr(start, prefixlen, ip_version)
+        for start, prefixlen, ip_version in cidrs
+    ]
+
+
+def measure(convert, lines):
+    started = time.perf_counter()
+    result = convert(lines)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks parse+convert of delegated records into CIDRs."
+    )
+    parser.add_argument("-n", "--records", type=int, default=300_000)
+    parser.add_argument("-s", "--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    lines = generate(args.records, args.seed)
+
+    legacy, legacy_elapsed = measure(convert_netaddr, lines)
+    fast, fast_elapsed = measure(convert_int, lines)
+
+    assert legacy == fast, "Integer converter output differs from netaddr output"
+
+    print(f"records:  {len(lines)}")
+    print(f"cidrs:    {len(fast)}")
+    print(f"netaddr:  {legacy_elapsed:.2f}s")
+    print(f"integer:  {fast_elapsed:.2f}s")
+    print(f"speedup:  {legacy_elapsed / fast_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import stat
+import time
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import collections
+import tracemalloc
+
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import synthetic
+
+from cidre.cidrs import cidr_ranges
+from cidre.cidrs.cidr_counter import CidrCounter
+from cidre.cidrs.cidr_store import FsCidrStore
+from cidre.cidrs.rir_fetcher import RirFetcher
+from cidre.firewalls.iptables_firewall import IpTablesFirewall
+from cidre.firewalls.nftables_firewall import NftablesFirewall
+from cidre.firewalls.ufw_firewall import UfwFirewall
+
+RESULTS_VERSION = 1
+
+STUB_BINARIES = ["ipset", "iptables", "ip6tables", "ufw"]
+
+UFW_RULES = (
+    "*filter\n:ufw-user-input - [0:0]\n### RULES ###\n\n### END RULES ###\nCOMMIT\n"
+)
+
+
+class Pipeline:
+    def __init__(self, sources: Dict[str, str], work_dir: Path, countries: int):
+        self.__sources = sources
+        self.__work_dir = work_dir
+        self.__countries = countries
+        self.__runs = 0
+
+        self.cidrs = None
+        self.merged = None
+        self.store = None
+
+    def stages(self) -> List[Tuple[str, Callable[[], Tuple[int, int]]]]:
+        return [
+            ("convert", self.convert),
+            ("merge", self.merge),
+            ("save", self.save),
+            ("resave", self.resave),
+            ("count", self.count),
+            ("firewall_iptables", self.firewall_iptables),
+            ("firewall_ufw", self.firewall_ufw),
+            ("firewall_nftables", self.firewall_nftables),
+        ]
+
+    def convert(self) -> Tuple[int, int]:
+        fetcher = RirFetcher(merge=False, proxy=None)
+        cidrs = collections.defaultdict(lambda: {"ipv4": set(), "ipv6": set()})
+
+        records = 0
+        for registry, source in self.__sources.items():
+            with open(source, "rb") as f:
+                records += sum(1 for _ in f)
+
+            for cc, networks in fetcher.compile(registry, source).items():
+                cidrs[cc]["ipv4"].update(networks["ipv4"])
+                cidrs[cc]["ipv6"].update(networks["ipv6"])
+
+        self.cidrs = cidrs
+
+        return records, self.__total(cidrs)
+
+    def merge(self) -> Tuple[int, int]:
+        self.merged = {
+            cc: {
+                ip_version: cidr_ranges.merge_cidrs(networks[ip_version], ip_version)
+                for ip_version in ["ipv4", "ipv6"]
+            }
+            for cc, networks in self.cidrs.items()
+        }
+
+        return self.__total(self.cidrs), self.__total(self.merged)
+
+    def save(self) -> Tuple[int, int]:
+        self.store = self.__fresh("cidr")
+        FsCidrStore(str(self.store)).save(self.merged)
+
+        return self.__total(self.merged), self.__files(self.store)
+
+    def resave(self) -> Tuple[int, int]:
+        FsCidrStore(str(self.store)).save(self.merged)
+
+        return self.__total(self.merged), self.__files(self.store)
+
+    def count(self) -> Tuple[int, int]:
+        counted = CidrCounter(str(self.store)).count(list(self.merged))
+
+        return self.__files(self.store), len(counted)
+
+    def firewall_iptables(self) -> Tuple[int, int]:
+        (self.__work_dir / "calls.log").unlink(missing_ok=True)
+
+        firewall = IpTablesFirewall(str(self.store))
+        firewall.apply("deny", self.__top_countries())
+
+        return self.__top_cidrs(), self.__stub_calls()
+
+    def firewall_ufw(self) -> Tuple[int, int]:
+        rules = self.__fresh("ufw")
+        for rules_file in ["user.rules", "user6.rules"]:
+            (rules / rules_file).write_text(UFW_RULES)
+
+        firewall = UfwFirewall(str(self.store), bulk=True, rules_folder=str(rules))
+        firewall.apply("deny", self.__top_countries())
+
+        lines = sum(
+            len((rules / rules_file).read_text().splitlines())
+            for rules_file in ["user.rules", "user6.rules"]
+        )
+
+        return self.__top_cidrs(), lines
+
+    def firewall_nftables(self) -> Tuple[int, int]:
+        ruleset = self.__fresh("nft") / "ruleset.nft"
+
+        firewall = NftablesFirewall(str(self.store), dry_run=str(ruleset))
+        firewall.apply("deny", self.__top_countries())
+
+        return self.__top_cidrs(), ruleset.stat().st_size
+
+    def __top_countries(self) -> List[str]:
+        return sorted(
+            self.merged,
+            key=lambda cc: (
+                -len(self.merged[cc]["ipv4"]) - len(self.merged[cc]["ipv6"]),
+                cc,
+            ),
+        )[: self.__countries]
+
+    def __top_cidrs(self) -> int:
+        return sum(
+            len(self.merged[cc][ip_version])
+            for cc in self.__top_countries()
+            for ip_version in ["ipv4", "ipv6"]
+        )
+
+    def __stub_calls(self) -> int:
+        with open(self.__work_dir / "calls.log", "rb") as f:
+            return sum(1 for _ in f)
+
+    def __fresh(self, name: str) -> Path:
+        self.__runs += 1
+        path = self.__work_dir / f"{name}.{self.__runs}"
+        path.mkdir(parents=True)
+
+        return path
+
+    def __files(self, store: Path) -> int:
+        return sum(1 for _ in store.rglob("*.cidr"))
+
+    def __total(self, cidrs: Dict) -> int:
+        return sum(
+            len(networks[ip_version])
+            for networks in cidrs.values()
+            for ip_version in ["ipv4", "ipv6"]
+        )
+
+
+def install_stubs(work_dir: Path):
+    bin_path = work_dir / "bin"
+    bin_path.mkdir()
+
+    log_path = work_dir / "calls.log"
+
+    # Stubs consume their input like the real binaries do, so piping the
+    # generated scripts is part of the measured time.
+    for binary in STUB_BINARIES:
+        stub = bin_path / binary
+        stub.write_text(
+            "#!/bin/sh\n"
+            f'echo "{binary} $*" >> {log_path}\n'
+            'if [ "$1" = "restore" ]; then cat > /dev/null; fi\n'
+        )
+        stub.chmod(stub.stat().st_mode | stat.S_IEXEC)
+
+    os.environ["PATH"] = f"{bin_path}{os.pathsep}{os.environ['PATH']}"
+
+
+def measure(fn: Callable[[], Tuple[int, int]], repeat: int, memory: bool) -> Dict:
+    runs = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        records_in, records_out = fn()
+        runs.append(time.perf_counter() - started)
+
+    result = {
+        "seconds": min(runs),
+        "runs": runs,
+        "records_in": records_in,
+        "records_out": records_out,
+    }
+
+    # Tracing slows allocations down, so memory is measured in a separate run.
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            _, result["peak_bytes"] = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def compare(
+    results: Dict, baseline: Dict, tolerance: float, min_seconds: float
+) -> List[str]:
+    regressions = []
+
+    for name, stage in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            continue
+
+        slower = stage["seconds"] - base["seconds"]
+        if slower > min_seconds and stage["seconds"] > base["seconds"] * (
+            1 + tolerance
+        ):
+            regressions.append(
+                f"{name}: {stage['seconds']:.3f}s vs {base['seconds']:.3f}s baseline"
+            )
+
+        if "peak_bytes" in stage and "peak_bytes" in base:
+            if stage["peak_bytes"] > base["peak_bytes"] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {stage['peak_bytes']} peak bytes vs "
+                    f"{base['peak_bytes']} baseline"
+                )
+
+    return regressions
+
+
+def report(results: Dict, baseline: Dict | None):
+    print(
+        f"{'stage':<20} {'seconds':>9} {'baseline':>9} {'peak MiB':>9} "
+        f"{'in':>9} {'out':>9}",
+        file=sys.stderr,
+    )
+
+    for name, stage in results["stages"].items():
+        base = (baseline or {}).get("stages", {}).get(name)
+        base_seconds = f"{base['seconds']:.3f}" if base else "-"
+        peak = (
+            f"{stage['peak_bytes'] / (1 << 20):.1f}" if "peak_bytes" in stage else "-"
+        )
+
+        print(
+            f"{name:<20} {stage['seconds']:>9.3f} {base_seconds:>9} {peak:>9} "
+            f"{stage['records_in']:>9} {stage['records_out']:>9}",
+            file=sys.stderr,
+        )
+
+    print(f"max RSS: {results['max_rss_bytes'] / (1 << 20):.1f} MiB", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the CIDR pipeline stages on synthetic delegated files."
+    )
+    parser.add_argument("-sc", "--scale", type=float, default=1.0)
+    parser.add_argument("-s", "--seed", type=int, default=42)
+    parser.add_argument("-6", "--ipv6-share", type=float, default=0.25)
+    parser.add_argument("-k", "--skew", type=float, default=1.1)
+    parser.add_argument(
+        "-src",
+        "--sources",
+        help="Folder with delegated-<rir>-extended-latest files to use instead",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument(
+        "-c", "--countries", type=int, default=10, help="Countries to apply rules for"
+    )
+    parser.add_argument("-nm", "--no-memory", action="store_true")
+    parser.add_argument("-o", "--output", help="JSON results file (default: stdout)")
+    parser.add_argument("-b", "--baseline", help="JSON results file to compare with")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2)
+    parser.add_argument("-ms", "--min-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="cidre-bench-"))
+
+    try:
+        install_stubs(work_dir)
+
+        if args.sources:
+            sources = {
+                registry: str(
+                    Path(args.sources) / f"delegated-{registry}-extended-latest"
+                )
+                for registry in synthetic.REGISTRY_RECORDS
+            }
+        else:
+            sources = synthetic.write(
+                str(work_dir / "rir"),
+                args.scale,
+                args.seed,
+                args.ipv6_share,
+                args.skew,
+            )
+
+        pipeline = Pipeline(sources, work_dir, args.countries)
+
+        results = {
+            "version": RESULTS_VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "scale": args.scale,
+                "seed": args.seed,
+                "ipv6_share": args.ipv6_share,
+                "skew": args.skew,
+                "sources": args.sources,
+                "repeat": args.repeat,
+                "countries": args.countries,
+            },
+            "stages": {},
+        }
+
+        for name, stage in pipeline.stages():
+            results["stages"][name] = measure(stage, args.repeat, not args.no_memory)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Linux reports the peak resident set size in KiB.
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if baseline is None:
+        return
+
+    regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
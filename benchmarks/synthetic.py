@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import random
+import argparse
+import ipaddress
+import itertools
+
+from pathlib import Path
+from typing import Dict, List
+
+# Records per registry at scale 1, roughly the size of the real delegated files.
+REGISTRY_RECORDS = {
+    "afrinic": 8_000,
+    "apnic": 60_000,
+    "arin": 70_000,
+    "lacnic": 30_000,
+    "ripencc": 130_000,
+}
+
+REGISTRY_COUNTRIES = {
+    "afrinic": "ZA EG NG KE MA TN DZ GH TZ UG CI SN CM AO MU ZW ET SD LY RW",
+    "apnic": "CN JP KR AU IN ID VN TW HK TH SG MY PH NZ PK BD KH LK NP MN",
+    "arin": "US CA PR JM BS BB VI AG KY BM DM GD KN LC VC TC AI MS UM VG",
+    "lacnic": "BR MX AR CO CL PE EC VE UY BO PY CR PA GT DO HN SV NI CU HT",
+    "ripencc": "DE GB RU FR NL IT ES SE PL UA TR CH IR RO CZ NO AT DK FI BE",
+}
+
+IPV4_COUNTS = [256, 512, 768, 1024, 2048, 2560, 4096, 8192, 16384, 65536]
+
+# Delegated files put the prefix length into the value of IPv6 records.
+IPV6_VALUES = [29, 32, 36, 40, 44, 48]
+
+STATUSES = ["allocated", "assigned"]
+
+
+def generate(
+    registry: str,
+    records: int,
+    seed: int,
+    ipv6_share: float = 0.25,
+    asn_share: float = 0.2,
+    skew: float = 1.1,
+    contiguity: float = 0.3,
+) -> List[str]:
+    rng = random.Random(f"{seed}:{registry}")
+    countries = REGISTRY_COUNTRIES[registry].split()
+
+    # Zipf-like weights, so a few countries hold most of the records.
+    cum_weights = list(
+        itertools.accumulate(1 / (rank + 1) ** skew for rank in range(len(countries)))
+    )
+
+    lines = [
+        f"2|{registry}|20250101|{records}|19830705|20250101|+0000",
+        f"{registry}|*|asn|*|0|summary",
+        f"{registry}|*|ipv4|*|0|summary",
+        f"{registry}|*|ipv6|*|0|summary",
+    ]
+
+    # Last allocation end per country and family, extended to get adjacent ranges.
+    cursors = {}
+
+    for _ in range(records):
+        cc = rng.choices(countries, cum_weights=cum_weights)[0]
+        status = rng.choice(STATUSES)
+        date = f"20{rng.randrange(0, 25):02d}0101"
+        kind = rng.random()
+
+        if kind < asn_share:
+            asn = rng.randrange(1, 400_000)
+            lines.append(f"{registry}|{cc}|asn|{asn}|1|{date}|{status}|x")
+            continue
+
+        if kind < asn_share + ipv6_share:
+            ip_version = "ipv6"
+            value = rng.choice(IPV6_VALUES)
+            start = (0x2000 << 112) | (rng.getrandbits(32) << 80)
+        else:
+            ip_version = "ipv4"
+            value = rng.choice(IPV4_COUNTS)
+            start = rng.randrange(1 << 24) << 8
+            value = min(value, (1 << 32) - start)
+
+        cursor = cursors.get((cc, ip_version))
+        if cursor is not None and rng.random() < contiguity:
+            start = cursor
+
+        if ip_version == "ipv4" and start + value > 1 << 32:
+            continue
+
+        cursors[(cc, ip_version)] = start + value
+
+        lines.append(
+            f"{registry}|{cc}|{ip_version}|{ipaddress.ip_address(start)}|{value}|{date}|{status}|x"
+        )
+
+    # Unassigned space is listed as well and has to be skipped by the parser.
+    for _ in range(records // 50):
+        start = ipaddress.IPv4Address(rng.randrange(1 << 24) << 8)
+        lines.append(f"{registry}||ipv4|{start}|256||available|")
+
+    return lines
+
+
+def write(
+    folder: str,
+    scale: float = 1.0,
+    seed: int = 42,
+    ipv6_share: float = 0.25,
+    skew: float = 1.1,
+) -> Dict[str, str]:
+    path = Path(folder)
+    path.mkdir(parents=True, exist_ok=True)
+
+    sources = {}
+    for registry, records in REGISTRY_RECORDS.items():
+        lines = generate(
+            registry,
+            max(1, int(records * scale)),
+            seed,
+            ipv6_share=ipv6_share,
+            skew=skew,
+        )
+
+        source = path / f"delegated-{registry}-extended-latest"
+        source.write_text("\n".join(lines) + "\n")
+        sources[registry] = str(source)
+
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generates synthetic delegated-*-extended files."
+    )
+    parser.add_argument("folder", help="Folder to write the delegated files to")
+    parser.add_argument("-sc", "--scale", type=float, default=1.0)
+    parser.add_argument("-s", "--seed", type=int, default=42)
+    parser.add_argument("-6", "--ipv6-share", type=float, default=0.25)
+    parser.add_argument("-k", "--skew", type=float, default=1.1)
+    args = parser.parse_args()
+
+    for registry, source in write(
+        args.folder, args.scale, args.seed, args.ipv6_share, args.skew
+    ).items():
+        print(f"{registry}: {source}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,24 @@
 from .cidrs.rir_fetcher import RirFetcher
 from .cidrs.cidr_counter import CidrCounter
+from .cidrs.cidr_lookup import CidrLookup
+from .cidrs.cidr_database import CidrDatabase
 
 # Backward compatibility
-from .cidrs import rir_fetcher, cidr_store, cidr_counter
-from .firewalls import ufw_firewall, iptables_firewall
+from .cidrs import (
+    rir_fetcher,
+    rir_cache,
+    cidr_store,
+    cidr_counter,
+    cidr_lookup,
+    cidr_classifier,
+    cidr_server,
+    cidr_manifest,
+    cidr_aggregator,
+    cidr_complement,
+    cidr_ranges,
+    cidr_stats,
+    rir_sources,
+    cidr_history,
+    cidr_database,
+)
+from .firewalls import ufw_firewall, iptables_firewall, nftables_firewall
@@ -0,0 +1,108 @@
+import heapq
+import bisect
+
+from typing import Iterable, List, Tuple
+
+from . import cidr_ranges
+
+
+def aggregate_cidrs(
+    cidrs: Iterable[Tuple[int, int]],
+    ip_version: str,
+    max_cidrs: int | None = None,
+    max_overcoverage: float | None = None,
+) -> Tuple[List[Tuple[int, int]], int]:
+    bits = cidr_ranges.IP_BITS[ip_version]
+    merged = cidr_ranges.merge_cidrs(cidrs, ip_version)
+
+    if max_cidrs is None and max_overcoverage is None:
+        return merged, 0
+
+    starts = [start for start, _ in merged]
+    prefixlens = [prefixlen for _, prefixlen in merged]
+
+    # Addresses covered by the first k CIDRs.
+    covered = [0]
+    for prefixlen in prefixlens:
+        covered.append(covered[-1] + (1 << (bits - prefixlen)))
+
+    budget = None if max_overcoverage is None else int(covered[-1] * max_overcoverage)
+    target = 1 if max_cidrs is None else max(1, max_cidrs)
+
+    # Each pair of neighbours has its smallest common supernet. These supernets
+    # are the inner nodes of the binary trie over the CIDRs, node t spanning
+    # CIDRs [first, last) and splitting them after CIDR t.
+    nodes = []
+    by_span = {}
+    for t in range(len(merged) - 1):
+        prefixlen = min(
+            prefixlens[t],
+            prefixlens[t + 1],
+            bits - (starts[t] ^ starts[t + 1]).bit_length(),
+        )
+        size = 1 << (bits - prefixlen)
+        start = starts[t] >> (bits - prefixlen) << (bits - prefixlen)
+
+        first = bisect.bisect_left(starts, start, 0, t)
+        last = bisect.bisect_left(starts, start + size, t + 1)
+
+        nodes.append(
+            (start, prefixlen, first, last, size - covered[last] + covered[first])
+        )
+        by_span[(first, last)] = t
+
+    parents = [-1] * len(nodes)
+    pending = [0] * len(nodes)
+    added = []
+    for t, (_, _, first, last, foreign) in enumerate(nodes):
+        cost = foreign
+
+        for span in [(first, t + 1), (t + 1, last)]:
+            child = by_span.get(span)
+            if child is not None:
+                parents[child] = t
+                pending[t] += 1
+                cost -= nodes[child][4]
+
+        added.append(cost)
+
+    # A supernet is merged once both of its halves are single CIDRs, picking
+    # the one adding the fewest foreign addresses first.
+    heap = [(added[t], -nodes[t][1], t) for t in range(len(nodes)) if not pending[t]]
+    heapq.heapify(heap)
+
+    count, extra = len(merged), 0
+    chosen = [False] * len(nodes)
+
+    while heap and count > target:
+        cost, _, t = heapq.heappop(heap)
+
+        if budget is not None and extra + cost > budget:
+            break
+
+        chosen[t] = True
+        extra += cost
+        count -= 1
+
+        parent = parents[t]
+        if parent != -1:
+            pending[parent] -= 1
+            if not pending[parent]:
+                heapq.heappush(heap, (added[parent], -nodes[parent][1], parent))
+
+    aggregated = []
+    supernets = sorted(
+        (nodes[t][2], nodes[t][0], nodes[t][1], nodes[t][3])
+        for t in range(len(nodes))
+        if chosen[t] and (parents[t] == -1 or not chosen[parents[t]])
+    )
+
+    i = 0
+    for first, start, prefixlen, last in supernets:
+        aggregated.extend(zip(starts[i:first], prefixlens[i:first]))
+        aggregated.append((start, prefixlen))
+        i = last
+
+    aggregated.extend(zip(starts[i:], prefixlens[i:]))
+
+    return aggregated, extra
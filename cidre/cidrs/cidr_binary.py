@@ -0,0 +1,255 @@
+import os
+import logging
+import sys
+import mmap
+import array
+import struct
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from . import cidr_ranges, cidr_manifest
+
+MAGIC = b"CIDREBIN"
+VERSION = 2
+
+# magic, version, countries, ipv4 ranges, ipv6 ranges, manifest fingerprint
+HEADER = struct.Struct("<8sIIQQ32s")
+
+# country code, ipv4 offset, ipv4 count, ipv6 offset, ipv6 count
+INDEX_ENTRY = struct.Struct("<2s6xQQQQ")
+
+FILENAME = "cidrs.bin"
+
+
+def _align(offset: int) -> int:
+    return (offset + 15) & ~15
+
+
+def _layout(countries: int, ipv4: int, ipv6: int) -> Dict[str, int]:
+    index = HEADER.size
+    ipv4_starts = _align(index + INDEX_ENTRY.size * countries)
+    ipv4_ends = _align(ipv4_starts + 4 * ipv4)
+    ipv6_starts = _align(ipv4_ends + 4 * ipv4)
+    ipv6_ends = ipv6_starts + 16 * ipv6
+
+    return {
+        "index": index,
+        "ipv4_starts": ipv4_starts,
+        "ipv4_ends": ipv4_ends,
+        "ipv6_starts": ipv6_starts,
+        "ipv6_ends": ipv6_ends,
+        "size": ipv6_ends + 16 * ipv6,
+    }
+
+
+def _little_endian(values: array.array) -> bytes:
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+
+    return values.tobytes()
+
+
+def render(
+    cidrs: Dict[str, Dict[str, Iterable[Tuple[int, int]]]],
+    fingerprint: bytes = bytes(32),
+) -> bytes:
+    index = []
+    ipv4_starts, ipv4_ends = array.array("I"), array.array("I")
+    ipv6_starts, ipv6_ends = array.array("Q"), array.array("Q")
+
+    for cc, networks in sorted(cidrs.items()):
+        ipv4 = cidr_ranges.cidrs_to_intervals(networks["ipv4"], "ipv4")
+        ipv6 = cidr_ranges.cidrs_to_intervals(networks["ipv6"], "ipv6")
+
+        index.append(
+            (cc.upper(), len(ipv4_starts), len(ipv4), len(ipv6_starts) // 2, len(ipv6))
+        )
+
+        for start, stop in ipv4:
+            ipv4_starts.append(start)
+            ipv4_ends.append(stop - 1)
+
+        # IPv6 addresses are stored as (high, low) pairs of 64-bit words.
+        for start, stop in ipv6:
+            ipv6_starts.extend((start >> 64, start & 0xFFFFFFFFFFFFFFFF))
+            ipv6_ends.extend(((stop - 1) >> 64, (stop - 1) & 0xFFFFFFFFFFFFFFFF))
+
+    ipv4_count, ipv6_count = len(ipv4_starts), len(ipv6_starts) // 2
+    layout = _layout(len(index), ipv4_count, ipv6_count)
+
+    buffer = bytearray(layout["size"])
+    HEADER.pack_into(
+        buffer, 0, MAGIC, VERSION, len(index), ipv4_count, ipv6_count, fingerprint
+    )
+
+    for i, (cc, ipv4_offset, ipv4_len, ipv6_offset, ipv6_len) in enumerate(index):
+        INDEX_ENTRY.pack_into(
+            buffer,
+            layout["index"] + i * INDEX_ENTRY.size,
+            cc.encode("ascii"),
+            ipv4_offset,
+            ipv4_len,
+            ipv6_offset,
+            ipv6_len,
+        )
+
+    for name, values in [
+        ("ipv4_starts", ipv4_starts),
+        ("ipv4_ends", ipv4_ends),
+        ("ipv6_starts", ipv6_starts),
+        ("ipv6_ends", ipv6_ends),
+    ]:
+        data = _little_endian(values)
+        buffer[layout[name] : layout[name] + len(data)] = data
+
+    return bytes(buffer)
+
+
+def write(
+    path: str,
+    cidrs: Dict[str, Dict[str, Iterable[Tuple[int, int]]]],
+    fingerprint: bytes = bytes(32),
+):
+    path = Path(path)
+    staging = path.with_name(f".{path.name}.tmp")
+    with open(staging, "wb") as f:
+        f.write(render(cidrs, fingerprint))
+
+    os.replace(staging, path)
+
+
+def open_fresh(base_folder: str) -> "CidrBinaryReader | None":
+    logger = logging.getLogger(__name__)
+    binary_file = Path(base_folder) / FILENAME
+
+    if not binary_file.exists():
+        return None
+
+    try:
+        reader = CidrBinaryReader(str(binary_file))
+    except ValueError:
+        logger.warning(f"Ignoring unsupported {binary_file}, reading CIDR files.")
+        return None
+
+    # Hand-edited or replaced CIDR files no longer match the binary.
+    if reader.fingerprint != cidr_manifest.FsCidrManifest(base_folder).fingerprint():
+        reader.close()
+        logger.warning(f"Ignoring stale {binary_file}, reading CIDR files.")
+        return None
+
+    return reader
+
+
+class CidrBinaryReader:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.__views = []
+
+        # Headers of older versions are shorter.
+        if len(self.__mmap) < HEADER.size:
+            self.close()
+            raise ValueError(f"Unsupported CIDR binary file: {path}")
+
+        magic, version, countries, ipv4_count, ipv6_count, fingerprint = (
+            HEADER.unpack_from(self.__mmap, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported CIDR binary file: {path}")
+
+        self.fingerprint = fingerprint
+
+        layout = _layout(countries, ipv4_count, ipv6_count)
+        if len(self.__mmap) < layout["size"]:
+            self.close()
+            raise ValueError(f"Truncated CIDR binary file: {path}")
+
+        self.__index = {}
+        for i in range(countries):
+            cc, ipv4_offset, ipv4_len, ipv6_offset, ipv6_len = INDEX_ENTRY.unpack_from(
+                self.__mmap, layout["index"] + i * INDEX_ENTRY.size
+            )
+            self.__index[cc.decode("ascii").rstrip("\0")] = {
+                "ipv4": (ipv4_offset, ipv4_len),
+                "ipv6": (ipv6_offset, ipv6_len),
+            }
+
+        view = memoryview(self.__mmap)
+        self.__views.append(view)
+        self.__arrays = {
+            "ipv4_starts": self.__cast(view, layout["ipv4_starts"], ipv4_count, "I"),
+            "ipv4_ends": self.__cast(view, layout["ipv4_ends"], ipv4_count, "I"),
+            "ipv6_starts": self.__cast(
+                view, layout["ipv6_starts"], ipv6_count * 2, "Q"
+            ),
+            "ipv6_ends": self.__cast(view, layout["ipv6_ends"], ipv6_count * 2, "Q"),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        for view in reversed(self.__views):
+            view.release()
+
+        self.__views = []
+        self.__mmap.close()
+
+    def countries(self) -> List[str]:
+        return list(self.__index)
+
+    def __contains__(self, country_code: str) -> bool:
+        return country_code.upper() in self.__index
+
+    def size(self, country_code: str, ip_version: str) -> int:
+        entry = self.__index.get(country_code.upper())
+
+        return entry[ip_version][1] if entry else 0
+
+    def ranges(self, country_code: str, ip_version: str) -> Iterator[Tuple[int, int]]:
+        entry = self.__index.get(country_code.upper())
+        if entry is None:
+            return
+
+        offset, length = entry[ip_version]
+        starts = self.__arrays[f"{ip_version}_starts"]
+        ends = self.__arrays[f"{ip_version}_ends"]
+
+        if ip_version == "ipv4":
+            for i in range(offset, offset + length):
+                yield starts[i], ends[i]
+            return
+
+        for i in range(2 * offset, 2 * (offset + length), 2):
+            yield (starts[i] << 64) | starts[i + 1], (ends[i] << 64) | ends[i + 1]
+
+    def starts(self, ip_version: str):
+        return self.__arrays[f"{ip_version}_starts"]
+
+    def ends(self, ip_version: str):
+        return self.__arrays[f"{ip_version}_ends"]
+
+    def offsets(self, country_code: str, ip_version: str) -> Tuple[int, int]:
+        return self.__index[country_code.upper()][ip_version]
+
+    def __cast(self, view: memoryview, offset: int, length: int, typecode: str):
+        itemsize = struct.calcsize(typecode)
+        raw = view[offset : offset + length * itemsize]
+
+        if sys.byteorder == "big":
+            values = array.array(typecode, raw.tobytes())
+            values.byteswap()
+            raw.release()
+            return values
+
+        values = raw.cast(typecode)
+        self.__views.extend([raw, values])
+
+        return values
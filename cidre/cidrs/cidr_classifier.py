@@ -0,0 +1,169 @@
+import sys
+import time
+import socket
+import logging
+import functools
+import itertools
+
+from typing import Iterable, Iterator, List, Set, Tuple
+
+from .cidr_lookup import CidrLookup
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BATCH_SIZE = 65536
+
+IP_PACKED_FAMILIES = {"ipv4": socket.AF_INET, "ipv6": socket.AF_INET6}
+
+# Packed IPv4 addresses are read as big-endian 32-bit integers, IPv6 ones as
+# 16-byte strings whose bytewise order matches the numeric one.
+IP_DTYPES = {"ipv4": ">u4", "ipv6": "S16"}
+
+
+class CidrClassifier:
+    def __init__(
+        self,
+        index: CidrLookup,
+        batch_size: int = BATCH_SIZE,
+        vectorized: bool | None = None,
+    ):
+        self.__index = index
+        self.__batch_size = batch_size
+        self.__vectorized = numpy is not None if vectorized is None else vectorized
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__tables = (
+            {ip_version: self.__table(ip_version) for ip_version in IP_DTYPES}
+            if self.__vectorized
+            else {}
+        )
+        self.stats = {"ipv4": 0, "ipv6": 0, "malformed": 0, "seconds": 0.0}
+
+    def classify(self, lines: Iterable[str]) -> Iterator[Tuple[str, str | None]]:
+        self.stats = {"ipv4": 0, "ipv6": 0, "malformed": 0, "seconds": 0.0}
+
+        lines = iter(lines)
+        while batch := list(itertools.islice(lines, self.__batch_size)):
+            yield from self.__classify_batch(batch)
+
+        total = self.stats["ipv4"] + self.stats["ipv6"]
+        seconds = self.stats["seconds"]
+        rate = total / seconds / 1_000_000 if seconds else 0.0
+
+        self.__logger.info(
+            f"Classified {self.stats['ipv4']} IPv4 and {self.stats['ipv6']} IPv6 addresses "
+            f"({self.stats['malformed']} malformed lines) at {rate:.2f}M addresses/s."
+        )
+
+    def __classify_batch(self, lines: List[str]) -> List[Tuple[str, str | None]]:
+        started = time.perf_counter()
+
+        # Log lines start with the client address, plain lists are one per line.
+        ips = [
+            fields[0] for fields in (line.split(None, 1) for line in lines) if fields
+        ]
+
+        families = {
+            "ipv4": [ip for ip in ips if ":" not in ip],
+            "ipv6": [ip for ip in ips if ":" in ip],
+        }
+
+        malformed = set()
+        packed = {}
+        for ip_version, family_ips in families.items():
+            packed[ip_version], invalid = self.__pack(ip_version, family_ips)
+            malformed.update(invalid)
+
+        if malformed:
+            self.stats["malformed"] += sum(ip in malformed for ip in ips)
+            ips = [ip for ip in ips if ip not in malformed]
+
+        ipv4 = self.__resolve("ipv4", packed["ipv4"])
+        ipv6 = self.__resolve("ipv6", packed["ipv6"])
+
+        if ipv4 and ipv6:
+            ipv4, ipv6 = iter(ipv4), iter(ipv6)
+            rows = [(ip, next(ipv6) if ":" in ip else next(ipv4)) for ip in ips]
+        else:
+            rows = list(zip(ips, ipv4 or ipv6))
+
+        self.stats["ipv4"] += len(packed["ipv4"])
+        self.stats["ipv6"] += len(packed["ipv6"])
+        self.stats["seconds"] += time.perf_counter() - started
+
+        return rows
+
+    def __pack(self, ip_version: str, ips: List[str]) -> Tuple[List[bytes], Set[str]]:
+        pack = functools.partial(socket.inet_pton, IP_PACKED_FAMILIES[ip_version])
+
+        try:
+            return list(map(pack, ips)), set()
+        except OSError:
+            pass
+
+        # Slow path for the rare batch with malformed lines in it.
+        packed, malformed = [], set()
+        for ip in ips:
+            try:
+                packed.append(pack(ip))
+            except OSError:
+                malformed.add(ip)
+
+        return packed, malformed
+
+    def __resolve(self, ip_version: str, packed: List[bytes]) -> List[str | None]:
+        if not packed:
+            return []
+
+        if not self.__vectorized:
+            return [
+                self.__index.lookup_int(int.from_bytes(ip, "big"), ip_version)
+                for ip in packed
+            ]
+
+        starts, ends, countries = self.__tables[ip_version]
+        if not len(starts):
+            return [None] * len(packed)
+
+        ips = numpy.frombuffer(b"".join(packed), dtype=IP_DTYPES[ip_version]).astype(
+            starts.dtype
+        )
+
+        positions = numpy.searchsorted(starts, ips, side="right") - 1
+        candidates = numpy.maximum(positions, 0)
+        found = (positions >= 0) & (ips <= ends[candidates])
+
+        # The trailing None stands for addresses outside of any range.
+        return countries[numpy.where(found, candidates, -1)].tolist()
+
+    def __table(self, ip_version: str) -> Tuple:
+        starts, ends, countries = self.__index.table(ip_version)
+
+        if ip_version == "ipv4":
+            return (
+                numpy.array(starts, dtype=numpy.uint32),
+                numpy.array(ends, dtype=numpy.uint32),
+                numpy.array(countries + [None], dtype=object),
+            )
+
+        return (
+            numpy.array([start.to_bytes(16, "big") for start in starts], dtype="S16"),
+            numpy.array([end.to_bytes(16, "big") for end in ends], dtype="S16"),
+            numpy.array(countries + [None], dtype=object),
+        )
+
+
+def read_lines(paths: List[str]) -> Iterator[str]:
+    if not paths:
+        yield from sys.stdin
+        return
+
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin
+            continue
+
+        with open(path, "r", errors="replace") as f:
+            yield from f
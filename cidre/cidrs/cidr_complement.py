@@ -0,0 +1,56 @@
+import logging
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from . import cidr_ranges
+
+
+class CidrComplement:
+    def __init__(self, base_folder: str):
+        self.__base_folder = base_folder
+        self.__logger = logging.getLogger(self.__class__.__name__)
+
+    def compile(
+        self, country_codes: List[str]
+    ) -> Dict[str, Dict[str, List[Tuple[int, int]]]] | None:
+        allow = {"ipv4": [], "ipv6": []}
+
+        for country_code in country_codes:
+            for ip_version in ["ipv4", "ipv6"]:
+                cidr_file = (
+                    Path(self.__base_folder)
+                    / ip_version
+                    / f"{country_code.lower()}.cidr"
+                )
+
+                if not cidr_file.exists():
+                    self.__logger.error(
+                        f"CIDR file not found for {country_code.upper()} in {ip_version}."
+                    )
+                    self.__logger.error("You can pull it with: `cidre pull --merge`")
+                    return None
+
+                with open(cidr_file, "r") as f:
+                    allow[ip_version].extend(
+                        cidr_ranges.parse_cidr(line.strip(), ip_version)
+                        for line in f
+                        if line.strip()
+                    )
+
+        compiled = {"allow": {}, "drop": {}}
+        for ip_version in ["ipv4", "ipv6"]:
+            compiled["allow"][ip_version] = cidr_ranges.merge_cidrs(
+                allow[ip_version], ip_version
+            )
+            compiled["drop"][ip_version] = cidr_ranges.complement_cidrs(
+                compiled["allow"][ip_version], ip_version
+            )
+
+            self.__logger.info(
+                f"Compiled {len(compiled['allow'][ip_version])} allowed and "
+                f"{len(compiled['drop'][ip_version])} dropped {ip_version} CIDRs "
+                f"for {', '.join(country_codes)}."
+            )
+
+        return compiled
@@ -1,18 +1,47 @@
 import logging
-import ipaddress
 
 from pathlib import Path
 from typing import List, Dict
-from collections import defaultdict
+
+from . import cidr_manifest, cidr_stats
 
 
 class CidrCounter:
-    def __init__(self, base_folder: str):
+    def __init__(self, base_folder: str, stats: cidr_stats.CidrStats | None = None):
         self.__base_folder = base_folder
+        self.__stats = stats if stats is not None else cidr_stats.CidrStats()
         self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__manifest = cidr_manifest.FsCidrManifest(base_folder)
 
     def count(self, country_codes: List[str]) -> Dict[str, Dict[str, int]]:
-        total = defaultdict(int)
+        total = {}
+
+        with self.__stats.stage("count") as stage:
+            for country_code, entries in self.entries(country_codes).items():
+                total[country_code] = {
+                    ip_version: entry["addresses"]
+                    for ip_version, entry in entries.items()
+                }
+
+                stage.add(records_in=len(entries), records_out=1)
+
+        if not total:
+            joined_countries = ",".join(country_codes)
+            self.__logger.error(f"Error: CIDR files not found for {joined_countries}.")
+            self.__logger.error("You can pull it with: `cidre pull --merge`")
+            return {}
+
+        return dict(
+            sorted(
+                total.items(),
+                key=lambda item: (-item[1].get("ipv4", 0), -item[1].get("ipv6", 0)),
+            )
+        )
+
+    def entries(self, country_codes: List[str]) -> Dict[str, Dict[str, Dict]]:
+        manifest = self.__manifest.load()
+        entries = {}
+        stale = 0
 
         for country_code in country_codes:
             for ip_version in ["ipv4", "ipv6"]:
@@ -25,19 +54,23 @@ class CidrCounter:
                 if not Path.exists(cidr_file):
                     continue
 
-                with open(cidr_file, "r") as f:
-                    cidr_blocks = [
-                        line.strip() for line in f.readlines() if line.strip()
-                    ]
+                entry = manifest.get(country_code.upper(), {}).get(ip_version)
 
-                for cidr in cidr_blocks:
-                    count = ipaddress.ip_network(cidr).num_addresses
-                    total[country_code] += count
+                if entry is None or not self.__manifest.is_fresh(entry, cidr_file):
+                    entry = self.__manifest.entry(cidr_file, ip_version)
+                    manifest.setdefault(country_code.upper(), {})[ip_version] = entry
+                    stale += 1
 
-        if not total:
-            joined_countries = ",".join(country_codes)
-            self.__logger.error(f"Error: CIDR files not found for {joined_countries}.")
-            self.__logger.error("You can pull it with: `cidre pull --merge`")
-            return {}
+                entries.setdefault(country_code.upper(), {})[ip_version] = entry
+
+        if stale:
+            self.__logger.info(
+                f"Recounted {stale} CIDR files missing from or stale in the manifest."
+            )
+
+            try:
+                self.__manifest.save(manifest)
+            except OSError:
+                self.__logger.warning("Could not update the CIDR manifest.")
 
-        return dict(sorted(total.items(), key=lambda item: -item[1]))
+        return entries
@@ -0,0 +1,343 @@
+import array
+import bisect
+import logging
+import threading
+import collections
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from . import cidr_ranges, cidr_binary, cidr_lookup
+
+WORD_MASK = 0xFFFFFFFFFFFFFFFF
+
+# IPv4 bounds fit 32-bit words, IPv6 bounds are stored as (high, low) 64-bit words.
+TYPECODES = {"ipv4": "I", "ipv6": "Q"}
+WORDS = {"ipv4": 1, "ipv6": 2}
+
+
+def ip_version_of(ip: str) -> str:
+    return "ipv6" if ":" in ip else "ipv4"
+
+
+def pack(values: Iterable[int], ip_version: str) -> array.array:
+    packed = array.array(TYPECODES[ip_version])
+
+    for value in values:
+        if ip_version == "ipv4":
+            packed.append(value)
+        else:
+            packed.extend((value >> 64, value & WORD_MASK))
+
+    return packed
+
+
+class CidrRanges:
+    __slots__ = ("ip_version", "__starts", "__ends")
+
+    def __init__(self, ip_version: str, starts: array.array, ends: array.array):
+        if ip_version not in TYPECODES:
+            raise ValueError(f"Unknown IP version: {ip_version}")
+
+        self.ip_version = ip_version
+        self.__starts = starts
+        self.__ends = ends
+
+    @classmethod
+    def from_intervals(
+        cls, intervals: Iterable[Tuple[int, int]], ip_version: str
+    ) -> "CidrRanges":
+        merged = cidr_ranges.merge_intervals(intervals)
+
+        # Ends are inclusive, so the last IPv4 address still fits 32 bits.
+        return cls(
+            ip_version,
+            pack((start for start, _ in merged), ip_version),
+            pack((stop - 1 for _, stop in merged), ip_version),
+        )
+
+    @classmethod
+    def from_cidrs(cls, cidrs: Iterable[str], ip_version: str) -> "CidrRanges":
+        return cls.from_intervals(
+            cidr_ranges.cidrs_to_intervals(
+                (cidr_ranges.parse_cidr(cidr, ip_version) for cidr in cidrs),
+                ip_version,
+            ),
+            ip_version,
+        )
+
+    def __len__(self) -> int:
+        return len(self.__starts) // WORDS[self.ip_version]
+
+    def __bool__(self) -> bool:
+        return len(self.__starts) > 0
+
+    def __iter__(self) -> Iterator[str]:
+        for start, prefixlen in self.cidrs():
+            yield cidr_ranges.format_cidr(start, prefixlen, self.ip_version)
+
+    def __contains__(self, ip: str | int) -> bool:
+        if isinstance(ip, str):
+            if ip_version_of(ip) != self.ip_version:
+                return False
+
+            ip = cidr_ranges.parse_ip(ip, self.ip_version)
+
+        return self.index(ip) is not None
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CidrRanges):
+            return NotImplemented
+
+        return (
+            self.ip_version == other.ip_version
+            and self.__starts == other.__starts
+            and self.__ends == other.__ends
+        )
+
+    def __repr__(self) -> str:
+        return f"CidrRanges({self.ip_version}, {len(self)} ranges)"
+
+    def index(self, ip: int) -> int | None:
+        i = self.__bisect(ip) - 1
+
+        if i >= 0 and ip <= self.__at(self.__ends, i):
+            return i
+
+        return None
+
+    def intervals(self) -> Iterator[Tuple[int, int]]:
+        for i in range(len(self)):
+            yield self.__at(self.__starts, i), self.__at(self.__ends, i) + 1
+
+    def cidrs(self) -> List[Tuple[int, int]]:
+        return cidr_ranges.intervals_to_cidrs(self.intervals(), self.ip_version)
+
+    def addresses(self) -> int:
+        return sum(stop - start for start, stop in self.intervals())
+
+    def nbytes(self) -> int:
+        return (len(self.__starts) + len(self.__ends)) * self.__starts.itemsize
+
+    def union(self, other: "CidrRanges") -> "CidrRanges":
+        self.__check(other)
+
+        return CidrRanges.from_intervals(
+            list(self.intervals()) + list(other.intervals()), self.ip_version
+        )
+
+    def difference(self, other: "CidrRanges") -> "CidrRanges":
+        self.__check(other)
+
+        return CidrRanges.from_intervals(
+            cidr_ranges.subtract_intervals(self.intervals(), other.intervals()),
+            self.ip_version,
+        )
+
+    def intersection(self, other: "CidrRanges") -> "CidrRanges":
+        return self.difference(self.difference(other))
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    def __check(self, other: "CidrRanges"):
+        if not isinstance(other, CidrRanges) or other.ip_version != self.ip_version:
+            raise ValueError(f"Expected {self.ip_version} ranges, got {other!r}.")
+
+    def __at(self, values: array.array, i: int) -> int:
+        if self.ip_version == "ipv4":
+            return values[i]
+
+        return (values[2 * i] << 64) | values[2 * i + 1]
+
+    def __bisect(self, ip: int) -> int:
+        if self.ip_version == "ipv4":
+            return bisect.bisect_right(self.__starts, ip)
+
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if ip < self.__at(self.__starts, middle):
+                high = middle
+            else:
+                low = middle + 1
+
+        return low
+
+
+class CidrDatabase:
+    def __init__(self, base_folder: str, max_countries: int | None = None):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__base_path = Path(base_folder)
+        self.__max_countries = max_countries
+        self.__loaded: Dict[str, Dict[str, CidrRanges]] = collections.OrderedDict()
+        self.__table: Dict[str, Tuple] | None = None
+        self.__lock = threading.RLock()
+
+        self.__reader = cidr_binary.open_fresh(base_folder)
+
+        if self.__reader is None and not self.__base_path.is_dir():
+            raise FileNotFoundError(f"CIDR store {base_folder} not found.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        with self.__lock:
+            self.__loaded.clear()
+            self.__table = None
+
+            if self.__reader is not None:
+                self.__reader.close()
+                self.__reader = None
+
+    def countries(self) -> List[str]:
+        if self.__reader is not None:
+            return sorted(self.__reader.countries())
+
+        return sorted(
+            {
+                cidr_file.name[: -len(".cidr")].upper()
+                for ip_version in ["ipv4", "ipv6"]
+                for cidr_file in (self.__base_path / ip_version).glob("*.cidr")
+            }
+        )
+
+    def loaded(self) -> List[str]:
+        with self.__lock:
+            return list(self.__loaded)
+
+    def ranges(self, country_code: str, ip_version: str) -> CidrRanges:
+        if ip_version not in TYPECODES:
+            raise ValueError(f"Unknown IP version: {ip_version}")
+
+        return self.__country(country_code.upper())[ip_version]
+
+    def count(self, country_code: str) -> Dict[str, int]:
+        country = self.__country(country_code.upper())
+
+        return {
+            ip_version: ranges.addresses() for ip_version, ranges in country.items()
+        }
+
+    def union(self, country_codes: List[str], ip_version: str) -> CidrRanges:
+        union = CidrRanges.from_intervals([], ip_version)
+
+        for country_code in country_codes:
+            union = union | self.ranges(country_code, ip_version)
+
+        return union
+
+    def contains(self, ip: str, country_codes: List[str] | None = None) -> bool:
+        if country_codes is None:
+            return self.country_of(ip) is not None
+
+        ip_version = ip_version_of(ip)
+        value = cidr_ranges.parse_ip(ip, ip_version)
+
+        return any(
+            value in self.ranges(country_code, ip_version)
+            for country_code in country_codes
+        )
+
+    def country_of(self, ip: str) -> str | None:
+        ip_version = ip_version_of(ip)
+        value = cidr_ranges.parse_ip(ip, ip_version)
+
+        ranges, indexes, countries = self.__lookup_table()[ip_version]
+
+        i = ranges.index(value)
+
+        return countries[indexes[i]] if i is not None else None
+
+    def __country(self, country_code: str) -> Dict[str, CidrRanges]:
+        with self.__lock:
+            country = self.__loaded.get(country_code)
+
+            if country is not None:
+                self.__loaded.move_to_end(country_code)
+                return country
+
+            country = self.__load(country_code)
+            self.__loaded[country_code] = country
+
+            # Least recently used countries are dropped first.
+            while self.__max_countries and len(self.__loaded) > self.__max_countries:
+                evicted, _ = self.__loaded.popitem(last=False)
+                self.__logger.debug(f"Evicted {evicted} CIDRs from memory.")
+
+            return country
+
+    def __load(self, country_code: str) -> Dict[str, CidrRanges]:
+        if self.__reader is not None:
+            if country_code not in self.__reader:
+                raise KeyError(f"No CIDRs found for {country_code}.")
+
+            country = {
+                ip_version: CidrRanges.from_intervals(
+                    (
+                        (start, end + 1)
+                        for start, end in self.__reader.ranges(country_code, ip_version)
+                    ),
+                    ip_version,
+                )
+                for ip_version in ["ipv4", "ipv6"]
+            }
+        else:
+            cidr_files = {
+                ip_version: self.__base_path
+                / ip_version
+                / f"{country_code.lower()}.cidr"
+                for ip_version in ["ipv4", "ipv6"]
+            }
+
+            if not any(cidr_file.exists() for cidr_file in cidr_files.values()):
+                raise KeyError(f"No CIDRs found for {country_code}.")
+
+            country = {}
+
+            for ip_version, cidr_file in cidr_files.items():
+                if not cidr_file.exists():
+                    country[ip_version] = CidrRanges.from_intervals([], ip_version)
+                    continue
+
+                with open(cidr_file, "r") as f:
+                    country[ip_version] = CidrRanges.from_cidrs(
+                        (line.strip() for line in f if line.strip()), ip_version
+                    )
+
+        self.__logger.debug(
+            f"Loaded {country_code} CIDRs into "
+            f"{sum(ranges.nbytes() for ranges in country.values())} bytes."
+        )
+
+        return country
+
+    def __lookup_table(self) -> Dict[str, Tuple]:
+        with self.__lock:
+            if self.__table is not None:
+                return self.__table
+
+            # Built once from all countries, without going through the LRU.
+            lookup = cidr_lookup.CidrLookup.load(str(self.__base_path))
+            self.__table = {}
+
+            for ip_version in ["ipv4", "ipv6"]:
+                starts, ends, codes = lookup.table(ip_version)
+                countries = sorted(set(codes))
+                positions = {cc: i for i, cc in enumerate(countries)}
+
+                # Neighbouring ranges of different countries are kept apart.
+                self.__table[ip_version] = (
+                    CidrRanges(
+                        ip_version, pack(starts, ip_version), pack(ends, ip_version)
+                    ),
+                    array.array("H", (positions[cc] for cc in codes)),
+                    countries,
+                )
+
+            return self.__table
@@ -0,0 +1,275 @@
+import os
+import gzip
+import json
+import logging
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from . import cidr_ranges
+
+HISTORY_INDEX = "history.json"
+HISTORY_VERSION = 1
+
+# Every Nth snapshot is stored in full, so a state is rebuilt from at most N-1 deltas.
+CHECKPOINT_INTERVAL = 30
+
+Intervals = List[Tuple[int, int]]
+
+
+class FsCidrHistory:
+    def __init__(
+        self, base_folder: str, checkpoint_interval: int = CHECKPOINT_INTERVAL
+    ):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__base_path = Path(base_folder)
+        self.__checkpoint_interval = max(1, checkpoint_interval)
+        self.__head: Tuple[str, Dict[str, Dict[str, Intervals]]] | None = None
+
+    def snapshots(self) -> List[str]:
+        return [entry["snapshot"] for entry in self.__load_index()]
+
+    def resolve(self, snapshot: str) -> str | None:
+        snapshots = self.snapshots()
+
+        if snapshot == "latest":
+            return snapshots[-1] if snapshots else None
+
+        # Dates resolve to the last snapshot of the day, e.g. 20250101 to 20250101T120000Z.
+        resolved = [known for known in snapshots if known[: len(snapshot)] <= snapshot]
+
+        return resolved[-1] if resolved else None
+
+    def record(
+        self, snapshot: str, cidrs: Dict[str, Dict[str, Iterable[Tuple[int, int]]]]
+    ) -> str:
+        index = self.__load_index()
+
+        if index and snapshot < index[-1]["snapshot"]:
+            raise ValueError(
+                f"Snapshot {snapshot} is older than the last one {index[-1]['snapshot']}."
+            )
+
+        # Recording the last snapshot again replaces it.
+        replaced = None
+        if index and snapshot == index[-1]["snapshot"]:
+            replaced = index.pop()
+            self.__head = None
+
+        state = {
+            cc.upper(): {
+                ip_version: cidr_ranges.cidrs_to_intervals(
+                    networks[ip_version], ip_version
+                )
+                for ip_version in ["ipv4", "ipv6"]
+            }
+            for cc, networks in cidrs.items()
+        }
+        state = {
+            cc: per_country
+            for cc, per_country in state.items()
+            if per_country["ipv4"] or per_country["ipv6"]
+        }
+
+        since_checkpoint = 0
+        for entry in reversed(index):
+            if entry["kind"] == "checkpoint":
+                break
+            since_checkpoint += 1
+
+        if not index or since_checkpoint + 1 >= self.__checkpoint_interval:
+            kind, data = "checkpoint", self.__encode_state(state)
+        else:
+            previous = self.__state(index, len(index) - 1)
+            kind, data = "delta", self.__encode_delta(self.__delta(previous, state))
+
+        size = self.__write(
+            self.__path({"snapshot": snapshot, "kind": kind}),
+            gzip.compress(json.dumps(data).encode("ascii")),
+        )
+
+        index.append({"snapshot": snapshot, "kind": kind, "size": size})
+        self.__save_index(index)
+        self.__head = (snapshot, state)
+
+        if replaced is not None and replaced["kind"] != kind:
+            self.__path(replaced).unlink(missing_ok=True)
+
+        self.__logger.info(
+            f"Recorded {snapshot} snapshot as a {kind} of {size} bytes.",
+            extra={"snapshot": snapshot},
+        )
+
+        return kind
+
+    def state(
+        self, snapshot: str, country_codes: List[str] | None = None
+    ) -> Dict[str, Dict[str, Intervals]]:
+        resolved = self.resolve(snapshot)
+        if resolved is None:
+            raise KeyError(f"No snapshot recorded on or before {snapshot}.")
+
+        index = self.__load_index()
+        position = [entry["snapshot"] for entry in index].index(resolved)
+        state = self.__state(index, position)
+
+        if country_codes is None:
+            return state
+
+        return {
+            cc.upper(): state[cc.upper()] for cc in country_codes if cc.upper() in state
+        }
+
+    def diff(
+        self, since: str, until: str, country_codes: List[str] | None = None
+    ) -> Dict[str, Dict[str, Dict[str, Intervals]]]:
+        old = self.state(since, country_codes)
+        new = self.state(until, country_codes)
+
+        return self.__delta(old, new)
+
+    def __state(
+        self, index: List[Dict], position: int
+    ) -> Dict[str, Dict[str, Intervals]]:
+        target = index[position]["snapshot"]
+        if self.__head is not None and self.__head[0] == target:
+            return self.__head[1]
+
+        checkpoint = position
+        while index[checkpoint]["kind"] != "checkpoint":
+            checkpoint -= 1
+
+        state = self.__decode_state(self.__read(index[checkpoint]))
+
+        for entry in index[checkpoint + 1 : position + 1]:
+            for cc, per_country in self.__decode_delta(self.__read(entry)).items():
+                current = state.setdefault(cc, {"ipv4": [], "ipv6": []})
+
+                for ip_version, (added, removed) in per_country.items():
+                    current[ip_version] = cidr_ranges.merge_intervals(
+                        cidr_ranges.subtract_intervals(current[ip_version], removed)
+                        + added
+                    )
+
+                if not current["ipv4"] and not current["ipv6"]:
+                    del state[cc]
+
+        self.__logger.debug(
+            f"Rebuilt {target} from {index[checkpoint]['snapshot']} and "
+            f"{position - checkpoint} deltas.",
+            extra={"snapshot": target},
+        )
+
+        if position == len(index) - 1:
+            self.__head = (target, state)
+
+        return state
+
+    def __delta(
+        self,
+        old: Dict[str, Dict[str, Intervals]],
+        new: Dict[str, Dict[str, Intervals]],
+    ) -> Dict[str, Dict[str, Dict[str, Intervals]]]:
+        delta = {}
+
+        for cc in sorted(set(old) | set(new)):
+            for ip_version in ["ipv4", "ipv6"]:
+                added, removed = cidr_ranges.diff_intervals(
+                    old.get(cc, {}).get(ip_version, []),
+                    new.get(cc, {}).get(ip_version, []),
+                )
+
+                if added or removed:
+                    delta.setdefault(cc, {})[ip_version] = {
+                        "added": added,
+                        "removed": removed,
+                    }
+
+        return delta
+
+    def __encode_state(self, state: Dict[str, Dict[str, Intervals]]) -> Dict:
+        return {
+            cc: {
+                ip_version: self.__flatten(intervals)
+                for ip_version, intervals in per_country.items()
+            }
+            for cc, per_country in state.items()
+        }
+
+    def __decode_state(self, data: Dict) -> Dict[str, Dict[str, Intervals]]:
+        return {
+            cc: {
+                ip_version: self.__pairs(values)
+                for ip_version, values in per_country.items()
+            }
+            for cc, per_country in data.items()
+        }
+
+    def __encode_delta(self, delta: Dict) -> Dict:
+        return {
+            cc: {
+                ip_version: {
+                    change: self.__flatten(intervals)
+                    for change, intervals in changes.items()
+                }
+                for ip_version, changes in per_country.items()
+            }
+            for cc, per_country in delta.items()
+        }
+
+    def __decode_delta(self, data: Dict) -> Dict[str, Dict[str, Tuple]]:
+        return {
+            cc: {
+                ip_version: (
+                    self.__pairs(changes["added"]),
+                    self.__pairs(changes["removed"]),
+                )
+                for ip_version, changes in per_country.items()
+            }
+            for cc, per_country in data.items()
+        }
+
+    def __flatten(self, intervals: Intervals) -> List[int]:
+        return [bound for interval in intervals for bound in interval]
+
+    def __pairs(self, values: List[int]) -> Intervals:
+        return list(zip(values[::2], values[1::2]))
+
+    def __read(self, entry: Dict) -> Dict:
+        with open(self.__path(entry), "rb") as f:
+            return json.loads(gzip.decompress(f.read()))
+
+    def __path(self, entry: Dict) -> Path:
+        return self.__base_path / f"{entry['kind']}s" / f"{entry['snapshot']}.json.gz"
+
+    def __load_index(self) -> List[Dict]:
+        path = self.__base_path / HISTORY_INDEX
+        if not path.exists():
+            return []
+
+        with open(path, "r") as f:
+            history = json.load(f)
+
+        if history.get("version") != HISTORY_VERSION:
+            raise ValueError(f"Unsupported history version in {path}.")
+
+        return history["snapshots"]
+
+    def __save_index(self, index: List[Dict]):
+        self.__write(
+            self.__base_path / HISTORY_INDEX,
+            json.dumps(
+                {"version": HISTORY_VERSION, "snapshots": index}, indent=2
+            ).encode("ascii"),
+        )
+
+    def __write(self, path: Path, content: bytes) -> int:
+        os.makedirs(path.parent, exist_ok=True)
+
+        staging = path.with_name(f".{path.name}.tmp")
+        with open(staging, "wb") as f:
+            f.write(content)
+
+        os.replace(staging, path)
+
+        return len(content)
@@ -0,0 +1,100 @@
+import bisect
+import logging
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from . import cidr_ranges, cidr_binary
+
+
+class CidrLookup:
+    def __init__(self, ranges: Dict[str, Iterable[Tuple[int, int, str]]]):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__tables = {
+            ip_version: self.__build(ranges.get(ip_version, []))
+            for ip_version in ["ipv4", "ipv6"]
+        }
+
+    @classmethod
+    def load(cls, base_folder: str) -> "CidrLookup":
+        base_path = Path(base_folder)
+        reader = cidr_binary.open_fresh(base_folder)
+
+        if reader is not None:
+            with reader:
+                return cls(
+                    {
+                        ip_version: [
+                            (start, end, cc)
+                            for cc in reader.countries()
+                            for start, end in reader.ranges(cc, ip_version)
+                        ]
+                        for ip_version in ["ipv4", "ipv6"]
+                    }
+                )
+
+        ranges = {"ipv4": [], "ipv6": []}
+        for ip_version in ["ipv4", "ipv6"]:
+            bits = cidr_ranges.IP_BITS[ip_version]
+
+            for cidr_file in sorted((base_path / ip_version).glob("*.cidr")):
+                cc = cidr_file.name[: -len(".cidr")].upper()
+
+                with open(cidr_file, "r") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+
+                        start, prefixlen = cidr_ranges.parse_cidr(
+                            line.strip(), ip_version
+                        )
+                        ranges[ip_version].append(
+                            (start, start + (1 << (bits - prefixlen)) - 1, cc)
+                        )
+
+        return cls(ranges)
+
+    def lookup(self, ip: str) -> str | None:
+        ip_version = "ipv6" if ":" in ip else "ipv4"
+
+        return self.lookup_int(cidr_ranges.parse_ip(ip, ip_version), ip_version)
+
+    def lookup_int(self, ip: int, ip_version: str) -> str | None:
+        starts, ends, countries = self.__tables[ip_version]
+
+        i = bisect.bisect_right(starts, ip) - 1
+        if i >= 0 and ip <= ends[i]:
+            return countries[i]
+
+        return None
+
+    def size(self, ip_version: str) -> int:
+        return len(self.__tables[ip_version][0])
+
+    def table(self, ip_version: str) -> Tuple[List[int], List[int], List[str]]:
+        return self.__tables[ip_version]
+
+    def __build(
+        self, ranges: Iterable[Tuple[int, int, str]]
+    ) -> Tuple[List[int], List[int], List[str]]:
+        starts, ends, countries = [], [], []
+
+        for start, end, cc in sorted(ranges):
+            if ends and start <= ends[-1]:
+                # Overlapping allocations: the range that starts first wins.
+                if end <= ends[-1]:
+                    continue
+
+                start = ends[-1] + 1
+
+            if countries and countries[-1] == cc and start == ends[-1] + 1:
+                ends[-1] = end
+                continue
+
+            starts.append(start)
+            ends.append(end)
+            countries.append(cc)
+
+        self.__logger.debug(f"Built lookup table of {len(starts)} ranges.")
+
+        return starts, ends, countries
@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+import logging
+
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from . import cidr_ranges
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def fingerprint(digests: Iterable[Tuple[str, str, str]]) -> bytes:
+    content = "".join(
+        f"{cc.upper()} {ip_version} {digest}\n"
+        for cc, ip_version, digest in sorted(digests)
+    )
+
+    return hashlib.sha256(content.encode("ascii")).digest()
+
+
+class FsCidrManifest:
+    def __init__(self, base_folder: str):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__base_path = Path(base_folder)
+        self.__path = self.__base_path / MANIFEST_FILENAME
+
+    def load(self) -> Dict[str, Dict[str, Dict]]:
+        if not self.__path.exists():
+            return {}
+
+        try:
+            with open(self.__path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self.__logger.warning(f"Ignoring unreadable manifest {self.__path}.")
+            return {}
+
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+
+        return manifest.get("countries", {})
+
+    def save(self, countries: Dict[str, Dict[str, Dict]]):
+        os.makedirs(self.__base_path, exist_ok=True)
+
+        staging = self.__path.with_name(f".{self.__path.name}.tmp")
+        with open(staging, "w") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "countries": countries},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+        os.replace(staging, self.__path)
+
+        self.__logger.debug(
+            f"Saved CIDR manifest to {self.__path}", extra={"path": self.__path}
+        )
+
+    def entry(
+        self,
+        cidr_file: Path,
+        ip_version: str,
+        cidrs: Iterable[Tuple[int, int]] | None = None,
+        digest: str | None = None,
+    ) -> Dict:
+        if cidrs is None or digest is None:
+            with open(cidr_file, "rb") as f:
+                content = f.read()
+
+            digest = hashlib.sha256(content).hexdigest()
+            cidrs = [
+                cidr_ranges.parse_cidr(line.strip(), ip_version)
+                for line in content.decode("ascii").splitlines()
+                if line.strip()
+            ]
+
+        bits = cidr_ranges.IP_BITS[ip_version]
+        prefixes = Counter(prefixlen for _, prefixlen in cidrs)
+        stat = cidr_file.stat()
+
+        return {
+            "addresses": sum(
+                count << (bits - prefixlen) for prefixlen, count in prefixes.items()
+            ),
+            "cidrs": sum(prefixes.values()),
+            "prefixes": {
+                str(prefixlen): prefixes[prefixlen] for prefixlen in sorted(prefixes)
+            },
+            "sha256": digest,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+
+    def is_fresh(self, entry: Dict, cidr_file: Path) -> bool:
+        stat = cidr_file.stat()
+
+        if entry["size"] != stat.st_size:
+            return False
+
+        if entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+
+        # Touched but possibly unchanged files are compared by content.
+        with open(cidr_file, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != entry["sha256"]:
+                return False
+
+        entry["mtime_ns"] = stat.st_mtime_ns
+
+        return True
+
+    # None once a CIDR file was added, removed or edited after the manifest.
+    def fingerprint(self) -> bytes | None:
+        entries = {
+            (cc, ip_version): entry
+            for cc, networks in self.load().items()
+            for ip_version, entry in networks.items()
+        }
+        cidr_files = {
+            (path.name[: -len(".cidr")].upper(), ip_version): path
+            for ip_version in ["ipv4", "ipv6"]
+            for path in (self.__base_path / ip_version).glob("*.cidr")
+        }
+
+        if not entries or entries.keys() != cidr_files.keys():
+            return None
+
+        for key, entry in entries.items():
+            if not self.is_fresh(entry, cidr_files[key]):
+                return None
+
+        return fingerprint(
+            (cc, ip_version, entry["sha256"])
+            for (cc, ip_version), entry in entries.items()
+        )
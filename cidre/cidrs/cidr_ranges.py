@@ -0,0 +1,200 @@
+import socket
+
+from typing import Iterable, List, Tuple
+
+IP_BITS = {"ipv4": 32, "ipv6": 128}
+
+IP_FAMILIES = {"ipv4": socket.AF_INET, "ipv6": socket.AF_INET6}
+
+IP_BYTES = {"ipv4": 4, "ipv6": 16}
+
+# Special-purpose ranges (RFC 6890) which are never dropped by allow lists.
+RESERVED_CIDRS = {
+    "ipv4": [
+        "0.0.0.0/8",
+        "10.0.0.0/8",
+        "100.64.0.0/10",
+        "127.0.0.0/8",
+        "169.254.0.0/16",
+        "172.16.0.0/12",
+        "192.0.0.0/24",
+        "192.0.2.0/24",
+        "192.168.0.0/16",
+        "198.18.0.0/15",
+        "198.51.100.0/24",
+        "203.0.113.0/24",
+        "224.0.0.0/4",
+        "240.0.0.0/4",
+    ],
+    "ipv6": [
+        "::/128",
+        "::1/128",
+        "::ffff:0:0/96",
+        "64:ff9b::/96",
+        "100::/64",
+        "2001:db8::/32",
+        "fc00::/7",
+        "fe80::/10",
+        "ff00::/8",
+    ],
+}
+
+
+def parse_ip(ip: str, ip_version: str) -> int:
+    try:
+        return int.from_bytes(socket.inet_pton(IP_FAMILIES[ip_version], ip), "big")
+    except (OSError, KeyError) as e:
+        raise ValueError(f"Invalid {ip_version} address: {ip}") from e
+
+
+def format_ip(ip: int, ip_version: str) -> str:
+    return socket.inet_ntop(
+        IP_FAMILIES[ip_version], ip.to_bytes(IP_BYTES[ip_version], "big")
+    )
+
+
+def format_cidr(start: int, prefixlen: int, ip_version: str) -> str:
+    return f"{format_ip(start, ip_version)}/{prefixlen}"
+
+
+def parse_cidr(cidr: str, ip_version: str) -> Tuple[int, int]:
+    ip, _, prefixlen = cidr.partition("/")
+    bits = IP_BITS[ip_version]
+
+    prefix = int(prefixlen) if prefixlen else bits
+    if not 0 <= prefix <= bits:
+        raise ValueError(f"Invalid {ip_version} prefix length: {cidr}")
+
+    return parse_ip(ip, ip_version), prefix
+
+
+def range_to_cidrs(start: int, count: int, ip_version: str) -> List[Tuple[int, int]]:
+    bits = IP_BITS[ip_version]
+    stop = start + count
+
+    if start < 0 or stop > 1 << bits:
+        raise ValueError(f"Range is out of {ip_version} space: {start}+{count}")
+
+    cidrs = []
+    while start < stop:
+        # The largest block aligned on start that still fits before stop.
+        size = 1 << ((stop - start).bit_length() - 1)
+        if start:
+            size = min(size, start & -start)
+
+        cidrs.append((start, bits - size.bit_length() + 1))
+        start += size
+
+    return cidrs
+
+
+def cidrs_to_intervals(
+    cidrs: Iterable[Tuple[int, int]], ip_version: str
+) -> List[Tuple[int, int]]:
+    bits = IP_BITS[ip_version]
+
+    return merge_intervals(
+        (start, start + (1 << (bits - prefixlen))) for start, prefixlen in cidrs
+    )
+
+
+def merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+
+    for start, stop in sorted(intervals):
+        # Coalesces overlapping and adjacent [start, stop) intervals.
+        if merged and start <= merged[-1][1]:
+            if stop > merged[-1][1]:
+                merged[-1] = (merged[-1][0], stop)
+        else:
+            merged.append((start, stop))
+
+    return merged
+
+
+def intervals_to_cidrs(
+    intervals: Iterable[Tuple[int, int]], ip_version: str
+) -> List[Tuple[int, int]]:
+    return [
+        cidr
+        for start, stop in intervals
+        for cidr in range_to_cidrs(start, stop - start, ip_version)
+    ]
+
+
+def merge_cidrs(
+    cidrs: Iterable[Tuple[int, int]], ip_version: str
+) -> List[Tuple[int, int]]:
+    return intervals_to_cidrs(cidrs_to_intervals(cidrs, ip_version), ip_version)
+
+
+def subtract_intervals(
+    intervals: Iterable[Tuple[int, int]], removed: Iterable[Tuple[int, int]]
+) -> List[Tuple[int, int]]:
+    removed = merge_intervals(removed)
+    remaining = []
+
+    i = 0
+    for start, stop in merge_intervals(intervals):
+        while i < len(removed) and removed[i][1] <= start:
+            i += 1
+
+        # Removed intervals are sorted, so each one is passed over only once.
+        j = i
+        while j < len(removed) and removed[j][0] < stop:
+            if removed[j][0] > start:
+                remaining.append((start, removed[j][0]))
+            start = max(start, removed[j][1])
+            j += 1
+
+        if start < stop:
+            remaining.append((start, stop))
+
+    return remaining
+
+
+def diff_intervals(
+    old: Iterable[Tuple[int, int]], new: Iterable[Tuple[int, int]]
+) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    old, new = merge_intervals(old), merge_intervals(new)
+    points = sorted({point for interval in old + new for point in interval})
+
+    added, removed = [], []
+
+    # Sweeps the boundaries of both sides, each segment being in one, both or none.
+    i = j = 0
+    for start, stop in zip(points, points[1:]):
+        while i < len(old) and old[i][1] <= start:
+            i += 1
+        while j < len(new) and new[j][1] <= start:
+            j += 1
+
+        in_old = i < len(old) and old[i][0] <= start
+        in_new = j < len(new) and new[j][0] <= start
+
+        if in_old == in_new:
+            continue
+
+        changed = added if in_new else removed
+        if changed and changed[-1][1] == start:
+            changed[-1] = (changed[-1][0], stop)
+        else:
+            changed.append((start, stop))
+
+    return added, removed
+
+
+def complement_cidrs(
+    cidrs: Iterable[Tuple[int, int]], ip_version: str, include_reserved: bool = False
+) -> List[Tuple[int, int]]:
+    removed = cidrs_to_intervals(cidrs, ip_version)
+
+    if not include_reserved:
+        removed += cidrs_to_intervals(
+            (parse_cidr(cidr, ip_version) for cidr in RESERVED_CIDRS[ip_version]),
+            ip_version,
+        )
+
+    return intervals_to_cidrs(
+        subtract_intervals([(0, 1 << IP_BITS[ip_version])], removed), ip_version
+    )
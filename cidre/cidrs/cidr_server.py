@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import signal
+import asyncio
+import logging
+import collections
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from . import cidr_binary
+from .cidr_lookup import CidrLookup
+
+STATS_COMMAND = "STATS"
+
+UNKNOWN_COUNTRY = "-"
+
+INVALID_IP = "?"
+
+# Latencies of the most recent requests used for percentiles.
+LATENCY_WINDOW = 10000
+
+# Seconds of per-second query counters used for the recent QPS.
+QPS_WINDOW = 60
+
+
+class ServerStats:
+    def __init__(self):
+        self.__started = time.monotonic()
+        self.__latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.__seconds = collections.deque(maxlen=QPS_WINDOW)
+        self.requests = 0
+        self.queries = 0
+        self.reloads = 0
+
+    def record(self, queries: int, latency: float):
+        self.requests += 1
+        self.queries += queries
+        self.__latencies.append(latency)
+
+        second = int(time.monotonic())
+        if self.__seconds and self.__seconds[-1][0] == second:
+            self.__seconds[-1][1] += queries
+        else:
+            self.__seconds.append([second, queries])
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        latencies = sorted(self.__latencies)
+
+        # The current second is still being counted and is left out.
+        window = min(QPS_WINDOW, int(now - self.__started))
+        recent = [
+            count
+            for second, count in self.__seconds
+            if now - QPS_WINDOW <= second < int(now)
+        ]
+
+        return {
+            "uptime": round(now - self.__started, 3),
+            "requests": self.requests,
+            "queries": self.queries,
+            "reloads": self.reloads,
+            "qps": round(sum(recent) / window, 3) if window else 0.0,
+            "latency_ms": {
+                f"p{percentile}": round(
+                    self.__percentile(latencies, percentile) * 1000, 3
+                )
+                for percentile in [50, 90, 99]
+            },
+        }
+
+    def __percentile(self, latencies: List[float], percentile: int) -> float:
+        if not latencies:
+            return 0.0
+
+        return latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)]
+
+
+class CidrServer:
+    def __init__(
+        self, base_folder: str, socket_path: str, reload_interval: float = 2.0
+    ):
+        self.__base_path = Path(base_folder)
+        self.__socket_path = socket_path
+        self.__reload_interval = reload_interval
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__index = None
+        self.__signature = None
+        self.__reloading = asyncio.Lock()
+        self.stats = ServerStats()
+
+    def serve(self):
+        asyncio.run(self.run())
+
+    async def run(self):
+        await self.reload()
+
+        if os.path.exists(self.__socket_path):
+            os.unlink(self.__socket_path)
+
+        server = await asyncio.start_unix_server(self.__handle, path=self.__socket_path)
+
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(
+                signal.SIGHUP, lambda: asyncio.ensure_future(self.reload(force=True))
+            )
+        except (NotImplementedError, RuntimeError):
+            pass
+
+        self.__logger.info(f"Serving lookups on {self.__socket_path}...")
+
+        watcher = asyncio.create_task(self.__watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+            if os.path.exists(self.__socket_path):
+                os.unlink(self.__socket_path)
+
+    async def reload(self, force: bool = False) -> bool:
+        async with self.__reloading:
+            signature = self.__store_signature()
+
+            if not force and signature == self.__signature:
+                return False
+
+            # Loading runs in a thread so that in-flight queries keep being
+            # answered from the previous index until the reference is swapped.
+            index = await asyncio.to_thread(CidrLookup.load, str(self.__base_path))
+
+            self.__index = index
+            self.__signature = signature
+            self.stats.reloads += 1
+
+            self.__logger.info(
+                f"Loaded {index.size('ipv4')} IPv4 and {index.size('ipv6')} IPv6 ranges "
+                f"from {self.__base_path}."
+            )
+
+            return True
+
+    def answer(self, request: str) -> str:
+        if request.strip().upper() == STATS_COMMAND:
+            return json.dumps(self.stats.snapshot())
+
+        started = time.perf_counter()
+
+        index = self.__index
+        ips = request.split()
+
+        countries = []
+        for ip in ips:
+            try:
+                countries.append(index.lookup(ip) or UNKNOWN_COUNTRY)
+            except ValueError:
+                countries.append(INVALID_IP)
+
+        self.stats.record(len(ips), time.perf_counter() - started)
+
+        return " ".join(countries)
+
+    async def __handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                writer.write(f"{self.answer(line.decode(errors='replace'))}\n".encode())
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def __watch(self):
+        while True:
+            await asyncio.sleep(self.__reload_interval)
+
+            try:
+                await self.reload()
+            except Exception:
+                self.__logger.exception(
+                    f"Failed to reload {self.__base_path}, keeping the previous index."
+                )
+
+    def __store_signature(self) -> Tuple:
+        paths = [self.__base_path / cidr_binary.FILENAME]
+        for ip_version in ["ipv4", "ipv6"]:
+            paths.extend(sorted((self.__base_path / ip_version).glob("*.cidr")))
+
+        signature = []
+        for path in paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+
+        return tuple(signature)
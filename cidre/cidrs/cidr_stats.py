@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+
+from typing import Callable, Collection, ContextManager, Dict, Iterator, List
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STATS_FORMATS = ["json", "prometheus"]
+
+PROMETHEUS_PREFIX = "cidre"
+
+PROMETHEUS_METRICS = {
+    "seconds": ("stage_duration_seconds", "Duration of the stage."),
+    "records_in": ("stage_records_in", "Records read by the stage."),
+    "records_out": ("stage_records_out", "Records produced by the stage."),
+    "bytes": ("stage_bytes", "Bytes transferred or written by the stage."),
+    "peak_rss_bytes": (
+        "stage_peak_rss_bytes",
+        "Peak resident set size of the process by the end of the stage.",
+    ),
+}
+
+# Hooks get the stage name and labels and return a context manager wrapped
+# around the stage, e.g. a profiler. Stages may run concurrently in threads.
+StageHook = Callable[[str, Dict[str, str]], ContextManager]
+
+
+def peak_rss() -> int | None:
+    if resource is None:
+        return None
+
+    # Process pool workers are accounted for once they are joined.
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+    # macOS reports bytes, Linux reports KiB.
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def count_cidrs(cidrs: Dict[str, Dict[str, Collection]]) -> int:
+    return sum(
+        len(networks)
+        for per_country in cidrs.values()
+        for networks in per_country.values()
+    )
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class StageStats:
+    __slots__ = (
+        "name",
+        "labels",
+        "seconds",
+        "records_in",
+        "records_out",
+        "bytes",
+        "peak_rss_bytes",
+        "__lock",
+    )
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self.seconds = 0.0
+        self.records_in = 0
+        self.records_out = 0
+        self.bytes = 0
+        self.peak_rss_bytes = None
+        self.__lock = threading.Lock()
+
+    def add(self, records_in: int = 0, records_out: int = 0, transferred: int = 0):
+        with self.__lock:
+            self.records_in += records_in
+            self.records_out += records_out
+            self.bytes += transferred
+
+    def to_dict(self) -> Dict:
+        return {
+            "stage": self.name,
+            "labels": self.labels,
+            "seconds": self.seconds,
+            "records_in": self.records_in,
+            "records_out": self.records_out,
+            "bytes": self.bytes,
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+
+
+class CidrStats:
+    def __init__(self, command: str | None = None):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__command = command
+        self.__started = time.time()
+        self.__stages: List[StageStats] = []
+        self.__hooks: List[StageHook] = []
+        self.__scope: Dict[str, str] = {}
+        self.__lock = threading.Lock()
+        self.success = None
+
+    # Stats don't travel to process pool workers, stages run there are only
+    # accounted for by the stage around them in the parent.
+    def __getstate__(self) -> Dict:
+        return {"command": self.__command}
+
+    def __setstate__(self, state: Dict):
+        self.__init__(state["command"])
+
+    def add_hook(self, hook: StageHook):
+        self.__hooks.append(hook)
+
+    # Stages started within, from any thread, get the labels as well, so
+    # repeated stages, e.g. one per snapshot, stay apart as separate series.
+    @contextlib.contextmanager
+    def labelled(self, labels: Dict[str, str]) -> Iterator[None]:
+        previous = self.__scope
+        self.__scope = {**previous, **labels}
+
+        try:
+            yield
+        finally:
+            self.__scope = previous
+
+    @property
+    def stages(self) -> List[StageStats]:
+        with self.__lock:
+            return list(self.__stages)
+
+    @contextlib.contextmanager
+    def stage(
+        self, name: str, labels: Dict[str, str] | None = None
+    ) -> Iterator[StageStats]:
+        stage = StageStats(name, {**self.__scope, **(labels or {})})
+
+        with self.__lock:
+            self.__stages.append(stage)
+
+        started = time.perf_counter()
+
+        try:
+            with contextlib.ExitStack() as hooks:
+                for hook in self.__hooks:
+                    hooks.enter_context(hook(name, stage.labels))
+
+                yield stage
+        finally:
+            stage.seconds = time.perf_counter() - started
+            stage.peak_rss_bytes = peak_rss()
+
+            self.__logger.debug(
+                f"Stage {name} took {stage.seconds:.3f}s.",
+                extra={"stage": name, "elapsed": stage.seconds},
+            )
+
+    def to_dict(self) -> Dict:
+        return {
+            "command": self.__command,
+            "success": self.success,
+            "started": self.__started,
+            "seconds": time.time() - self.__started,
+            "peak_rss_bytes": peak_rss(),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def render_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2) + "\n"
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        for field, (metric, description) in PROMETHEUS_METRICS.items():
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{metric} {description}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{metric} gauge")
+
+            for stage in self.stages:
+                value = getattr(stage, field)
+                if value is None:
+                    continue
+
+                labels = self.__labels({"stage": stage.name, **stage.labels})
+                lines.append(f"{PROMETHEUS_PREFIX}_{metric}{labels} {value}")
+
+        labels = self.__labels({})
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_last_run_timestamp_seconds Start of the last run.",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds{labels} {self.__started}",
+        ]
+
+        if self.success is not None:
+            lines += [
+                f"# HELP {PROMETHEUS_PREFIX}_last_run_success Whether the last run succeeded.",
+                f"# TYPE {PROMETHEUS_PREFIX}_last_run_success gauge",
+                f"{PROMETHEUS_PREFIX}_last_run_success{labels} {int(self.success)}",
+            ]
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, format: str, path: str | None = None):
+        if format == "prometheus":
+            content = self.render_prometheus()
+        else:
+            content = self.render_json()
+
+        if path is None or path == "-":
+            sys.stderr.write(content)
+            return
+
+        # The textfile collector may read the file at any time.
+        staging = f"{path}.{os.getpid()}.tmp"
+        with open(staging, "w") as f:
+            f.write(content)
+
+        os.replace(staging, path)
+
+    def __labels(self, labels: Dict[str, str]) -> str:
+        if self.__command:
+            labels = {"command": self.__command, **labels}
+
+        if not labels:
+            return ""
+
+        escaped = ",".join(
+            f'{key}="{escape_label(str(value))}"' for key, value in labels.items()
+        )
+
+        return f"{{{escaped}}}"
@@ -1,29 +1,263 @@
 import os
+import time
+import shutil
+import hashlib
 import logging
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
-from typing import Dict, Set
+from typing import Dict, List, Set, Tuple
+
+from . import cidr_ranges, cidr_binary, cidr_manifest, cidr_stats
+
+STAGING_FOLDER = ".staging"
 
 
 class FsCidrStore:
-    def __init__(self, base_folder: str):
+    def __init__(
+        self,
+        base_folder: str,
+        binary: bool = True,
+        workers: int = 1,
+        swap: bool = False,
+        stats: cidr_stats.CidrStats | None = None,
+    ):
         self.__logger = logging.getLogger(self.__class__.__name__)
         self.__base_path = Path(base_folder)
+        self.__binary = binary
+        self.__workers = workers
+        self.__swap = swap
+        self.__stats = stats if stats is not None else cidr_stats.CidrStats()
 
     def save(self, cidrs: Dict[str, Dict[str, Set]]):
         self.__logger.info(
             f"Saving CIDRs into {self.__base_path}/* path.",
             extra={"base_path": {self.__base_path}},
         )
-        for cc, networks in sorted(cidrs.items()):
-            for ip_version in ["ipv4", "ipv6"]:
-                directory = self.__base_path / ip_version
-                os.makedirs(directory, exist_ok=True)
-                filename = f"{directory}/{cc.lower()}.cidr"
-                with open(filename, "w") as f:
-                    for network in networks[ip_version]:
-                        f.write(f"{network}\n")
-                        self.__logger.debug(
-                            f"Data saved to {filename}", extra={"filename": filename}
-                        )
+
+        jobs = [
+            (cc, ip_version, sorted(networks[ip_version]))
+            for cc, networks in sorted(cidrs.items())
+            for ip_version in ["ipv4", "ipv6"]
+        ]
+
+        swap = self.__swap
+        if swap and self.__base_path.exists() and not self.__base_path.is_symlink():
+            self.__logger.warning(
+                f"{self.__base_path} is a directory, not a symlink. "
+                "Replacing its files one by one instead of swapping it."
+            )
+            swap = False
+
+        with self.__stats.stage("save") as stage:
+            if swap:
+                written, transferred = self.__save_swapped(jobs, cidrs)
+            else:
+                written, transferred = self.__save_in_place(jobs, cidrs)
+
+            stage.add(
+                records_in=cidr_stats.count_cidrs(cidrs),
+                records_out=written,
+                transferred=transferred,
+            )
+
+    def __save_in_place(
+        self, jobs: List[Tuple], cidrs: Dict[str, Dict[str, Set]]
+    ) -> Tuple[int, int]:
+        staging = self.__base_path / STAGING_FOLDER
+        shutil.rmtree(staging, ignore_errors=True)
+
+        try:
+            return self.__write(
+                self.__base_path, self.__base_path, staging, jobs, cidrs
+            )
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def __save_swapped(
+        self, jobs: List[Tuple], cidrs: Dict[str, Dict[str, Set]]
+    ) -> Tuple[int, int]:
+        current = self.__base_path.resolve() if self.__base_path.exists() else None
+        target = self.__base_path.with_name(
+            f".{self.__base_path.name}.{time.time_ns()}"
+        )
+
+        try:
+            written = self.__write(current or target, target, target, jobs, cidrs)
+        except:
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+
+        link = self.__base_path.with_name(f".{self.__base_path.name}.link")
+        if link.is_symlink():
+            link.unlink()
+
+        os.symlink(target.name, link)
+        os.replace(link, self.__base_path)
+
+        self.__logger.info(f"Swapped {self.__base_path} to {target}.")
+
+        if current and current.name.startswith(f".{self.__base_path.name}."):
+            shutil.rmtree(current, ignore_errors=True)
+
+        return written
+
+    def __write(
+        self,
+        previous: Path,
+        target: Path,
+        staging: Path,
+        jobs: List[Tuple],
+        cidrs: Dict[str, Dict[str, Set]],
+    ) -> Tuple[int, int]:
+        for ip_version in ["ipv4", "ipv6"]:
+            os.makedirs(target / ip_version, exist_ok=True)
+            os.makedirs(staging / ip_version, exist_ok=True)
+
+        # Files of countries which are not saved this time are kept as well,
+        # and so are their CIDRs in the binary file and the manifest.
+        carried = self.__carry(previous, target, jobs)
+
+        complete = dict(cidrs)
+        for (cc, ip_version), networks in carried.items():
+            complete.setdefault(cc, {"ipv4": [], "ipv6": []})[ip_version] = networks
+
+        def render(job: Tuple) -> Tuple[Path, str, bool]:
+            cc, ip_version, networks = job
+            relative = Path(ip_version) / f"{cc.lower()}.cidr"
+            content = "".join(
+                f"{cidr_ranges.format_cidr(start, prefixlen, ip_version)}\n"
+                for start, prefixlen in networks
+            ).encode("ascii")
+
+            return self.__stage(previous, staging, relative, content)
+
+        if self.__workers > 1:
+            with ThreadPoolExecutor(max_workers=self.__workers) as executor:
+                staged = list(executor.map(render, jobs))
+        else:
+            staged = [render(job) for job in jobs]
+
+        manifest = cidr_manifest.FsCidrManifest(str(target))
+        previous_entries = cidr_manifest.FsCidrManifest(str(previous)).load()
+
+        carried_entries = {}
+        for cc, ip_version in carried:
+            cidr_file = target / ip_version / f"{cc.lower()}.cidr"
+            entry = previous_entries.get(cc, {}).get(ip_version)
+
+            if entry is None or not manifest.is_fresh(entry, cidr_file):
+                entry = manifest.entry(cidr_file, ip_version)
+
+            carried_entries[(cc, ip_version)] = entry
+
+        # Readers use the binary only while the manifest still has this fingerprint.
+        files = []
+        if self.__binary:
+            fingerprint = cidr_manifest.fingerprint(
+                [
+                    (cc, ip_version, digest)
+                    for (cc, ip_version, _), (_, digest, _) in zip(jobs, staged)
+                ]
+                + [
+                    (cc, ip_version, entry["sha256"])
+                    for (cc, ip_version), entry in carried_entries.items()
+                ]
+            )
+            files.append(
+                self.__stage(
+                    previous,
+                    staging,
+                    Path(cidr_binary.FILENAME),
+                    cidr_binary.render(complete, fingerprint),
+                )
+            )
+
+        written, transferred = 0, 0
+        for relative, _, changed in files + staged:
+            if changed:
+                transferred += os.path.getsize(staging / relative)
+                os.replace(staging / relative, target / relative)
+                written += 1
+            elif previous != target:
+                self.__link(previous / relative, target / relative)
+
+        self.__logger.info(
+            f"Wrote {written} files, skipped {len(files) + len(staged) - written} unchanged."
+        )
+
+        entries = {}
+        for (cc, ip_version, networks), (relative, digest, _) in zip(jobs, staged):
+            entries.setdefault(cc.upper(), {})[ip_version] = manifest.entry(
+                target / relative, ip_version, networks, digest
+            )
+
+        for (cc, ip_version), entry in carried_entries.items():
+            entries.setdefault(cc, {})[ip_version] = entry
+
+        manifest.save(entries)
+
+        return written, transferred
+
+    def __carry(
+        self, previous: Path, target: Path, jobs: List[Tuple]
+    ) -> Dict[Tuple[str, str], List[Tuple[int, int]]]:
+        saved = {(cc.upper(), ip_version) for cc, ip_version, _ in jobs}
+        carried = {}
+
+        for ip_version in ["ipv4", "ipv6"]:
+            for path in sorted((previous / ip_version).glob("*.cidr")):
+                cc = path.name[: -len(".cidr")].upper()
+                if (cc, ip_version) in saved:
+                    continue
+
+                if previous != target:
+                    self.__link(path, target / ip_version / path.name)
+
+                with open(path, "r") as f:
+                    carried[(cc, ip_version)] = [
+                        cidr_ranges.parse_cidr(line.strip(), ip_version)
+                        for line in f
+                        if line.strip()
+                    ]
+
+        if carried:
+            self.__logger.info(
+                f"Kept {len(carried)} CIDR files of countries not saved this time."
+            )
+
+        return carried
+
+    def __stage(
+        self, previous: Path, staging: Path, relative: Path, content: bytes
+    ) -> Tuple[Path, str, bool]:
+        digest = hashlib.sha256(content).hexdigest()
+
+        if self.__digest(previous / relative, len(content)) == digest:
+            return relative, digest, False
+
+        with open(staging / relative, "wb") as f:
+            f.write(content)
+
+        self.__logger.debug(
+            f"Data staged to {staging / relative}", extra={"path": relative}
+        )
+
+        return relative, digest, True
+
+    def __digest(self, path: Path, size: int) -> str | None:
+        try:
+            if path.stat().st_size != size:
+                return None
+
+            with open(path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+    def __link(self, source: Path, destination: Path):
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
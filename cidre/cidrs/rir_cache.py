@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import logging
+
+from pathlib import Path
+from typing import Dict, Iterable
+
+
+class FsRirCache:
+    def __init__(self, base_folder: str, fingerprint: Dict | None = None):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__base_path = Path(base_folder)
+        self.__fingerprint = fingerprint or {}
+
+    def path(self, registry: str) -> Path:
+        return self.__base_path / f"delegated-{registry}-extended-latest"
+
+    def exists(self, registry: str) -> bool:
+        return self.path(registry).exists() and self.__meta_path(registry).exists()
+
+    def headers(self, registry: str) -> Dict[str, str]:
+        if not self.exists(registry):
+            return {}
+
+        meta = self.__read_json(self.__meta_path(registry))
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        return headers
+
+    def save(
+        self,
+        registry: str,
+        url: str,
+        chunks: Iterable[bytes],
+        etag: str | None,
+        last_modified: str | None,
+    ) -> bool:
+        os.makedirs(self.__base_path, exist_ok=True)
+
+        path = self.path(registry)
+        staging = path.with_name(f".{path.name}.tmp")
+
+        digest = hashlib.sha256()
+        size = 0
+        with open(staging, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+
+        sha256 = digest.hexdigest()
+        changed = sha256 != self.sha256(registry)
+
+        os.replace(staging, path)
+        self.__write_json(
+            self.__meta_path(registry),
+            {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "sha256": sha256,
+                "size": size,
+            },
+        )
+
+        self.__logger.debug(
+            f"Cached {registry} ({size} bytes, sha256 {sha256}).",
+            extra={"registry": registry},
+        )
+
+        return changed
+
+    def sha256(self, registry: str) -> str | None:
+        if not self.exists(registry):
+            return None
+
+        return self.__read_json(self.__meta_path(registry)).get("sha256")
+
+    def is_changed(self, registries: Iterable[str]) -> bool:
+        compiled_path = self.__base_path / "compiled.json"
+        if not compiled_path.exists():
+            return True
+
+        compiled = self.__read_json(compiled_path)
+        if compiled.get("fingerprint") != self.__fingerprint:
+            return True
+
+        hashes = {registry: self.sha256(registry) for registry in registries}
+
+        return compiled.get("sha256") != hashes
+
+    def commit(self, registries: Iterable[str]):
+        self.__write_json(
+            self.__base_path / "compiled.json",
+            {
+                "fingerprint": self.__fingerprint,
+                "sha256": {registry: self.sha256(registry) for registry in registries},
+            },
+        )
+
+    def __meta_path(self, registry: str) -> Path:
+        return self.__base_path / f"{registry}.json"
+
+    def __read_json(self, path: Path) -> Dict:
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def __write_json(self, path: Path, data: Dict):
+        os.makedirs(self.__base_path, exist_ok=True)
+
+        staging = path.with_name(f".{path.name}.tmp")
+        with open(staging, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+        os.replace(staging, path)
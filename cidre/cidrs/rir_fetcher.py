@@ -1,11 +1,18 @@
+import os
+import time
 import logging
+import multiprocessing
 
 import requests
-import ipaddress
-import netaddr
 import collections
 
-from typing import Dict, List, Set
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
+
+from . import cidr_ranges, cidr_aggregator, cidr_stats, rir_sources
+from .rir_cache import FsRirCache
 
 RIRS = {
     "afrinic": "https://ftp.afrinic.net/pub/stats/afrinic/delegated-afrinic-extended-latest",
@@ -15,58 +22,358 @@ RIRS = {
     "ripencc": "https://ftp.ripe.net/pub/stats/ripencc/delegated-ripencc-extended-latest",
 }
 
+CHUNK_SIZE = 1024 * 1024
+
 
 class RirFetcher:
-    def __init__(self, merge: bool, proxy: str | None):
+    def __init__(
+        self,
+        merge: bool,
+        proxy: str | None,
+        concurrency: int = len(RIRS),
+        timeout: float = 30,
+        retries: int = 3,
+        cache: FsRirCache | None = None,
+        workers: int = 1,
+        max_cidrs: int | None = None,
+        max_overcoverage: float | None = None,
+        stats: cidr_stats.CidrStats | None = None,
+        sources: Dict[str, str] | None = None,
+    ):
         self.__logger = logging.getLogger(self.__class__.__name__)
         self.__merge = merge
         self.__proxy = proxy
+        self.__concurrency = max(1, concurrency)
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__cache = cache
+        self.__workers = max(1, workers)
+        self.__max_cidrs = max_cidrs
+        self.__max_overcoverage = max_overcoverage
+        self.__stats = stats if stats is not None else cidr_stats.CidrStats()
+        self.__sources = sources
 
     def fetch(self):
-        data = self.__fetch()
+        with self.__session() as session, ThreadPoolExecutor(
+            max_workers=self.__concurrency
+        ) as executor:
+            sources = self.__fetch(session, executor)
 
-        cidrs = self.__convert_to_cidrs(data)
+            if (
+                self.__cache is not None
+                and self.__sources is None
+                and not self.__cache.is_changed(RIRS.keys())
+            ):
+                self.__logger.info("RIRs have not changed since the last pull.")
+                return None
 
-        if not self.__merge:
-            return cidrs
+            if self.__workers > 1:
+                return self.__fetch_parallel(sources)
+
+            cidrs = self.__convert_to_cidrs(sources, executor, session)
+
+        return self.__combine(cidrs)
+
+    def fetch_many(
+        self, snapshots: Iterable[Tuple[str, Dict[str, str]]]
+    ) -> Iterator[Tuple[str, Dict[str, Dict[str, Set]]]]:
+        # One session and pool compile all snapshots, so workers are spawned once.
+        with self.__session() as session, self.__executor() as executor:
+            for snapshot, sources in snapshots:
+                self.__logger.info(f"Compiling {snapshot} snapshot.")
+
+                with self.__stats.labelled({"snapshot": snapshot}):
+                    if self.__workers > 1:
+                        cidrs = self.__convert_to_cidrs(sources, executor, None)
+                        combined = self.__combine(cidrs, executor)
+                    else:
+                        cidrs = self.__convert_to_cidrs(sources, executor, session)
+                        combined = self.__combine(cidrs)
+
+                yield snapshot, combined
+
+    def compile(
+        self, registry: str, source: str, session: requests.Session | None = None
+    ) -> Dict[str, Dict[str, Set]] | None:
+        with self.__stats.stage("convert", {"registry": registry}) as stage:
+            if session is not None:
+                return self.__convert_one(
+                    registry, self.__lines(registry, source, session, stage), stage
+                )
+
+            with self.__session() as session:
+                return self.__convert_one(
+                    registry, self.__lines(registry, source, session, stage), stage
+                )
+
+    def __fetch_parallel(self, sources: Dict[str, str]):
+        with self.__executor() as pool:
+            cidrs = self.__convert_to_cidrs(sources, pool, None)
 
-        merged = self.__merge_cidrs(cidrs)
+            return self.__combine(cidrs, pool)
 
-        return merged
+    def __executor(self) -> Executor:
+        if self.__workers == 1:
+            return ThreadPoolExecutor(max_workers=self.__concurrency)
 
-    def __fetch(self) -> Dict[str, List[str]]:
+        self.__logger.info(f"Compiling CIDRs with {self.__workers} workers.")
+
+        return ProcessPoolExecutor(
+            max_workers=self.__workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def __fetch(
+        self, session: requests.Session, executor: ThreadPoolExecutor
+    ) -> Dict[str, str]:
         sources = RIRS
 
-        data = {}
-        for registry, url in sources.items():
-            try:
-                self.__logger.info(
-                    f"Pulling IP ranges from {registry}.", extra={"registry": registry}
+        # Sources other than the RIRs are read as they are, without the cache.
+        if self.__sources is not None:
+            return dict(self.__sources)
+
+        if self.__cache is None:
+            return dict(sources)
+
+        started = time.perf_counter()
+
+        with self.__stats.stage("download") as stage:
+            futures = {
+                registry: executor.submit(
+                    self.__fetch_one, session, registry, url, stage
                 )
-                response = requests.get(
-                    url,
-                    timeout=30,
-                    proxies=({"http": self.__proxy} if self.__proxy else None),
+                for registry, url in sources.items()
+            }
+
+            data = {}
+            for registry, future in futures.items():
+                path = future.result()
+                if path is not None:
+                    data[registry] = path
+
+            stage.add(records_in=len(sources), records_out=len(data))
+
+        self.__logger.info(
+            f"Pulled {len(data)}/{len(sources)} RIRs in {time.perf_counter() - started:.2f}s."
+        )
+
+        return data
+
+    def __fetch_one(
+        self,
+        session: requests.Session,
+        registry: str,
+        url: str,
+        total: cidr_stats.StageStats,
+    ) -> str | None:
+        started = time.perf_counter()
+
+        try:
+            self.__logger.info(
+                f"Pulling IP ranges from {registry}.", extra={"registry": registry}
+            )
+
+            with self.__stats.stage("download", {"registry": registry}) as stage:
+                self.__fetch_cached(session, registry, url, stage)
+
+            total.add(transferred=stage.bytes)
+        except requests.RequestException:
+            if self.__cache.exists(registry):
+                self.__logger.exception(
+                    f"Error pulling {registry} data. Using cached copy.",
+                    extra={"registry": registry},
                 )
+                return str(self.__cache.path(registry))
+
+            self.__logger.exception(
+                f"Error pulling {registry} data.", extra={"registry": registry}
+            )
+            return None
+
+        elapsed = time.perf_counter() - started
+        self.__logger.info(
+            f"Pulled {registry} in {elapsed:.2f}s.",
+            extra={"registry": registry, "elapsed": elapsed},
+        )
+
+        return str(self.__cache.path(registry))
+
+    def __lines(
+        self,
+        registry: str,
+        source: str,
+        session: requests.Session,
+        stage: cidr_stats.StageStats,
+    ) -> Iterator[str]:
+        if rir_sources.is_remote(source):
+            return self.__stream(session, registry, source, stage)
+
+        return self.__read(rir_sources.local_path(source), stage)
+
+    def __stream(
+        self,
+        session: requests.Session,
+        registry: str,
+        url: str,
+        stage: cidr_stats.StageStats,
+    ) -> Iterator[str]:
+        self.__logger.info(
+            f"Pulling IP ranges from {registry}.", extra={"registry": registry}
+        )
+
+        transferred = 0
+        try:
+            with session.get(url, timeout=self.__timeout, stream=True) as response:
                 response.raise_for_status()
-                data[registry] = response.text.splitlines()
-            except requests.RequestException as e:
-                self.__logger.exception(
-                    f"Error pulling {registry} data.", extra={"registry": registry}
+
+                for line in response.iter_lines(chunk_size=CHUNK_SIZE):
+                    transferred += len(line) + 1
+                    yield line.decode("utf-8", errors="replace")
+        finally:
+            stage.add(transferred=transferred)
+
+    def __fetch_cached(
+        self,
+        session: requests.Session,
+        registry: str,
+        url: str,
+        stage: cidr_stats.StageStats,
+    ):
+        with session.get(
+            url,
+            timeout=self.__timeout,
+            headers=self.__cache.headers(registry),
+            stream=True,
+        ) as response:
+            if response.status_code == 304:
+                self.__logger.info(
+                    f"{registry} is not modified since the last pull.",
+                    extra={"registry": registry},
                 )
+                return
 
-        return data
+            response.raise_for_status()
+
+            changed = self.__cache.save(
+                registry,
+                url,
+                self.__counted(response.iter_content(chunk_size=CHUNK_SIZE), stage),
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+
+        if not changed:
+            self.__logger.info(
+                f"{registry} content is unchanged since the last pull.",
+                extra={"registry": registry},
+            )
+
+    def __counted(
+        self, chunks: Iterable[bytes], stage: cidr_stats.StageStats
+    ) -> Iterator[bytes]:
+        transferred = 0
+        try:
+            for chunk in chunks:
+                transferred += len(chunk)
+                yield chunk
+        finally:
+            stage.add(transferred=transferred)
+
+    def __read(self, path: str, stage: cidr_stats.StageStats) -> Iterator[str]:
+        transferred = 0
+        try:
+            with rir_sources.open_text(path) as f:
+                for line in f:
+                    transferred += len(line)
+                    yield line.rstrip("\r\n")
+        finally:
+            stage.add(transferred=transferred)
+
+    def __session(self) -> requests.Session:
+        retry = Retry(
+            total=self.__retries,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.__concurrency,
+            pool_maxsize=self.__concurrency,
+            max_retries=retry,
+        )
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        if self.__proxy:
+            session.proxies = {"http": self.__proxy}
+
+        return session
 
     def __convert_to_cidrs(
-        self, data: Dict[str, List[str]]
+        self,
+        sources: Dict[str, str],
+        executor: Executor,
+        session: requests.Session | None,
     ) -> Dict[str, Dict[str, Set]]:
 
         self.__logger.info("Compliling pulled IP ranges into CIDRs.")
 
+        started = time.perf_counter()
+
+        scheduled = self.__largest_first(
+            sources.items(),
+            lambda item: os.path.getsize(item[1]) if os.path.isfile(item[1]) else 0,
+        )
+
+        with self.__stats.stage("convert") as stage:
+            futures = {
+                registry: executor.submit(self.compile, registry, source, session)
+                for registry, source in scheduled
+            }
+
+            country_cidrs = collections.defaultdict(
+                lambda: {"ipv4": set(), "ipv6": set()}
+            )
+
+            compiled = 0
+            for registry in sources:
+                registry_cidrs = futures[registry].result()
+                if registry_cidrs is None:
+                    continue
+
+                compiled += 1
+                for cc, networks in registry_cidrs.items():
+                    country_cidrs[cc]["ipv4"].update(networks["ipv4"])
+                    country_cidrs[cc]["ipv6"].update(networks["ipv6"])
+
+            stage.add(
+                records_in=len(sources),
+                records_out=cidr_stats.count_cidrs(country_cidrs),
+                transferred=sum(
+                    os.path.getsize(source)
+                    for source in sources.values()
+                    if os.path.isfile(source)
+                ),
+            )
+
+        self.__logger.info(
+            f"Compiled {compiled}/{len(sources)} RIRs in {time.perf_counter() - started:.2f}s."
+        )
+
+        return country_cidrs
+
+    def __convert_one(
+        self, registry: str, lines: Iterable[str], stage: cidr_stats.StageStats
+    ) -> Dict[str, Dict[str, Set]] | None:
+        started = time.perf_counter()
+
         country_cidrs = collections.defaultdict(lambda: {"ipv4": set(), "ipv6": set()})
 
-        for _, lines in data.items():
-            for line in lines:
+        records = 0
+        try:
+            for records, line in enumerate(lines, 1):
                 parts = line.split("|")
                 if len(parts) < 7:
                     continue
@@ -76,36 +383,167 @@ class RirFetcher:
                 if status != "allocated" and status != "assigned":
                     continue
 
-                try:
-                    count = int(value)
-                    start_ip_obj = ipaddress.ip_address(start_ip)
-                    end_ip_obj = ipaddress.ip_address(int(start_ip_obj) + count - 1)
+                if ip_version != "ipv4" and ip_version != "ipv6":
+                    continue
 
-                    cidr_blocks = netaddr.iprange_to_cidrs(
-                        str(start_ip_obj),
-                        str(end_ip_obj),
+                try:
+                    cidr_blocks = cidr_ranges.range_to_cidrs(
+                        cidr_ranges.parse_ip(start_ip, ip_version),
+                        int(value),
+                        ip_version,
                     )
-
-                    if ip_version == "ipv4":
-                        country_cidrs[cc]["ipv4"].update(cidr_blocks)
-                    elif ip_version == "ipv6":
-                        country_cidrs[cc]["ipv6"].update(cidr_blocks)
                 except ValueError:
                     continue
 
-        return country_cidrs
+                country_cidrs[cc][ip_version].update(cidr_blocks)
+        except requests.RequestException:
+            self.__logger.exception(
+                f"Error pulling {registry} data.", extra={"registry": registry}
+            )
+            return None
+        finally:
+            stage.add(records_in=records)
+
+        stage.add(records_out=cidr_stats.count_cidrs(country_cidrs))
+
+        elapsed = time.perf_counter() - started
+        self.__logger.info(
+            f"Compiled {registry} in {elapsed:.2f}s.",
+            extra={"registry": registry, "elapsed": elapsed},
+        )
+
+        return dict(country_cidrs)
+
+    def __combine(
+        self, cidrs: Dict[str, Dict[str, Set]], executor: Executor | None = None
+    ) -> Dict[str, Dict[str, Set]]:
+        if self.__is_aggregating():
+            name, combine = "aggregate", self.__aggregate_cidrs
+        elif self.__merge:
+            name, combine = "merge", self.__merge_cidrs
+        else:
+            return cidrs
+
+        with self.__stats.stage(name) as stage:
+            combined = combine(cidrs, executor)
+            stage.add(
+                records_in=cidr_stats.count_cidrs(cidrs),
+                records_out=cidr_stats.count_cidrs(combined),
+            )
+
+        return combined
 
     def __merge_cidrs(
-        self, cidrs: Dict[str, Dict[str, Set]]
+        self, cidrs: Dict[str, Dict[str, Set]], executor: Executor | None = None
     ) -> Dict[str, Dict[str, Set]]:
         self.__logger.info("Merging compiled CIDRs.")
 
-        merged_cidrs = {}
+        if executor is None:
+            merged_cidrs = {}
+
+            for cc, networks in cidrs.items():
+                merged_cidrs[cc] = {
+                    "ipv4": cidr_ranges.merge_cidrs(networks["ipv4"], "ipv4"),
+                    "ipv6": cidr_ranges.merge_cidrs(networks["ipv6"], "ipv6"),
+                }
+
+            return merged_cidrs
+
+        scheduled = self.__schedule(cidrs)
+
+        futures = {
+            (cc, ip_version): executor.submit(
+                cidr_ranges.merge_cidrs, cidrs[cc][ip_version], ip_version
+            )
+            for cc, ip_version in scheduled
+        }
+
+        return {
+            cc: {
+                "ipv4": futures[(cc, "ipv4")].result(),
+                "ipv6": futures[(cc, "ipv6")].result(),
+            }
+            for cc in cidrs
+        }
+
+    def __schedule(self, cidrs: Dict[str, Dict[str, Set]]) -> List[Tuple[str, str]]:
+        return self.__largest_first(
+            ((cc, ip_version) for cc in cidrs for ip_version in ["ipv4", "ipv6"]),
+            lambda job: len(cidrs[job[0]][job[1]]),
+        )
+
+    # Largest jobs first, so the long tail doesn't leave workers idle.
+    def __largest_first(
+        self, jobs: Iterable[Tuple[str, str]], size: Callable[[Tuple[str, str]], int]
+    ) -> List[Tuple[str, str]]:
+        return sorted(jobs, key=lambda job: (-size(job), job))
+
+    def __is_aggregating(self) -> bool:
+        return self.__max_cidrs is not None or self.__max_overcoverage is not None
+
+    def __aggregate_cidrs(
+        self, cidrs: Dict[str, Dict[str, Set]], executor: Executor | None = None
+    ) -> Dict[str, Dict[str, Set]]:
+        self.__logger.info(
+            f"Aggregating compiled CIDRs to at most {self.__max_cidrs or 'any'} CIDRs "
+            f"and {self.__max_overcoverage if self.__max_overcoverage is not None else 'any'} "
+            "over-coverage per country."
+        )
+
+        started = time.perf_counter()
+
+        scheduled = self.__schedule(cidrs)
 
-        for cc, networks in cidrs.items():
-            merged_cidrs[cc] = {
-                "ipv4": sorted(netaddr.IPSet(networks["ipv4"]).iter_cidrs()),
-                "ipv6": sorted(netaddr.IPSet(networks["ipv6"]).iter_cidrs()),
+        if executor is None:
+            results = {
+                (cc, ip_version): cidr_aggregator.aggregate_cidrs(
+                    cidrs[cc][ip_version],
+                    ip_version,
+                    self.__max_cidrs,
+                    self.__max_overcoverage,
+                )
+                for cc, ip_version in scheduled
             }
+        else:
+            futures = {
+                (cc, ip_version): executor.submit(
+                    cidr_aggregator.aggregate_cidrs,
+                    cidrs[cc][ip_version],
+                    ip_version,
+                    self.__max_cidrs,
+                    self.__max_overcoverage,
+                )
+                for cc, ip_version in scheduled
+            }
+            results = {key: future.result() for key, future in futures.items()}
+
+        aggregated = {}
+        extra = {"ipv4": 0, "ipv6": 0}
+        for cc in cidrs:
+            aggregated[cc] = {}
+
+            for ip_version in ["ipv4", "ipv6"]:
+                networks, extra_addresses = results[(cc, ip_version)]
+                aggregated[cc][ip_version] = networks
+                extra[ip_version] += extra_addresses
+
+                if extra_addresses:
+                    self.__logger.info(
+                        f"{cc} ({ip_version}): Aggregated into {len(networks)} CIDRs "
+                        f"covering {extra_addresses} extra addresses.",
+                        extra={"country": cc, "extra_addresses": extra_addresses},
+                    )
+
+                if self.__max_cidrs is not None and len(networks) > self.__max_cidrs:
+                    self.__logger.warning(
+                        f"{cc} ({ip_version}): {len(networks)} CIDRs exceed the budget of "
+                        f"{self.__max_cidrs} within the allowed over-coverage.",
+                        extra={"country": cc},
+                    )
+
+        self.__logger.info(
+            f"Aggregated CIDRs in {time.perf_counter() - started:.2f}s, covering "
+            f"{extra['ipv4']} extra IPv4 and {extra['ipv6']} extra IPv6 addresses."
+        )
 
-        return merged_cidrs
+        return aggregated
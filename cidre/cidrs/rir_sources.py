@@ -0,0 +1,162 @@
+import re
+import bz2
+import gzip
+import lzma
+import logging
+
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+from typing import Dict, Iterable, List, TextIO
+
+ARCHIVE_PATTERN = re.compile(
+    r"^delegated-(?P<registry>[a-z]+)-extended-(?P<date>\d{8}|latest)"
+    r"(?:\.(?:gz|bz2|xz))?$"
+)
+
+# Archives are recognized by their magic bytes rather than their suffix.
+COMPRESSIONS = {
+    b"\x1f\x8b": gzip.open,
+    b"BZh": bz2.open,
+    b"\xfd7zXZ\x00": lzma.open,
+}
+
+
+def is_remote(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def local_path(source: str) -> str:
+    if source.startswith("file://"):
+        return unquote(urlparse(source).path)
+
+    return source
+
+
+def open_text(path: str) -> TextIO:
+    with open(path, "rb") as f:
+        magic = f.read(6)
+
+    # Compressed files are decompressed while they are read, never inflated.
+    for prefix, opener in COMPRESSIONS.items():
+        if magic.startswith(prefix):
+            return opener(path, "rt", encoding="utf-8", errors="replace")
+
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+class FsRirSources:
+    def __init__(self, locations: List[str], registries: Iterable[str]):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__registries = list(registries)
+        self.__pinned: Dict[str, str] = {}
+        self.__latest: Dict[str, str] = {}
+        self.__archives: Dict[str, Dict[str, str]] = {
+            registry: {} for registry in self.__registries
+        }
+
+        for location in locations:
+            self.__add(location)
+
+    def latest(self) -> Dict[str, str]:
+        sources = {}
+
+        for registry in self.__registries:
+            archives = self.__archives[registry]
+
+            if registry in self.__pinned:
+                sources[registry] = self.__pinned[registry]
+            elif registry in self.__latest:
+                sources[registry] = self.__latest[registry]
+            elif archives:
+                sources[registry] = archives[max(archives)]
+            else:
+                self.__logger.warning(
+                    f"No {registry} source found.", extra={"registry": registry}
+                )
+
+        return sources
+
+    def snapshot(self, date: str) -> Dict[str, str]:
+        sources = {}
+
+        for registry in self.__registries:
+            if registry in self.__pinned:
+                sources[registry] = self.__pinned[registry]
+                continue
+
+            # RIRs skip days now and then, the last archive before is used instead.
+            archives = self.__archives[registry]
+            dates = [archive for archive in archives if archive <= date]
+
+            if not dates:
+                self.__logger.warning(
+                    f"No {registry} archive found on or before {date}.",
+                    extra={"registry": registry},
+                )
+                continue
+
+            sources[registry] = archives[max(dates)]
+
+        return sources
+
+    def dates(self, since: str | None = None, until: str | None = None) -> List[str]:
+        return sorted(
+            {
+                date
+                for archives in self.__archives.values()
+                for date in archives
+                if (since is None or date >= since) and (until is None or date <= until)
+            }
+        )
+
+    def __add(self, location: str):
+        registry, separator, source = location.partition("=")
+
+        if separator and re.fullmatch(r"[a-z]+", registry):
+            if registry not in self.__archives:
+                raise ValueError(
+                    f"Unknown RIR {registry}. Choose from {', '.join(self.__registries)}."
+                )
+
+            self.__pinned[registry] = self.__resolve(source)
+            return
+
+        path = Path(local_path(location))
+
+        if path.is_dir():
+            indexed = 0
+            for file in sorted(path.rglob("delegated-*")):
+                indexed += self.__index(file)
+
+            self.__logger.info(f"Indexed {indexed} RIR files in {path}.")
+            return
+
+        if not path.is_file():
+            raise FileNotFoundError(f"RIR source {location} not found.")
+
+        if not self.__index(path):
+            raise ValueError(
+                f"Can't tell the RIR of {location}. Pass it as RIR={location} instead."
+            )
+
+    def __index(self, file: Path) -> bool:
+        match = ARCHIVE_PATTERN.match(file.name)
+        if not match or match["registry"] not in self.__archives or not file.is_file():
+            return False
+
+        if match["date"] == "latest":
+            self.__latest[match["registry"]] = str(file)
+        else:
+            self.__archives[match["registry"]][match["date"]] = str(file)
+
+        return True
+
+    def __resolve(self, source: str) -> str:
+        if is_remote(source):
+            return source
+
+        path = local_path(source)
+        if not Path(path).is_file():
+            raise FileNotFoundError(f"RIR source {source} not found.")
+
+        return path
@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 
+import os
+import sys
 import argparse
 import logging
 
 from cidre import (
     rir_fetcher,
+    rir_cache,
     cidr_store,
     countries,
     ufw_firewall,
     iptables_firewall,
+    nftables_firewall,
     cidr_counter,
+    cidr_lookup,
+    cidr_classifier,
+    cidr_server,
+    cidr_complement,
+    cidr_ranges,
+    cidr_stats,
+    rir_sources,
+    cidr_history,
 )
 
+from datetime import datetime, timezone
 from typing import List, Dict
 from enum import Enum
 
@@ -19,6 +32,7 @@ from enum import Enum
 class Firewall(str, Enum):
     UFW = "ufw"
     IPTABLES = "iptables"
+    NFTABLES = "nftables"
 
 
 def country_code(value: str):
@@ -30,12 +44,156 @@ def country_code(value: str):
     return value
 
 
-def pull(merge: bool, proxy: str | None, store: str) -> bool:
+def snapshot_date(value: str):
+    try:
+        datetime.strptime(value, "%Y%m%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Invalid date: {value}. Use YYYYMMDD, e.g. 20250101."
+        )
+    return value
+
+
+def snapshot_dates(value: str):
+    since, separator, until = value.partition(":")
+    if not separator:
+        raise argparse.ArgumentTypeError(
+            f"Invalid dates: {value}. Use FROM:TO, e.g. 20250101:20251231."
+        )
+
+    for date in [since, until]:
+        if date:
+            snapshot_date(date)
+
+    return since or None, until or None
+
+
+def pull(
+    merge: bool,
+    proxy: str | None,
+    store: str,
+    concurrency: int = len(rir_fetcher.RIRS),
+    timeout: float = 30,
+    retries: int = 3,
+    cache_dir: str | None = None,
+    workers: int = 1,
+    swap: bool = False,
+    max_cidrs: int | None = None,
+    max_overcoverage: float | None = None,
+    stats: cidr_stats.CidrStats | None = None,
+    sources: List[str] | None = None,
+    date: str | None = None,
+    dates: tuple | None = None,
+    history_dir: str | None = None,
+    checkpoint_interval: int = cidr_history.CHECKPOINT_INTERVAL,
+) -> bool:
 
     try:
-        cidrs = rir_fetcher.RirFetcher(merge, proxy).fetch()
+        logger = logging.getLogger(__name__)
+
+        rir = None
+        if sources:
+            try:
+                rir = rir_sources.FsRirSources(sources, rir_fetcher.RIRS.keys())
+            except (ValueError, OSError) as error:
+                logger.error(f"Error: {error}")
+                return False
+
+            if cache_dir:
+                logger.warning("Sources are read as they are, ignoring --cache-dir.")
+                cache_dir = None
+
+            selected = rir.snapshot(date) if date else rir.latest()
+            if not selected and dates is None:
+                logger.error("Error: No RIR files found in the sources.")
+                return False
+        elif date or dates:
+            logger.error("Error: --date and --dates pick archives from --source.")
+            return False
+
+        cache = (
+            rir_cache.FsRirCache(
+                cache_dir,
+                fingerprint={
+                    "merge": merge,
+                    "store": store,
+                    "max_cidrs": max_cidrs,
+                    "max_overcoverage": max_overcoverage,
+                },
+            )
+            if cache_dir
+            else None
+        )
+
+        history = (
+            cidr_history.FsCidrHistory(history_dir, checkpoint_interval)
+            if history_dir
+            else None
+        )
 
-        cidr_store.FsCidrStore(store).save(cidrs)
+        fetcher = rir_fetcher.RirFetcher(
+            merge,
+            proxy,
+            concurrency=concurrency,
+            timeout=timeout,
+            retries=retries,
+            cache=cache,
+            workers=workers,
+            max_cidrs=max_cidrs,
+            max_overcoverage=max_overcoverage,
+            stats=stats,
+            sources=selected if rir else None,
+        )
+
+        if dates is not None:
+            snapshots = rir.dates(*dates)
+            if not snapshots:
+                logger.error("Error: No RIR archives found for the dates.")
+                return False
+
+            if stats is None:
+                stats = cidr_stats.CidrStats()
+
+            if history is None:
+                logger.info(f"Compiling {len(snapshots)} snapshots into {store}/*.")
+            else:
+                logger.info(f"Compiling {len(snapshots)} snapshots into {history_dir}.")
+
+            for snapshot, cidrs in fetcher.fetch_many(
+                (snapshot, rir.snapshot(snapshot)) for snapshot in snapshots
+            ):
+                if history is None:
+                    with stats.labelled({"snapshot": snapshot}):
+                        cidr_store.FsCidrStore(
+                            os.path.join(store, snapshot), workers=workers, stats=stats
+                        ).save(cidrs)
+                elif not record(history, snapshot, cidrs):
+                    return False
+
+            # The store keeps the latest snapshot, the history keeps the rest.
+            if history is not None:
+                cidr_store.FsCidrStore(
+                    store, workers=workers, swap=swap, stats=stats
+                ).save(cidrs)
+
+            return True
+
+        cidrs = fetcher.fetch()
+
+        if cidrs is None:
+            return True
+
+        cidr_store.FsCidrStore(store, workers=workers, swap=swap, stats=stats).save(
+            cidrs
+        )
+
+        if history is not None:
+            snapshot = date or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            if not record(history, snapshot, cidrs):
+                return False
+
+        if cache is not None:
+            cache.commit(rir_fetcher.RIRS.keys())
 
         return True
     except:
@@ -47,9 +205,49 @@ def pull(merge: bool, proxy: str | None, store: str) -> bool:
         return False
 
 
-def count(country_codes: List[str], store: str) -> Dict[str, Dict[str, int]]:
+def record(history: cidr_history.FsCidrHistory, snapshot: str, cidrs: Dict) -> bool:
+    try:
+        history.record(snapshot, cidrs)
+
+        return True
+    except ValueError as error:
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error: {error}")
+        logger.error("Snapshots are recorded oldest first.")
+
+        return False
+
+
+def diff(
+    since: str, until: str, country_codes: List[str], history_dir: str
+) -> Dict[str, Dict[str, Dict[str, List]]] | None:
     try:
-        return cidr_counter.CidrCounter(store).count(
+        history = cidr_history.FsCidrHistory(history_dir)
+
+        for snapshot in [since, until]:
+            if history.resolve(snapshot) is None:
+                logger = logging.getLogger(__name__)
+                logger.error(f"Error: No snapshot recorded on or before {snapshot}.")
+                logger.error(
+                    "You can record them with: `cidre cidr pull --history-dir`"
+                )
+                return None
+
+        return history.diff(since, until, country_codes or None)
+    except:
+        logger = logging.getLogger(__name__)
+        logger.exception(
+            "Yikes! Unhandled exception. Shame on us! File ticket: https://github.com/vulnebify/cidre/issues/new"
+        )
+
+        return None
+
+
+def count(
+    country_codes: List[str], store: str, stats: cidr_stats.CidrStats | None = None
+) -> Dict[str, Dict[str, int]]:
+    try:
+        return cidr_counter.CidrCounter(store, stats).count(
             country_codes or countries.ISO_3166_1_ALPHA_2_CODES
         )
     except:
@@ -61,17 +259,139 @@ def count(country_codes: List[str], store: str) -> Dict[str, Dict[str, int]]:
         return {}
 
 
-def apply(firewall: Firewall, action: str, countries: List[str], store: str) -> bool:
+def lookup(ips: List[str], store: str) -> Dict[str, str | None]:
+    try:
+        index = cidr_lookup.CidrLookup.load(store)
+
+        results = {}
+        for ip in ips:
+            try:
+                results[ip] = index.lookup(ip)
+            except ValueError:
+                results[ip] = None
+
+        return results
+    except:
+        logger = logging.getLogger(__name__)
+        logger.exception(
+            "Yikes! Unhandled exception. Shame on us! File ticket: https://github.com/vulnebify/cidre/issues/new"
+        )
+
+        return {}
+
+
+def classify(paths: List[str], store: str, batch_size: int) -> bool:
     try:
+        classifier = cidr_classifier.CidrClassifier(
+            cidr_lookup.CidrLookup.load(store), batch_size
+        )
+
+        sys.stdout.writelines(
+            f"{ip},{country or ''}\n"
+            for ip, country in classifier.classify(cidr_classifier.read_lines(paths))
+        )
+        sys.stdout.flush()
+
+        return True
+    except BrokenPipeError:
+        return True
+    except:
+        logger = logging.getLogger(__name__)
+        logger.exception(
+            "Yikes! Unhandled exception. Shame on us! File ticket: https://github.com/vulnebify/cidre/issues/new"
+        )
+
+        return False
+
+
+def complement(countries: List[str], store: str) -> Dict[str, Dict[str, List]] | None:
+    try:
+        return cidr_complement.CidrComplement(store).compile(countries)
+    except:
+        logger = logging.getLogger(__name__)
+        logger.exception(
+            "Yikes! Unhandled exception. Shame on us! File ticket: https://github.com/vulnebify/cidre/issues/new"
+        )
+
+        return None
+
+
+def serve(store: str, socket_path: str, reload_interval: float) -> bool:
+    try:
+        cidr_server.CidrServer(store, socket_path, reload_interval).serve()
+
+        return True
+    except KeyboardInterrupt:
+        return True
+    except:
+        logger = logging.getLogger(__name__)
+        logger.exception(
+            "Yikes! Unhandled exception. Shame on us! File ticket: https://github.com/vulnebify/cidre/issues/new"
+        )
+
+        return False
+
+
+def apply(
+    firewall: Firewall,
+    action: str,
+    countries: List[str],
+    store: str,
+    state: str | None = None,
+    full: bool = False,
+    bulk: bool = False,
+    dry_run: str | None = None,
+    drop_rest: bool = False,
+    combined: bool = False,
+    stats: cidr_stats.CidrStats | None = None,
+) -> bool:
+    try:
+        if dry_run and firewall != Firewall.NFTABLES:
+            logger = logging.getLogger(__name__)
+            logger.error(f"Error: {firewall.value} can't write a dry run.")
+            logger.error("Use it with: `--firewall nftables`")
+            return False
+
+        if bulk and firewall != Firewall.UFW:
+            logger = logging.getLogger(__name__)
+            logger.error(f"Error: {firewall.value} can't write rules in bulk.")
+            logger.error("Use it with: `--firewall ufw`")
+            return False
+
+        if combined and firewall != Firewall.IPTABLES:
+            logger = logging.getLogger(__name__)
+            logger.error(
+                f"Error: {firewall.value} can't combine countries into one set."
+            )
+            logger.error("Use it with: `--firewall iptables`")
+            return False
+
         if firewall == Firewall.UFW:
-            ufw = ufw_firewall.UfwFirewall(store)
+            if drop_rest:
+                logger = logging.getLogger(__name__)
+                logger.error("Error: UFW can't drop the rest of the address space.")
+                logger.error(
+                    "Use it with: `--firewall iptables` or `--firewall nftables`"
+                )
+                return False
+
+            ufw = ufw_firewall.UfwFirewall(store, state, full, bulk, stats=stats)
 
             return ufw.apply(action, countries)
 
         if firewall == Firewall.IPTABLES:
-            iptables = iptables_firewall.IpTablesFirewall(store)
+            iptables = iptables_firewall.IpTablesFirewall(
+                store, state, full, drop_rest, combined, stats
+            )
 
             return iptables.apply(action, countries)
+
+        if firewall == Firewall.NFTABLES:
+            nftables = nftables_firewall.NftablesFirewall(
+                store, dry_run, drop_rest, stats, state
+            )
+
+            return nftables.apply(action, countries)
     except:
         logger = logging.getLogger(__name__)
         logger.exception(
@@ -81,6 +401,32 @@ def apply(firewall: Firewall, action: str, countries: List[str], store: str) ->
         return False
 
 
+def write_stats(stats: cidr_stats.CidrStats, format: str, output: str | None):
+    try:
+        stats.write(format, output)
+    except OSError:
+        logger = logging.getLogger(__name__)
+        logger.exception(f"Error writing stats to {output}.")
+
+
+def add_stats_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "-st",
+        "--stats",
+        choices=cidr_stats.STATS_FORMATS,
+        help="Report duration, records, peak RSS and bytes of every stage. Optional.",
+    )
+    parser.add_argument(
+        "-so",
+        "--stats-output",
+        dest="stats_output",
+        type=str,
+        metavar="FILE",
+        help="Write stats to FILE, e.g. a Prometheus textfile collector *.prom file. "
+        "Default: stderr.",
+    )
+
+
 def print_title(parser: argparse.ArgumentParser):
     print(
         r"""
@@ -106,6 +452,9 @@ def main():
     firewall_parser = subparsers.add_parser(
         "firewall", help="Choose from {accept, deny, reject}"
     )
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serves country lookups over a Unix socket"
+    )
 
     cidr_subcommand = cidr_parser.add_subparsers(dest="cidre_subcommand")
     firewall_subparser = firewall_parser.add_subparsers(dest="firewall_subcommand")
@@ -124,6 +473,61 @@ def main():
         type=str,
         help="The proxy to make requests RIRs",
     )
+    pull_parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=len(rir_fetcher.RIRS),
+        help=f"The amount of RIRs to pull concurrently. Default: {len(rir_fetcher.RIRS)}.",
+    )
+    pull_parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=30,
+        help="The timeout in seconds for each RIR request. Default: 30.",
+    )
+    pull_parser.add_argument(
+        "-r",
+        "--retries",
+        type=int,
+        default=3,
+        help="The amount of retries for each RIR request. Default: 3.",
+    )
+    pull_parser.add_argument(
+        "-cd",
+        "--cache-dir",
+        dest="cache_dir",
+        type=str,
+        help="The path to cache raw RIR files and skip pulls when RIRs are unchanged. Optional.",
+    )
+    pull_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="The amount of processes to compile and merge CIDRs and threads to save them. Default: 1.",
+    )
+    pull_parser.add_argument(
+        "-sw",
+        "--swap",
+        action="store_true",
+        help="Save CIDRs into a new directory and atomically flip the CIDR store symlink to it.",
+    )
+    pull_parser.add_argument(
+        "-mc",
+        "--max-cidrs",
+        dest="max_cidrs",
+        type=int,
+        help="Aggregate CIDRs into at most N supernets per country and IP version. Optional.",
+    )
+    pull_parser.add_argument(
+        "-mo",
+        "--max-overcoverage",
+        dest="max_overcoverage",
+        type=float,
+        help="The maximum ratio of extra addresses that aggregation may cover, e.g. 0.01. Optional.",
+    )
     pull_parser.add_argument(
         "-cs",
         "--cidr-store",
@@ -132,6 +536,48 @@ def main():
         default="./output/cidr",
         help="The path to store CIDRs. Default: './output/cidr'.",
     )
+    pull_parser.add_argument(
+        "-src",
+        "--source",
+        dest="sources",
+        action="append",
+        metavar="PATH",
+        help="Read RIR files from a directory of delegated-<rir>-extended-<date> archives, "
+        "a file or RIR=PATH instead of pulling them. Accepts file:// URLs and "
+        ".gz, .bz2 and .xz archives. Repeatable. Optional.",
+    )
+    pull_parser.add_argument(
+        "-d",
+        "--date",
+        type=snapshot_date,
+        help="Compile the archives of YYYYMMDD from --source. Default: the latest.",
+    )
+    pull_parser.add_argument(
+        "-ds",
+        "--dates",
+        type=snapshot_dates,
+        metavar="FROM:TO",
+        help="Compile every archived date from --source between YYYYMMDD:YYYYMMDD, "
+        "either one optional, into CIDR stores in the CIDR store path named by date.",
+    )
+    pull_parser.add_argument(
+        "-hd",
+        "--history-dir",
+        dest="history_dir",
+        type=str,
+        help="Record the pulled CIDRs as a snapshot of changes against the previous one. "
+        "With --dates, snapshots are recorded here instead of separate CIDR stores. Optional.",
+    )
+    pull_parser.add_argument(
+        "-ci",
+        "--checkpoint-interval",
+        dest="checkpoint_interval",
+        type=int,
+        default=cidr_history.CHECKPOINT_INTERVAL,
+        help="Store every Nth snapshot in full. "
+        f"Default: {cidr_history.CHECKPOINT_INTERVAL}.",
+    )
+    add_stats_arguments(pull_parser)
 
     count_parser = cidr_subcommand.add_parser("count", help="Counts amount of IPs")
 
@@ -150,6 +596,137 @@ def main():
         default="./output/cidr",
         help="The path to store CIDRs. Default: './output/cidr'.",
     )
+    add_stats_arguments(count_parser)
+
+    lookup_parser = cidr_subcommand.add_parser(
+        "lookup", help="Looks up countries of IP addresses"
+    )
+
+    lookup_parser.add_argument(
+        "ips",
+        nargs="+",
+        type=str,
+        help="The IPv4 or IPv6 addresses.",
+    )
+
+    lookup_parser.add_argument(
+        "-cs",
+        "--cidr-store",
+        dest="cidr_store",
+        type=str,
+        default="./output/cidr",
+        help="The path to store CIDRs. Default: './output/cidr'.",
+    )
+
+    classify_parser = cidr_subcommand.add_parser(
+        "classify",
+        help="Tags IP addresses from files or stdin with countries as 'ip,country' rows",
+    )
+
+    classify_parser.add_argument(
+        "files",
+        nargs="*",
+        type=str,
+        help="The files with an IP address at the start of each line. Default: stdin.",
+    )
+
+    classify_parser.add_argument(
+        "-cs",
+        "--cidr-store",
+        dest="cidr_store",
+        type=str,
+        default="./output/cidr",
+        help="The path to store CIDRs. Default: './output/cidr'.",
+    )
+
+    classify_parser.add_argument(
+        "-b",
+        "--batch-size",
+        dest="batch_size",
+        type=int,
+        default=cidr_classifier.BATCH_SIZE,
+        help=f"The number of lines resolved at once. Default: {cidr_classifier.BATCH_SIZE}.",
+    )
+
+    complement_parser = cidr_subcommand.add_parser(
+        "complement",
+        help="Prints minimal CIDRs of the address space outside of the countries",
+    )
+
+    complement_parser.add_argument(
+        "countries",
+        nargs="+",
+        type=country_code,
+        help="The countries (ISO 3166-1 alpha-2 code).",
+    )
+
+    complement_parser.add_argument(
+        "-cs",
+        "--cidr-store",
+        dest="cidr_store",
+        type=str,
+        default="./output/cidr",
+        help="The path to store CIDRs. Default: './output/cidr'.",
+    )
+
+    diff_parser = cidr_subcommand.add_parser(
+        "diff",
+        help="Prints CIDRs added and removed between two recorded snapshots",
+    )
+
+    diff_parser.add_argument(
+        "since",
+        type=str,
+        help="The snapshot to diff from: YYYYMMDD, a full snapshot name or 'latest'.",
+    )
+
+    diff_parser.add_argument(
+        "until",
+        type=str,
+        help="The snapshot to diff to: YYYYMMDD, a full snapshot name or 'latest'.",
+    )
+
+    diff_parser.add_argument(
+        "countries",
+        nargs="*",
+        type=country_code,
+        help="The countries (ISO 3166-1 alpha-2 code). Default: all.",
+    )
+
+    diff_parser.add_argument(
+        "-hd",
+        "--history-dir",
+        dest="history_dir",
+        type=str,
+        default="./output/history",
+        help="The path of recorded snapshots. Default: './output/history'.",
+    )
+
+    serve_parser.add_argument(
+        "-cs",
+        "--cidr-store",
+        dest="cidr_store",
+        type=str,
+        default="./output/cidr",
+        help="The path to store CIDRs. Default: './output/cidr'.",
+    )
+
+    serve_parser.add_argument(
+        "-s",
+        "--socket",
+        type=str,
+        default="./output/cidre.sock",
+        help="The path of the Unix socket. Default: './output/cidre.sock'.",
+    )
+
+    serve_parser.add_argument(
+        "-ri",
+        "--reload-interval",
+        dest="reload_interval",
+        type=float,
+        default=2.0,
+        help="The interval in seconds to check CIDRs for changes. Default: 2.",
+    )
 
     for action in ["allow", "deny", "reject"]:
         firewall_parser = firewall_subparser.add_parser(
@@ -168,7 +745,7 @@ def main():
             "-f",
             "--firewall",
             type=Firewall,
-            choices=[Firewall.UFW, Firewall.IPTABLES],
+            choices=[Firewall.UFW, Firewall.IPTABLES, Firewall.NFTABLES],
             default=Firewall.UFW,
             help="The firewall for adding rules. Default: 'ufw'.",
         )
@@ -182,10 +759,64 @@ def main():
             help="The path to store CIDRs. Default: './output/cidr'.",
         )
 
+        firewall_parser.add_argument(
+            "-sd",
+            "--state-dir",
+            dest="state_dir",
+            type=str,
+            help="The path to store applied CIDRs to push only changes on next runs. "
+            "Default: 'state' next to the CIDR store.",
+        )
+
+        firewall_parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Push all CIDRs regardless of the applied state.",
+        )
+
+        firewall_parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Write all UFW rules at once into its rules files and reload it once.",
+        )
+
+        firewall_parser.add_argument(
+            "--dry-run",
+            dest="dry_run",
+            type=str,
+            metavar="FILE",
+            help="Write the nftables ruleset to FILE instead of applying it.",
+        )
+
+        firewall_parser.add_argument(
+            "--combined",
+            action="store_true",
+            help="Load all countries into one IPSet per IP version, matched by one "
+            f"iptables rule in the {iptables_firewall.CIDRE_CHAIN} chain.",
+        )
+
+        add_stats_arguments(firewall_parser)
+
+        if action == "allow":
+            firewall_parser.add_argument(
+                "--drop-rest",
+                dest="drop_rest",
+                action="store_true",
+                help="Drop everything outside of the countries, except reserved ranges.",
+            )
+
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO, format="%(message)s")
 
+    stats = (
+        cidr_stats.CidrStats(
+            args.cidre_subcommand if args.command == "cidr" else args.command
+        )
+        if getattr(args, "stats", None)
+        else None
+    )
+
     if args.command == "cidr":
         if args.cidre_subcommand == "pull":
             is_merge_enabled = "enabled" if args.merge else "disabled"
@@ -193,7 +824,25 @@ def main():
                 f"💡 Pulling ranges from RIRs to compile CIDRs with {is_merge_enabled} merging...",
                 end="\n\n",
             )
-            success = pull(args.merge, args.proxy, args.cidr_store)
+            success = pull(
+                args.merge,
+                args.proxy,
+                args.cidr_store,
+                args.concurrency,
+                args.timeout,
+                args.retries,
+                args.cache_dir,
+                args.workers,
+                args.swap,
+                args.max_cidrs,
+                args.max_overcoverage,
+                stats,
+                args.sources,
+                args.date,
+                args.dates,
+                args.history_dir,
+                args.checkpoint_interval,
+            )
             print("")
 
             if success:
@@ -201,17 +850,65 @@ def main():
             else:
                 print("Oh no! Pulling failed ❌")
         elif args.cidre_subcommand == "count":
-            counter = count(args.countries, args.cidr_store)
-            total = 0
+            counter = count(args.countries, args.cidr_store, stats)
+            success = bool(counter)
+            total = {"ipv4": 0, "ipv6": 0}
 
             if counter:
                 for country, per_country in counter.items():
-                    print(f"{country}: {per_country}")
-                    total += per_country
+                    ipv4, ipv6 = per_country.get("ipv4", 0), per_country.get("ipv6", 0)
+                    print(f"{country}: {ipv4} IPv4, {ipv6} IPv6")
+                    total["ipv4"] += ipv4
+                    total["ipv6"] += ipv6
 
-                print(f"Total: {total}")
+                print(f"Total: {total['ipv4']} IPv4, {total['ipv6']} IPv6")
             else:
                 print("Oh no! Counting failed ❌")
+        elif args.cidre_subcommand == "lookup":
+            results = lookup(args.ips, args.cidr_store)
+
+            if results:
+                for ip, country in results.items():
+                    print(f"{ip}: {country or 'unknown'}")
+            else:
+                print("Oh no! Looking up failed ❌")
+        elif args.cidre_subcommand == "complement":
+            compiled = complement(args.countries, args.cidr_store)
+
+            if compiled is not None:
+                for ip_version in ["ipv4", "ipv6"]:
+                    for start, prefixlen in compiled["drop"][ip_version]:
+                        print(cidr_ranges.format_cidr(start, prefixlen, ip_version))
+            else:
+                print("Oh no! Complementing failed ❌", file=sys.stderr)
+        elif args.cidre_subcommand == "diff":
+            changes = diff(args.since, args.until, args.countries, args.history_dir)
+
+            if changes is not None:
+                total = {"added": 0, "removed": 0}
+
+                for country, per_country in changes.items():
+                    for ip_version, per_version in per_country.items():
+                        for change, sign in [("added", "+"), ("removed", "-")]:
+                            cidrs = cidr_ranges.intervals_to_cidrs(
+                                per_version[change], ip_version
+                            )
+                            total[change] += len(cidrs)
+
+                            for start, prefixlen in cidrs:
+                                cidr = cidr_ranges.format_cidr(
+                                    start, prefixlen, ip_version
+                                )
+                                print(f"{sign} {country} {cidr}")
+
+                print(
+                    f"Total: {total['added']} added, {total['removed']} removed CIDRs"
+                )
+            else:
+                print("Oh no! Diffing failed ❌", file=sys.stderr)
+        elif args.cidre_subcommand == "classify":
+            if not classify(args.files, args.cidr_store, args.batch_size):
+                print("Oh no! Classifying failed ❌", file=sys.stderr)
         else:
             print_title(cidr_parser)
     elif args.command == "firewall":
@@ -221,8 +918,21 @@ def main():
                 f"💡 Applying '{args.firewall_subcommand}' action to '{args.firewall.value}' firewall for {joined_countries} countries...",
                 end="\n\n",
             )
+            state_dir = args.state_dir or os.path.join(
+                os.path.dirname(os.path.normpath(args.cidr_store)), "state"
+            )
             success = apply(
-                args.firewall, args.firewall_subcommand, args.countries, args.cidr_store
+                args.firewall,
+                args.firewall_subcommand,
+                args.countries,
+                args.cidr_store,
+                state_dir,
+                args.full,
+                args.bulk,
+                args.dry_run,
+                getattr(args, "drop_rest", False),
+                args.combined,
+                stats,
             )
             print("")
 
@@ -234,9 +944,21 @@ def main():
             print("")
         else:
             print_title(firewall_parser)
+    elif args.command == "serve":
+        print(
+            f"💡 Serving lookups from {args.cidr_store} on {args.socket}...",
+            end="\n\n",
+        )
+
+        if not serve(args.cidr_store, args.socket, args.reload_interval):
+            print("Oh no! Serving failed ❌")
     else:
         print_title(parser)
 
+    if stats is not None:
+        stats.success = success
+        write_stats(stats, args.stats, args.stats_output)
+
 
 if __name__ == "__main__":
     main()
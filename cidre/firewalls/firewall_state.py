@@ -0,0 +1,59 @@
+import os
+import logging
+
+from pathlib import Path
+from typing import Iterable, List, Set, Tuple
+
+
+class FsFirewallState:
+    def __init__(self, base_folder: str, backend: str):
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__base_path = Path(base_folder) / backend
+
+    def load(self, action: str, country_code: str, ip_version: str) -> Set[str] | None:
+        state_file = self.__path(action, country_code, ip_version)
+
+        if not state_file.exists():
+            return None
+
+        with open(state_file, "r") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def countries(self, action: str, ip_version: str) -> List[str]:
+        return sorted(
+            state_file.name[: -len(".cidr")]
+            for state_file in (self.__base_path / action / ip_version).glob("*.cidr")
+        )
+
+    def save(
+        self, action: str, country_code: str, ip_version: str, cidrs: Iterable[str]
+    ):
+        state_file = self.__path(action, country_code, ip_version)
+        os.makedirs(state_file.parent, exist_ok=True)
+
+        staging = state_file.with_name(f".{state_file.name}.tmp")
+        with open(staging, "w") as f:
+            f.write("".join(f"{cidr}\n" for cidr in cidrs))
+
+        os.replace(staging, state_file)
+
+        self.__logger.debug(
+            f"Saved applied state to {state_file}", extra={"path": state_file}
+        )
+
+    def __path(self, action: str, country_code: str, ip_version: str) -> Path:
+        return self.__base_path / action / ip_version / f"{country_code.lower()}.cidr"
+
+
+def diff(
+    applied: Set[str] | None, cidrs: List[str]
+) -> Tuple[List[str], List[str], int]:
+    if applied is None:
+        return list(cidrs), [], 0
+
+    desired = set(cidrs)
+
+    added = [cidr for cidr in cidrs if cidr not in applied]
+    removed = sorted(applied - desired)
+
+    return added, removed, len(desired & applied)
@@ -1,14 +1,88 @@
+import math
 import logging
 import shutil
 import subprocess
 from pathlib import Path
-from typing import List
+from typing import Dict, List
+
+from . import firewall_state
+from ..cidrs import cidr_ranges, cidr_complement, cidr_stats
+
+IPTABLES_ACTIONS = {
+    "deny": "DROP",
+    "reject": "REJECT",
+    "allow": "ACCEPT",
+}
+
+CIDRE_CHAIN = "CIDRE"
+
+# ipset defaults, kept as the minimum so small sets are created as before.
+IPSET_MIN_HASHSIZE = 1024
+IPSET_MIN_MAXELEM = 65536
+
+IPSET_HEADROOM = 0.25
+
+# Buckets are allocated with room for 2 elements, then grown.
+IPSET_BUCKET_LOAD = 2
+
+# Approximate kernel sizes of a hash:net element, bucket header and table slot.
+IPSET_ELEMENT_BYTES = {"ipv4": 8, "ipv6": 20}
+IPSET_BUCKET_BYTES = 32
+IPSET_SLOT_BYTES = 8
+
+
+def power_of_two(value: float) -> int:
+    return 1 << max(0, math.ceil(math.log2(max(1, value))))
+
+
+def ipset_size(cidr_blocks: List[str], ip_version: str) -> Dict[str, int]:
+    count = len(cidr_blocks)
+
+    # Elements take the same space whatever their prefix length, so the size
+    # depends on the count only.
+    hashsize = max(IPSET_MIN_HASHSIZE, power_of_two(count / IPSET_BUCKET_LOAD))
+    maxelem = max(IPSET_MIN_MAXELEM, power_of_two(count * (1 + IPSET_HEADROOM)))
+
+    # Not a size: hash:net probes the hash once per distinct prefix length,
+    # which is what a lookup costs.
+    prefixes = len({cidr.partition("/")[2] for cidr in cidr_blocks})
+
+    memory = (
+        hashsize * IPSET_SLOT_BYTES
+        + min(count, hashsize) * IPSET_BUCKET_BYTES
+        + count * IPSET_ELEMENT_BYTES[ip_version]
+    )
+
+    return {
+        "hashsize": hashsize,
+        "maxelem": maxelem,
+        "prefixes": prefixes,
+        "memory": memory,
+    }
 
 
 class IpTablesFirewall:
-    def __init__(self, base_folder: str):
+    def __init__(
+        self,
+        base_folder: str,
+        state_folder: str | None = None,
+        full: bool = False,
+        drop_rest: bool = False,
+        combined: bool = False,
+        stats: cidr_stats.CidrStats | None = None,
+    ):
         self.__base_folder = base_folder
         self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__state = (
+            firewall_state.FsFirewallState(state_folder, "iptables")
+            if state_folder
+            else None
+        )
+        self.__full = full
+        self.__drop_rest = drop_rest
+        self.__combined = combined
+        self.__stats = stats if stats is not None else cidr_stats.CidrStats()
+        self.__report = {"added": 0, "removed": 0, "unchanged": 0, "bytes": 0}
 
     def apply(self, action: str, country_codes: List[str]) -> bool:
         if not shutil.which("ipset") or not shutil.which("iptables"):
@@ -20,25 +94,41 @@ class IpTablesFirewall:
             )
             return False
 
-        for country_code in country_codes:
-            self.__apply_one(action, country_code.lower())
+        self.__report = {"added": 0, "removed": 0, "unchanged": 0, "bytes": 0}
+
+        with self.__stats.stage(
+            "firewall", {"backend": "iptables", "action": action}
+        ) as stage:
+            if self.__drop_rest:
+                if not self.__apply_allowlist(country_codes):
+                    return False
+            elif self.__combined:
+                if not self.__apply_combined(action, country_codes):
+                    return False
+            else:
+                for country_code in country_codes:
+                    self.__apply_one(action, country_code.lower())
+
+            stage.add(
+                records_in=self.__report["added"] + self.__report["unchanged"],
+                records_out=self.__report["added"] + self.__report["removed"],
+                transferred=self.__report["bytes"],
+            )
+
+        self.__logger.info(
+            f"IPSet: {self.__report['added']} added, {self.__report['removed']} removed, "
+            f"{self.__report['unchanged']} unchanged."
+        )
 
         return True
 
     def __apply_one(self, action: str, country_code: str):
         for ip_version in ["ipv4", "ipv6"]:
-            cidr_file = Path(self.__base_folder) / ip_version / f"{country_code}.cidr"
+            cidr_blocks = self.__read_cidrs(country_code, ip_version)
 
-            if not cidr_file.exists():
-                self.__logger.error(
-                    f"CIDR file not found for {country_code.upper()} in {ip_version}."
-                )
-                self.__logger.error("You can pull it with: `cidre pull --merge`")
+            if cidr_blocks is None:
                 return
 
-            with open(cidr_file, "r") as f:
-                cidr_blocks = [line.strip() for line in f.readlines() if line.strip()]
-
             if not cidr_blocks:
                 self.__logger.error(
                     f"No CIDR blocks found for {country_code.upper()} in {ip_version}."
@@ -47,53 +137,288 @@ class IpTablesFirewall:
 
             set_name = f"cidre_{country_code}_blocklist_{ip_version}"
 
-            self.__create_ipset(set_name, ip_version)
-            self.__add_to_ipset(set_name, cidr_blocks)
-            self.__apply_iptables(set_name, action, ip_version)
+            self.__apply_set(set_name, action, country_code, ip_version, cidr_blocks)
 
-    def __create_ipset(self, set_name: str, ip_version: str):
-        self.__logger.info(f"🛠 Creating IPSet {set_name} (if not exists)...")
+            self.__logger.info(
+                f"Applying iptables rule: {action.upper()} for {set_name}..."
+            )
+            self.__apply_iptables(
+                ip_version,
+                ["-m", "set", "--match-set", set_name, "src"],
+                IPTABLES_ACTIONS[action],
+            )
+
+    def __apply_combined(self, action: str, country_codes: List[str]) -> bool:
+        # One set per action and family keeps a single lookup per packet,
+        # however many countries are applied.
+        cidr_blocks = {"ipv4": {}, "ipv6": {}}
+
+        # Every file is read first, so a missing one leaves no family half-applied.
+        for ip_version, blocks in cidr_blocks.items():
+            for country_code in country_codes:
+                country_blocks = self.__read_cidrs(country_code.lower(), ip_version)
+
+                if country_blocks is None:
+                    return False
+
+                blocks.update(dict.fromkeys(country_blocks))
+
+        for ip_version, blocks in cidr_blocks.items():
+            set_name = f"cidre_{action}_{ip_version}"
 
-        if ip_version == "ipv4":
-            subprocess.run(
-                ["ipset", "create", set_name, "hash:net", "-exist"], check=True
+            self.__apply_set(set_name, action, "combined", ip_version, list(blocks))
+
+            self.__logger.info(
+                f"Applying iptables rule: {action.upper()} for {set_name}..."
+            )
+            self.__apply_iptables(
+                ip_version,
+                ["-m", "set", "--match-set", set_name, "src"],
+                IPTABLES_ACTIONS[action],
             )
-        elif ip_version == "ipv6":
-            subprocess.run(
-                ["ipset", "create", set_name, "hash:net", "family", "inet6", "-exist"],
-                check=True,
+
+        return True
+
+    def __read_cidrs(self, country_code: str, ip_version: str) -> List[str] | None:
+        cidr_file = Path(self.__base_folder) / ip_version / f"{country_code}.cidr"
+
+        if not cidr_file.exists():
+            self.__logger.error(
+                f"CIDR file not found for {country_code.upper()} in {ip_version}."
             )
+            self.__logger.error("You can pull it with: `cidre pull --merge`")
+            return None
 
-    def __add_to_ipset(self, set_name: str, cidr_blocks: List[str]):
-        self.__logger.info(f"IPSet ({set_name}): Adding {len(cidr_blocks)} CIDRs...")
+        with open(cidr_file, "r") as f:
+            return [line.strip() for line in f.readlines() if line.strip()]
 
-        for cidr in cidr_blocks:
-            subprocess.run(["ipset", "add", set_name, cidr, "-exist"], check=True)
+    def __apply_allowlist(self, country_codes: List[str]) -> bool:
+        compiled = cidr_complement.CidrComplement(self.__base_folder).compile(
+            country_codes
+        )
 
-            self.__logger.debug(f"IPSet ({set_name}): Added {cidr}")
+        if compiled is None:
+            return False
 
-    def __apply_iptables(self, set_name: str, action: str, ip_version: str):
-        iptables_action = {
-            "deny": "DROP",
-            "reject": "REJECT",
-            "allow": "ACCEPT",
-        }.get(action)
+        # Hash sets hold CIDRs, not ranges, so the rest is dropped with a negated
+        # match instead of loading the much larger complement.
+        for ip_version in ["ipv4", "ipv6"]:
+            allow_set = f"cidre_allowlist_{ip_version}"
+            reserved_set = f"cidre_reserved_{ip_version}"
+
+            self.__apply_set(
+                allow_set,
+                "allow",
+                "allowlist",
+                ip_version,
+                [
+                    cidr_ranges.format_cidr(start, prefixlen, ip_version)
+                    for start, prefixlen in compiled["allow"][ip_version]
+                ],
+            )
+            self.__apply_set(
+                reserved_set,
+                "allow",
+                "reserved",
+                ip_version,
+                cidr_ranges.RESERVED_CIDRS[ip_version],
+            )
+
+            self.__apply_iptables(
+                ip_version,
+                ["-m", "set", "!", "--match-set", allow_set, "src"]
+                + ["-m", "set", "!", "--match-set", reserved_set, "src"],
+                "DROP",
+            )
+
+            # Replies to the host's own connections, e.g. DNS or package
+            # mirrors, come from countries outside of the allow list as well.
+            self.__apply_iptables(
+                ip_version,
+                ["-m", "conntrack", "--ctstate", "ESTABLISHED,RELATED"],
+                "ACCEPT",
+            )
+            self.__apply_iptables(
+                ip_version, ["-m", "set", "--match-set", allow_set, "src"], "ACCEPT"
+            )
+
+        return True
+
+    def __apply_set(
+        self,
+        set_name: str,
+        action: str,
+        country_code: str,
+        ip_version: str,
+        cidr_blocks: List[str],
+    ):
+        size = ipset_size(cidr_blocks, ip_version)
 
         self.__logger.info(
-            f"Applying iptables rule: {action.upper()} for {set_name}..."
+            f"IPSet ({set_name}): {len(cidr_blocks)} CIDRs, hashsize {size['hashsize']}, "
+            f"maxelem {size['maxelem']}, ~{size['memory'] / 1024:.0f} KiB, "
+            f"{size['prefixes']} hash probes per lookup."
+        )
+
+        # The kernel grows the hash of a full set by itself, so only sets smaller
+        # than needed are rebuilt, keeping later runs incremental.
+        header = self.__ipset_header(set_name)
+        resized = header is not None and any(
+            option in header and int(header[option]) < size[option]
+            for option in ["hashsize", "maxelem"]
+        )
+
+        if resized:
+            self.__logger.info(
+                f"IPSet ({set_name}): Rebuilding from hashsize {header.get('hashsize')}, "
+                f"maxelem {header.get('maxelem')}..."
+            )
+
+        applied = (
+            self.__state.load(action, country_code, ip_version)
+            if self.__state and not self.__full and header is not None and not resized
+            else None
+        )
+        added, removed, unchanged = firewall_state.diff(applied, cidr_blocks)
+
+        if applied is None:
+            if header is None:
+                self.__create_ipset(set_name, ip_version, size)
+            self.__restore_ipset(set_name, ip_version, size, cidr_blocks)
+        elif added or removed:
+            self.__update_ipset(set_name, added, removed)
+
+        self.__logger.info(
+            f"{country_code.upper()} ({ip_version}): {len(added)} added, "
+            f"{len(removed)} removed, {unchanged} unchanged."
+        )
+        self.__report["added"] += len(added)
+        self.__report["removed"] += len(removed)
+        self.__report["unchanged"] += unchanged
+
+        if self.__state:
+            self.__state.save(action, country_code, ip_version, cidr_blocks)
+
+    def __ipset_header(self, set_name: str) -> Dict[str, str] | None:
+        result = subprocess.run(
+            ["ipset", "list", "-t", set_name], capture_output=True, text=True
         )
+
+        if result.returncode != 0:
+            return None
+
+        # e.g. "Header: family inet hashsize 1024 maxelem 65536 bucketsize 12"
+        for line in result.stdout.splitlines():
+            if line.startswith("Header:"):
+                tokens = line.split()[1:]
+                return dict(zip(tokens[::2], tokens[1::2]))
+
+        return {}
+
+    def __create_ipset(self, set_name: str, ip_version: str, size: Dict[str, int]):
+        self.__logger.info(f"🛠 Creating IPSet {set_name} (if not exists)...")
+
         subprocess.run(
             [
-                "iptables" if ip_version == "ipv4" else "ip6tables",
-                "-I",
-                "INPUT",
-                "-m",
-                "set",
-                "--match-set",
+                "ipset",
+                "create",
                 set_name,
-                "src",
-                "-j",
-                iptables_action,
+                *self.__ipset_options(ip_version, size),
+                "-exist",
             ],
             check=True,
         )
+
+    def __restore_ipset(
+        self,
+        set_name: str,
+        ip_version: str,
+        size: Dict[str, int],
+        cidr_blocks: List[str],
+    ):
+        temp_set_name = f"{set_name}_tmp"
+
+        self.__logger.info(
+            f"IPSet ({set_name}): Loading {len(cidr_blocks)} CIDRs with ipset restore..."
+        )
+
+        # A leftover of an interrupted run may have been created with another size.
+        subprocess.run(["ipset", "destroy", temp_set_name], capture_output=True)
+
+        options = " ".join(self.__ipset_options(ip_version, size))
+        script = "".join(
+            [
+                f"create {temp_set_name} {options} -exist\n",
+                f"flush {temp_set_name}\n",
+                *(f"add {temp_set_name} {cidr} -exist\n" for cidr in cidr_blocks),
+            ]
+        )
+
+        subprocess.run(["ipset", "restore"], input=script, text=True, check=True)
+        self.__report["bytes"] += len(script)
+
+        self.__logger.info(f"IPSet ({set_name}): Swapping in {temp_set_name}...")
+
+        subprocess.run(["ipset", "swap", temp_set_name, set_name], check=True)
+        subprocess.run(["ipset", "destroy", temp_set_name], check=True)
+
+    def __update_ipset(self, set_name: str, added: List[str], removed: List[str]):
+        self.__logger.info(
+            f"IPSet ({set_name}): Adding {len(added)} and removing {len(removed)} CIDRs "
+            "with ipset restore..."
+        )
+
+        script = "".join(
+            [
+                *(f"del {set_name} {cidr} -exist\n" for cidr in removed),
+                *(f"add {set_name} {cidr} -exist\n" for cidr in added),
+            ]
+        )
+
+        subprocess.run(["ipset", "restore"], input=script, text=True, check=True)
+        self.__report["bytes"] += len(script)
+
+    def __ipset_options(self, ip_version: str, size: Dict[str, int]) -> List[str]:
+        family = "inet6" if ip_version == "ipv6" else "inet"
+
+        return [
+            "hash:net",
+            "family",
+            family,
+            "hashsize",
+            str(size["hashsize"]),
+            "maxelem",
+            str(size["maxelem"]),
+        ]
+
+    def __apply_iptables(self, ip_version: str, match: List[str], target: str):
+        binary = "iptables" if ip_version == "ipv4" else "ip6tables"
+        chain = CIDRE_CHAIN if self.__combined else "INPUT"
+
+        if self.__combined:
+            self.__create_chain(binary)
+
+        rule = [*match, "-j", target]
+
+        # Reruns, e.g. from cron, would otherwise stack duplicate rules.
+        if self.__rule_exists(binary, chain, rule):
+            self.__logger.info(f"{binary}: Rule already in {chain}, skipping.")
+            return
+
+        subprocess.run([binary, "-I", chain, *rule], check=True)
+
+    def __create_chain(self, binary: str):
+        result = subprocess.run([binary, "-S", CIDRE_CHAIN], capture_output=True)
+
+        if result.returncode != 0:
+            self.__logger.info(f"🛠 Creating {binary} chain {CIDRE_CHAIN}...")
+            subprocess.run([binary, "-N", CIDRE_CHAIN], check=True)
+
+        jump = ["-j", CIDRE_CHAIN]
+        if not self.__rule_exists(binary, "INPUT", jump):
+            subprocess.run([binary, "-I", "INPUT", *jump], check=True)
+
+    def __rule_exists(self, binary: str, chain: str, rule: List[str]) -> bool:
+        result = subprocess.run([binary, "-C", chain, *rule], capture_output=True)
+
+        return result.returncode == 0
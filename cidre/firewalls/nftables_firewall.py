@@ -0,0 +1,233 @@
+import shutil
+import logging
+import subprocess
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from . import firewall_state
+from ..cidrs import cidr_ranges, cidr_complement, cidr_stats
+
+NFT_TABLE = "inet cidre"
+
+NFT_ACTIONS = {
+    "allow": "accept",
+    "deny": "drop",
+    "reject": "reject",
+}
+
+# Drop-rest sets are kept apart from the action sets, so an allow list doesn't
+# replace what was denied before.
+NFT_DROP_REST = {
+    "allowlist": "accept",
+    "droprest": "drop",
+}
+
+NFT_TYPES = {"ipv4": "ipv4_addr", "ipv6": "ipv6_addr"}
+
+NFT_MATCHES = {"ipv4": "ip saddr", "ipv6": "ip6 saddr"}
+
+
+class NftablesFirewall:
+    def __init__(
+        self,
+        base_folder: str,
+        dry_run: str | None = None,
+        drop_rest: bool = False,
+        stats: cidr_stats.CidrStats | None = None,
+        state_folder: str | None = None,
+    ):
+        self.__base_folder = base_folder
+        self.__state = (
+            firewall_state.FsFirewallState(state_folder, "nftables")
+            if state_folder
+            else None
+        )
+        self.__dry_run = dry_run
+        self.__drop_rest = drop_rest
+        self.__stats = stats if stats is not None else cidr_stats.CidrStats()
+        self.__logger = logging.getLogger(self.__class__.__name__)
+
+    def apply(self, action: str, country_codes: List[str]) -> bool:
+        if not self.__dry_run and not shutil.which("nft"):
+            self.__logger.error("Error: nftables is not installed on this system.")
+            self.__logger.error("You can install it with: `sudo apt install nftables`")
+            return False
+
+        with self.__stats.stage(
+            "firewall", {"backend": "nftables", "action": action}
+        ) as stage:
+            if self.__drop_rest:
+                compiled = cidr_complement.CidrComplement(self.__base_folder).compile(
+                    country_codes
+                )
+
+                if compiled is None:
+                    return False
+
+                cidrs = compiled["allow"]
+                ruleset = self.render_sets(
+                    {"allowlist": compiled["allow"], "droprest": compiled["drop"]}
+                )
+            else:
+                loaded = {}
+                for country_code in country_codes:
+                    country = self.__load_one(country_code)
+
+                    # Applying the rest would drop the missing country from the set.
+                    if country is None:
+                        return False
+
+                    loaded[country_code.lower()] = country
+
+                cidrs = self.__applied(action, loaded)
+                ruleset = self.render(action, cidrs)
+
+            stage.add(
+                records_in=len(cidrs["ipv4"]) + len(cidrs["ipv6"]),
+                records_out=ruleset.count("\n"),
+                transferred=len(ruleset.encode()),
+            )
+
+            if self.__dry_run:
+                with open(self.__dry_run, "w") as f:
+                    f.write(ruleset)
+
+                self.__logger.info(f"Ruleset written to {self.__dry_run} (dry run).")
+                return True
+
+            self.__logger.info(f"Applying nftables ruleset for {action.upper()}...")
+            subprocess.run(["nft", "-f", "-"], input=ruleset, text=True, check=True)
+
+            if self.__state and not self.__drop_rest:
+                for country_code, country in loaded.items():
+                    for ip_version in ["ipv4", "ipv6"]:
+                        self.__state.save(
+                            action, country_code, ip_version, country[ip_version]
+                        )
+
+        return True
+
+    def __applied(
+        self, action: str, loaded: Dict[str, Dict[str, List[str]]]
+    ) -> Dict[str, List[Tuple[int, int]]]:
+        cidrs = {"ipv4": [], "ipv6": []}
+
+        for ip_version in ["ipv4", "ipv6"]:
+            cidr_blocks = [
+                cidr for country in loaded.values() for cidr in country[ip_version]
+            ]
+
+            # Sets are rendered in full, so countries applied by earlier runs
+            # are loaded again from their state.
+            if self.__state:
+                for country_code in self.__state.countries(action, ip_version):
+                    if country_code not in loaded:
+                        cidr_blocks += self.__state.load(
+                            action, country_code, ip_version
+                        )
+
+            cidrs[ip_version] = [
+                cidr_ranges.parse_cidr(cidr, ip_version) for cidr in cidr_blocks
+            ]
+
+        return cidrs
+
+    def render(self, action: str, cidrs: Dict[str, List[Tuple[int, int]]]) -> str:
+        return self.render_sets({action: cidrs})
+
+    def render_sets(self, sets: Dict[str, Dict[str, List[Tuple[int, int]]]]) -> str:
+        lines = [f"table {NFT_TABLE} {{"]
+
+        for set_action in [*NFT_ACTIONS, *NFT_DROP_REST]:
+            for ip_version in ["ipv4", "ipv6"]:
+                lines.append(
+                    f"    set {set_action}_{ip_version} "
+                    f"{{ type {NFT_TYPES[ip_version]}; flags interval; auto-merge; }}"
+                )
+
+        lines += [
+            "    chain input {",
+            "        type filter hook input priority -10; policy accept;",
+            "    }",
+            "}",
+            f"flush chain {NFT_TABLE} input",
+        ]
+
+        for set_action, verdict in [
+            *NFT_ACTIONS.items(),
+            *NFT_DROP_REST.items(),
+        ]:
+            if set_action == "droprest":
+                lines.append(
+                    f"add rule {NFT_TABLE} input ct state established,related accept"
+                )
+
+            for ip_version in ["ipv4", "ipv6"]:
+                lines.append(
+                    f"add rule {NFT_TABLE} input "
+                    f"{NFT_MATCHES[ip_version]} @{set_action}_{ip_version} {verdict}"
+                )
+
+        for action, cidrs in sets.items():
+            for ip_version in ["ipv4", "ipv6"]:
+                self.__render_set(lines, action, ip_version, cidrs[ip_version])
+
+        return "\n".join(lines) + "\n"
+
+    def __render_set(
+        self,
+        lines: List[str],
+        action: str,
+        ip_version: str,
+        cidrs: List[Tuple[int, int]],
+    ):
+        set_name = f"{action}_{ip_version}"
+        merged = cidr_ranges.cidrs_to_intervals(cidrs, ip_version)
+
+        lines.append(f"flush set {NFT_TABLE} {set_name}")
+
+        if not merged:
+            return
+
+        self.__logger.info(f"nftables ({set_name}): Loading {len(merged)} intervals...")
+
+        lines.append(f"add element {NFT_TABLE} {set_name} {{")
+        lines += [
+            f"    {self.__element(start, stop, ip_version)}," for start, stop in merged
+        ]
+        lines.append("}")
+
+    def __load_one(self, country_code: str) -> Dict[str, List[str]] | None:
+        country = {}
+
+        for ip_version in ["ipv4", "ipv6"]:
+            cidr_file = (
+                Path(self.__base_folder) / ip_version / f"{country_code.lower()}.cidr"
+            )
+
+            if not cidr_file.exists():
+                self.__logger.error(
+                    f"CIDR file not found for {country_code.upper()} in {ip_version}."
+                )
+                self.__logger.error("You can pull it with: `cidre pull --merge`")
+                return None
+
+            with open(cidr_file, "r") as f:
+                country[ip_version] = [
+                    line.strip() for line in f.readlines() if line.strip()
+                ]
+
+        return country
+
+    def __element(self, start: int, stop: int, ip_version: str) -> str:
+        size = stop - start
+
+        if size & (size - 1) == 0 and start % size == 0:
+            prefixlen = cidr_ranges.IP_BITS[ip_version] - size.bit_length() + 1
+            return cidr_ranges.format_cidr(start, prefixlen, ip_version)
+
+        first = cidr_ranges.format_ip(start, ip_version)
+        last = cidr_ranges.format_ip(stop - 1, ip_version)
+
+        return f"{first}-{last}"
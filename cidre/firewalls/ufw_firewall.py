@@ -1,15 +1,55 @@
+import os
+import shutil
 import logging
 import subprocess
-import shutil
 
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
+
+from . import firewall_state
+from ..cidrs import cidr_stats
+
+UFW_ACTIONS = {
+    "deny": ["-s {cidr} -j DROP"],
+    "reject": [
+        "-p tcp -s {cidr} -j REJECT --reject-with tcp-reset",
+        "-s {cidr} -j REJECT",
+    ],
+    "allow": ["-s {cidr} -j ACCEPT"],
+}
+
+UFW_RULES_FILES = {"ipv4": "user.rules", "ipv6": "user6.rules"}
+
+UFW_CHAINS = {"ipv4": "ufw-user-input", "ipv6": "ufw6-user-input"}
+
+UFW_ANY_ADDRESSES = {"ipv4": "0.0.0.0/0", "ipv6": "::/0"}
+
+# UFW matches every packet against its rules one by one.
+UFW_RULES_WARNING = 1000
 
 
 class UfwFirewall:
-    def __init__(self, base_folder: str):
+    def __init__(
+        self,
+        base_folder: str,
+        state_folder: str | None = None,
+        full: bool = False,
+        bulk: bool = False,
+        rules_folder: str = "/etc/ufw",
+        stats: cidr_stats.CidrStats | None = None,
+    ):
         self.__base_folder = base_folder
         self.__logger = logging.getLogger(self.__class__.__name__)
+        self.__state = (
+            firewall_state.FsFirewallState(state_folder, "ufw")
+            if state_folder
+            else None
+        )
+        self.__full = full
+        self.__bulk = bulk
+        self.__rules_folder = Path(rules_folder)
+        self.__stats = stats if stats is not None else cidr_stats.CidrStats()
+        self.__report = {"added": 0, "removed": 0, "unchanged": 0}
 
     def apply(self, action: str, country_codes: List[str]) -> bool:
         if not shutil.which("ufw"):
@@ -17,12 +57,65 @@ class UfwFirewall:
             self.__logger.error("You can install it with: `sudo apt install ufw`")
             return False
 
+        self.__report = {"added": 0, "removed": 0, "unchanged": 0}
+
+        plans = []
         for country_code in country_codes:
-            self.__apply_one(action, country_code)
+            plans.extend(self.__plan_one(action, country_code))
+
+        for ip_version in ["ipv4", "ipv6"]:
+            rules_count = sum(
+                len(cidr_blocks)
+                for _, plan_ip_version, cidr_blocks, _, _, _ in plans
+                if plan_ip_version == ip_version
+            )
+
+            if rules_count > UFW_RULES_WARNING:
+                self.__logger.warning(
+                    f"Warning: {rules_count} {ip_version} rules exceed {UFW_RULES_WARNING}. "
+                    "UFW matches packets against its rules one by one, which slows down "
+                    "the packet path. Consider `--firewall iptables` for large CIDR inputs."
+                )
 
-        return True
+        with self.__stats.stage(
+            "firewall", {"backend": "ufw", "action": action}
+        ) as stage:
+            failed = []
+            if self.__bulk:
+                failed = self.__apply_bulk(action, plans)
+            else:
+                self.__apply_rules(action, plans)
 
-    def __apply_one(self, action: str, country_code: str):
+            for _, _, cidr_blocks, added, removed, _ in plans:
+                stage.add(
+                    records_in=len(cidr_blocks), records_out=len(added) + len(removed)
+                )
+
+        for country_code, ip_version, cidr_blocks, added, removed, unchanged in plans:
+            # Families whose rules were not written keep their applied state.
+            if ip_version in failed:
+                continue
+
+            self.__logger.info(
+                f"{country_code.upper()} ({ip_version}): {len(added)} added, "
+                f"{len(removed)} removed, {unchanged} unchanged."
+            )
+            self.__report["added"] += len(added)
+            self.__report["removed"] += len(removed)
+            self.__report["unchanged"] += unchanged
+
+            if self.__state:
+                self.__state.save(action, country_code, ip_version, cidr_blocks)
+
+        self.__logger.info(
+            f"UFW: {self.__report['added']} added, {self.__report['removed']} removed, "
+            f"{self.__report['unchanged']} unchanged."
+        )
+
+        return not failed
+
+    def __plan_one(self, action: str, country_code: str) -> List[Tuple]:
+        plans = []
 
         for ip_version in ["ipv4", "ipv6"]:
             cidr_file = (
@@ -34,7 +127,7 @@ class UfwFirewall:
                     f"Error: CIDR file not found for {country_code.upper()} in {ip_version}."
                 )
                 self.__logger.error("You can pull it with: `cidre pull --merge`")
-                return
+                return plans
 
             with open(cidr_file, "r") as f:
                 cidr_blocks = [line.strip() for line in f.readlines() if line.strip()]
@@ -43,9 +136,130 @@ class UfwFirewall:
                 self.__logger.error(
                     f"Error: No CIDR blocks found for {country_code.upper()} in {ip_version}."
                 )
-                return
+                return plans
+
+            applied = (
+                self.__state.load(action, country_code, ip_version)
+                if self.__state
+                else None
+            )
+            added, removed, unchanged = firewall_state.diff(applied, cidr_blocks)
+
+            # Rules gone from the country are still deleted when all are written again.
+            if self.__full:
+                added, unchanged = cidr_blocks, []
+
+            plans.append(
+                (country_code, ip_version, cidr_blocks, added, removed, unchanged)
+            )
+
+        return plans
+
+    def __apply_rules(self, action: str, plans: List[Tuple]):
+        for _country_code, _ip_version, _cidr_blocks, added, removed, _ in plans:
+            for cidr in removed:
+                rule = ["ufw", "delete", action, "from", cidr]
+                self.__logger.info(f"Executing: {' '.join(rule)}")
+                subprocess.run(rule, check=True)
+
+            for cidr in added:
+                rule = ["ufw", action, "from", cidr]
+                self.__logger.info(f"Executing: {' '.join(rule)}")
+                subprocess.run(rule, check=True)
+
+    def __apply_bulk(self, action: str, plans: List[Tuple]) -> List[str]:
+        changed = False
+        failed = []
+
+        for ip_version in ["ipv4", "ipv6"]:
+            added = [
+                cidr
+                for _, plan_ip_version, _, plan_added, _, _ in plans
+                if plan_ip_version == ip_version
+                for cidr in plan_added
+            ]
+            removed = [
+                cidr
+                for _, plan_ip_version, _, _, plan_removed, _ in plans
+                if plan_ip_version == ip_version
+                for cidr in plan_removed
+            ]
+
+            if not added and not removed:
+                continue
+
+            rules_file = self.__rules_folder / UFW_RULES_FILES[ip_version]
+
+            if not rules_file.exists():
+                self.__logger.error(
+                    f"Error: UFW rules file {rules_file} not found for {ip_version}."
+                )
+                failed.append(ip_version)
+                continue
+
+            self.__logger.info(
+                f"UFW ({rules_file}): Writing {len(added)} and deleting {len(removed)} rules..."
+            )
+
+            with open(rules_file, "r") as f:
+                lines = f.read().splitlines()
+
+            lines = self.__rewrite_rules(lines, action, ip_version, added, removed)
+
+            staging = rules_file.with_name(f".{rules_file.name}.cidre")
+            with open(staging, "w") as f:
+                f.write("\n".join(lines) + "\n")
+
+            shutil.copymode(rules_file, staging)
+            os.replace(staging, rules_file)
+
+            changed = True
+
+        if changed:
+            self.__logger.info("Executing: ufw reload")
+            subprocess.run(["ufw", "reload"], check=True)
+
+        return failed
+
+    def __rewrite_rules(
+        self,
+        lines: List[str],
+        action: str,
+        ip_version: str,
+        added: List[str],
+        removed: List[str],
+    ) -> List[str]:
+        if "### END RULES ###" not in lines:
+            raise ValueError("UFW rules file has no '### END RULES ###' section.")
+
+        # Rules to be written again are dropped as well to avoid duplicates.
+        dropped = {self.__tuple(action, ip_version, cidr) for cidr in removed + added}
+
+        rewritten = []
+        skipping = False
+        for line in lines:
+            if line.startswith("### tuple ###"):
+                skipping = line in dropped
+            elif skipping and not line.startswith("-A "):
+                skipping = False
+                if not line:
+                    continue
+
+            if not skipping:
+                rewritten.append(line)
+
+        end = rewritten.index("### END RULES ###")
+
+        rules = []
+        for cidr in added:
+            rules.append(self.__tuple(action, ip_version, cidr))
+            for rule in UFW_ACTIONS[action]:
+                rules.append(f"-A {UFW_CHAINS[ip_version]} {rule.format(cidr=cidr)}")
+            rules.append("")
+
+        rewritten[end:end] = rules
+
+        return rewritten
 
-            for cidr in cidr_blocks:
-                rule = f"ufw {action} from {cidr}"
-                self.__logger.info(f"Executing: {rule}")
-                subprocess.run(rule, shell=True, check=True)
+    def __tuple(self, action: str, ip_version: str, cidr: str) -> str:
+        return f"### tuple ### {action} any any {UFW_ANY_ADDRESSES[ip_version]} any {cidr} in"
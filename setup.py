@@ -8,6 +8,7 @@ setup(
     version="2.1.3",
     packages=find_packages(exclude=["tests", "tests.*"]),
     install_requires=["netaddr==1.3.0", "requests==2.32.4"],
+    extras_require={"fast": ["numpy"]},
     entry_points={
         "console_scripts": [
             "cidre=cidre.cli:main",
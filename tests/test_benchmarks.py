@@ -0,0 +1,86 @@
+import sys
+import json
+import subprocess
+
+from pathlib import Path
+
+BENCHMARKS = Path(__file__).parent.parent / "benchmarks"
+
+
+def run_pipeline(*args):
+    return subprocess.run(
+        [
+            sys.executable,
+            str(BENCHMARKS / "bench_pipeline.py"),
+            "-sc",
+            "0.005",
+            "-r",
+            "1",
+            "-nm",
+            *args,
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_synthetic_files_are_parsed_into_cidrs(tmp_path):
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(BENCHMARKS / "synthetic.py"),
+            str(tmp_path),
+            "-sc",
+            "0.01",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+
+    source = tmp_path / "delegated-ripencc-extended-latest"
+    lines = source.read_text().splitlines()
+
+    assert lines[0].startswith("2|ripencc|")
+    assert any("|ipv4|" in line for line in lines)
+    assert any("|ipv6|" in line for line in lines)
+    assert any("|asn|" in line for line in lines)
+    assert any("|available|" in line for line in lines)
+
+
+def test_pipeline_reports_every_stage(tmp_path):
+    output = tmp_path / "results.json"
+
+    result = run_pipeline("-o", str(output))
+    assert result.returncode == 0, result.stderr
+
+    results = json.loads(output.read_text())
+
+    assert list(results["stages"]) == [
+        "convert",
+        "merge",
+        "save",
+        "resave",
+        "count",
+        "firewall_iptables",
+        "firewall_ufw",
+        "firewall_nftables",
+    ]
+    assert results["stages"]["merge"]["records_out"] > 0
+    assert results["stages"]["firewall_iptables"]["records_out"] > 0
+
+
+def test_pipeline_fails_on_regression_against_baseline(tmp_path):
+    output = tmp_path / "results.json"
+    assert run_pipeline("-o", str(output)).returncode == 0
+
+    baseline = json.loads(output.read_text())
+    baseline["stages"]["convert"]["seconds"] = 0.0
+    (tmp_path / "baseline.json").write_text(json.dumps(baseline))
+
+    result = run_pipeline(
+        "-o", str(output), "-b", str(tmp_path / "baseline.json"), "-ms", "0"
+    )
+
+    assert result.returncode == 1
+    assert "Regression: convert" in result.stderr
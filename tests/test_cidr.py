@@ -4,7 +4,7 @@ import subprocess
 def test_help_output():
     result = subprocess.run(["cidre", "--help"], capture_output=True, text=True)
     assert result.returncode == 0
-    assert "usage: cidre [-h] {cidr,firewall} ..." in result.stdout
+    assert "usage: cidre [-h] {cidr,firewall,serve} ..." in result.stdout
 
 
 def test_cidr_pull():
@@ -67,3 +67,23 @@ def test_firewall_reject():
         "💡 Applying 'reject' action to 'ufw' firewall for RU countries"
         in result.stdout
     )
+
+
+def test_cidr_pull_with_concurrency():
+    result = subprocess.run(
+        ["cidre", "cidr", "pull", "--concurrency", "2", "--retries", "1"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+    assert "Pulling complete ✅" in result.stdout
+
+
+def test_cidr_pull_with_workers():
+    result = subprocess.run(
+        ["cidre", "cidr", "pull", "--merge", "--workers", "2", "--retries", "0"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+    assert "Pulling complete ✅" in result.stdout
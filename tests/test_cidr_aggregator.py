@@ -0,0 +1,61 @@
+import random
+
+import netaddr
+
+from cidre.cidrs import cidr_aggregator, cidr_ranges
+
+
+def parse(*cidrs):
+    return [cidr_ranges.parse_cidr(cidr, "ipv4") for cidr in cidrs]
+
+
+def test_aggregate_prefers_fewest_foreign_addresses():
+    cidrs = parse("10.0.0.0/24", "10.0.1.0/25", "10.0.4.0/24", "10.1.0.0/24")
+
+    assert cidr_aggregator.aggregate_cidrs(cidrs, "ipv4") == (cidrs, 0)
+    assert cidr_aggregator.aggregate_cidrs(cidrs, "ipv4", max_cidrs=3) == (
+        parse("10.0.0.0/23", "10.0.4.0/24", "10.1.0.0/24"),
+        128,
+    )
+    assert cidr_aggregator.aggregate_cidrs(cidrs, "ipv4", max_cidrs=2) == (
+        parse("10.0.0.0/21", "10.1.0.0/24"),
+        2048 - 640,
+    )
+    assert cidr_aggregator.aggregate_cidrs(cidrs, "ipv4", max_overcoverage=0.5) == (
+        parse("10.0.0.0/23", "10.0.4.0/24", "10.1.0.0/24"),
+        128,
+    )
+
+
+def test_aggregate_matches_netaddr():
+    rng = random.Random(7)
+
+    for _ in range(200):
+        ip_version = rng.choice(["ipv4", "ipv6"])
+        bits = cidr_ranges.IP_BITS[ip_version]
+
+        cidrs = []
+        for _ in range(rng.randint(0, 50)):
+            prefixlen = rng.randint(bits - 20, bits)
+            start = (
+                rng.randrange(0, 1 << bits) >> (bits - prefixlen) << (bits - prefixlen)
+            )
+            cidrs.append((start, prefixlen))
+
+        max_cidrs = rng.randint(1, 20)
+        aggregated, extra = cidr_aggregator.aggregate_cidrs(
+            cidrs, ip_version, max_cidrs=max_cidrs
+        )
+
+        original = netaddr.IPSet(
+            cidr_ranges.format_cidr(start, prefixlen, ip_version)
+            for start, prefixlen in cidrs
+        )
+        approximated = netaddr.IPSet(
+            cidr_ranges.format_cidr(start, prefixlen, ip_version)
+            for start, prefixlen in aggregated
+        )
+
+        assert len(aggregated) <= max(max_cidrs, 1)
+        assert original.issubset(approximated)
+        assert approximated.size - original.size == extra
@@ -0,0 +1,47 @@
+import pytest
+
+from cidre.cidrs import cidr_binary, cidr_ranges, cidr_store
+
+
+def test_binary_store_roundtrip(tmp_path):
+    cidrs = {
+        "DE": {
+            "ipv4": [(cidr_ranges.parse_ip("5.1.0.0", "ipv4"), 16)],
+            "ipv6": [(cidr_ranges.parse_ip("2a00:1::", "ipv6"), 32)],
+        },
+        "RU": {
+            "ipv4": [
+                (cidr_ranges.parse_ip("2.56.90.0", "ipv4"), 23),
+                (cidr_ranges.parse_ip("2.56.88.0", "ipv4"), 23),
+            ],
+            "ipv6": [],
+        },
+    }
+
+    cidr_store.FsCidrStore(str(tmp_path)).save(cidrs)
+
+    with cidr_binary.CidrBinaryReader(str(tmp_path / cidr_binary.FILENAME)) as reader:
+        assert reader.countries() == ["DE", "RU"]
+        assert "ru" in reader
+        assert list(reader.ranges("RU", "ipv4")) == [
+            (
+                cidr_ranges.parse_ip("2.56.88.0", "ipv4"),
+                cidr_ranges.parse_ip("2.56.91.255", "ipv4"),
+            )
+        ]
+        assert list(reader.ranges("DE", "ipv6")) == [
+            (
+                cidr_ranges.parse_ip("2a00:1::", "ipv6"),
+                cidr_ranges.parse_ip("2a00:1:ffff:ffff:ffff:ffff:ffff:ffff", "ipv6"),
+            )
+        ]
+        assert reader.size("RU", "ipv6") == 0
+        assert list(reader.ranges("US", "ipv4")) == []
+
+
+def test_binary_reader_rejects_foreign_files(tmp_path):
+    path = tmp_path / "cidrs.bin"
+    path.write_bytes(b"\0" * 64)
+
+    with pytest.raises(ValueError):
+        cidr_binary.CidrBinaryReader(str(path))
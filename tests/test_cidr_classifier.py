@@ -0,0 +1,56 @@
+import io
+
+import pytest
+
+from cidre import CidrLookup
+from cidre.cidrs import cidr_classifier
+
+
+@pytest.fixture
+def index():
+    return CidrLookup(
+        {
+            "ipv4": [(0x05010000, 0x0501FFFF, "DE"), (0x02385800, 0x02385BFF, "RU")],
+            "ipv6": [(0x2A000001 << 96, ((0x2A000001 + 1) << 96) - 1, "DE")],
+        }
+    )
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_classify(index, vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+
+    lines = io.StringIO(
+        '5.1.2.3 - - [01/Jan/2025:00:00:00 +0000] "GET / HTTP/1.1" 200\n'
+        "2a00:1::1\n"
+        "\n"
+        "not-an-ip\n"
+        "1.2.3.4\n"
+        "2.56.91.255\n"
+        "2a00:2::1\n"
+        "999.1.1.1\n"
+    )
+    classifier = cidr_classifier.CidrClassifier(
+        index, batch_size=3, vectorized=vectorized
+    )
+
+    assert list(classifier.classify(lines)) == [
+        ("5.1.2.3", "DE"),
+        ("2a00:1::1", "DE"),
+        ("1.2.3.4", None),
+        ("2.56.91.255", "RU"),
+        ("2a00:2::1", None),
+    ]
+    assert classifier.stats["ipv4"] == 3
+    assert classifier.stats["ipv6"] == 2
+    assert classifier.stats["malformed"] == 2
+
+
+def test_classify_empty_index():
+    classifier = cidr_classifier.CidrClassifier(CidrLookup({}))
+
+    assert list(classifier.classify(["1.1.1.1\n", "::1\n"])) == [
+        ("1.1.1.1", None),
+        ("::1", None),
+    ]
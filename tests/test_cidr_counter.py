@@ -0,0 +1,52 @@
+import os
+import json
+
+from cidre import CidrCounter
+from cidre.cidrs import cidr_manifest, cidr_ranges, cidr_store
+
+
+def test_count_from_manifest(tmp_path):
+    cidr_store.FsCidrStore(str(tmp_path)).save(
+        {
+            "DE": {
+                "ipv4": [
+                    cidr_ranges.parse_cidr("5.1.0.0/16", "ipv4"),
+                    cidr_ranges.parse_cidr("5.2.0.0/24", "ipv4"),
+                ],
+                "ipv6": [cidr_ranges.parse_cidr("2a00:1::/32", "ipv6")],
+            },
+            "RU": {
+                "ipv4": [cidr_ranges.parse_cidr("2.56.88.0/22", "ipv4")],
+                "ipv6": [],
+            },
+        }
+    )
+
+    with open(tmp_path / cidr_manifest.MANIFEST_FILENAME) as f:
+        manifest = json.load(f)["countries"]
+
+    assert manifest["DE"]["ipv4"]["cidrs"] == 2
+    assert manifest["DE"]["ipv4"]["prefixes"] == {"16": 1, "24": 1}
+
+    counter = CidrCounter(str(tmp_path))
+
+    assert counter.count(["RU", "DE", "US"]) == {
+        "DE": {"ipv4": 65536 + 256, "ipv6": 1 << 96},
+        "RU": {"ipv4": 1024, "ipv6": 0},
+    }
+
+    # Rewritten files are recounted, touched but unchanged ones are not.
+    with open(tmp_path / "ipv4" / "ru.cidr", "a") as f:
+        f.write("9.9.9.0/24\n")
+    os.utime(tmp_path / "ipv6" / "de.cidr", ns=(0, 0))
+
+    assert counter.count(["RU"]) == {"RU": {"ipv4": 1280, "ipv6": 0}}
+    assert counter.entries(["DE"])["DE"]["ipv6"]["mtime_ns"] == 0
+
+
+def test_count_without_manifest(tmp_path):
+    os.makedirs(tmp_path / "ipv4")
+    (tmp_path / "ipv4" / "de.cidr").write_text("5.1.0.0/16\n\n5.2.0.0/24\n")
+
+    assert CidrCounter(str(tmp_path)).count(["DE"]) == {"DE": {"ipv4": 65792}}
+    assert (tmp_path / cidr_manifest.MANIFEST_FILENAME).exists()
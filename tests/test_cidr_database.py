@@ -0,0 +1,80 @@
+import pytest
+
+from cidre import CidrDatabase
+from cidre.cidrs import cidr_database, cidr_ranges, cidr_store
+
+
+@pytest.fixture
+def cidrs():
+    return {
+        "DE": {
+            "ipv4": [cidr_ranges.parse_cidr("5.1.0.0/16", "ipv4")],
+            "ipv6": [cidr_ranges.parse_cidr("2a00:1::/32", "ipv6")],
+        },
+        "RU": {
+            "ipv4": [
+                cidr_ranges.parse_cidr("2.56.90.0/23", "ipv4"),
+                cidr_ranges.parse_cidr("2.56.88.0/23", "ipv4"),
+                cidr_ranges.parse_cidr("5.0.0.0/16", "ipv4"),
+            ],
+            "ipv6": [],
+        },
+        "FR": {
+            "ipv4": [cidr_ranges.parse_cidr("5.2.0.0/16", "ipv4")],
+            "ipv6": [cidr_ranges.parse_cidr("2a00:2::/32", "ipv6")],
+        },
+    }
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_database_loads_countries_lazily(tmp_path, cidrs, binary):
+    cidr_store.FsCidrStore(str(tmp_path), binary=binary).save(cidrs)
+
+    with CidrDatabase(str(tmp_path), max_countries=2) as database:
+        assert database.countries() == ["DE", "FR", "RU"]
+        assert database.loaded() == []
+
+        assert list(database.ranges("ru", "ipv4")) == ["2.56.88.0/22", "5.0.0.0/16"]
+        assert database.count("DE") == {"ipv4": 65536, "ipv6": 1 << 96}
+        assert database.contains("2a00:1:ffff::1", ["DE"])
+        assert not database.contains("2a00:1:ffff::1", ["RU", "FR"])
+
+        # DE was used least recently, so it was dropped for FR.
+        assert database.loaded() == ["RU", "FR"]
+
+        assert database.country_of("5.0.255.255") == "RU"
+        assert database.country_of("5.1.0.0") == "DE"
+        assert database.country_of("2a00:2::1") == "FR"
+        assert database.country_of("2a00:3::") is None
+        assert database.contains("2.56.91.1")
+        assert not database.contains("10.0.0.1")
+
+        with pytest.raises(KeyError):
+            database.ranges("XX", "ipv4")
+
+        with pytest.raises(ValueError):
+            database.ranges("DE", "ipv5")
+
+
+def test_ranges_set_operations():
+    europe = cidr_database.CidrRanges.from_cidrs(["5.0.0.0/14", "2.56.88.0/22"], "ipv4")
+    de = cidr_database.CidrRanges.from_cidrs(["5.1.0.0/16"], "ipv4")
+
+    rest = europe - de
+
+    assert list(rest) == ["2.56.88.0/22", "5.0.0.0/16", "5.2.0.0/15"]
+    assert rest | de == europe
+    assert list(europe & de) == ["5.1.0.0/16"]
+    assert not rest & de
+    assert "5.1.2.3" not in rest
+    assert "5.3.255.255" in rest
+    assert "::1" not in rest
+    assert rest.addresses() == europe.addresses() - de.addresses()
+    assert rest.nbytes() == 3 * 2 * 4
+
+    v6 = cidr_database.CidrRanges.from_cidrs(["2a00:1::/32"], "ipv6")
+
+    assert int(cidr_ranges.parse_ip("2a00:1::ff", "ipv6")) in v6
+
+    with pytest.raises(ValueError):
+        rest | v6
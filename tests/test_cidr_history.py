@@ -0,0 +1,101 @@
+import subprocess
+
+import pytest
+
+from cidre.cidrs import cidr_history, cidr_ranges
+
+
+def cidrs(ipv4, ipv6=()):
+    return {
+        "ipv4": [cidr_ranges.parse_cidr(cidr, "ipv4") for cidr in ipv4],
+        "ipv6": [cidr_ranges.parse_cidr(cidr, "ipv6") for cidr in ipv6],
+    }
+
+
+def intervals(ipv4, ip_version="ipv4"):
+    return cidr_ranges.cidrs_to_intervals(
+        [cidr_ranges.parse_cidr(cidr, ip_version) for cidr in ipv4], ip_version
+    )
+
+
+SNAPSHOTS = [
+    (
+        "20250101",
+        {"RU": cidrs(["5.3.0.0/16"], ["2a00:1fa0::/29"]), "DE": cidrs(["5.1.0.0/16"])},
+    ),
+    (
+        "20250102",
+        {"RU": cidrs(["5.3.0.0/16", "2.56.88.0/22"]), "DE": cidrs(["5.1.0.0/16"])},
+    ),
+    ("20250103", {"RU": cidrs(["5.3.0.0/17", "2.56.88.0/22"])}),
+    ("20250104", {"RU": cidrs(["5.3.0.0/17"]), "FR": cidrs(["2.0.0.0/16"])}),
+]
+
+
+def test_history_rebuilds_states_from_checkpoints_and_deltas(tmp_path):
+    history = cidr_history.FsCidrHistory(str(tmp_path), checkpoint_interval=3)
+
+    kinds = [history.record(snapshot, state) for snapshot, state in SNAPSHOTS]
+    assert kinds == ["checkpoint", "delta", "delta", "checkpoint"]
+
+    history = cidr_history.FsCidrHistory(str(tmp_path), checkpoint_interval=3)
+
+    assert history.state("20250103") == {
+        "RU": {"ipv4": intervals(["2.56.88.0/22", "5.3.0.0/17"]), "ipv6": []}
+    }
+    assert history.state("20250102T120000Z", ["de"]) == {
+        "DE": {"ipv4": intervals(["5.1.0.0/16"]), "ipv6": []}
+    }
+
+    assert history.diff("20250101", "latest") == {
+        "DE": {"ipv4": {"added": [], "removed": intervals(["5.1.0.0/16"])}},
+        "FR": {"ipv4": {"added": intervals(["2.0.0.0/16"]), "removed": []}},
+        "RU": {
+            "ipv4": {"added": [], "removed": intervals(["5.3.128.0/17"])},
+            "ipv6": {
+                "added": [],
+                "removed": intervals(["2a00:1fa0::/29"], "ipv6"),
+            },
+        },
+    }
+
+    with pytest.raises(ValueError):
+        history.record("20250102", SNAPSHOTS[1][1])
+
+    # Recording the last snapshot again replaces it.
+    assert history.record("20250104", SNAPSHOTS[2][1]) == "checkpoint"
+    assert history.diff("20250103", "20250104") == {}
+
+
+def test_history_grows_with_churn(tmp_path):
+    history = cidr_history.FsCidrHistory(str(tmp_path))
+
+    state = {"US": cidrs([f"{i >> 8}.{i & 255}.0.0/24" for i in range(256, 4352, 2)])}
+    history.record("20250101", state)
+
+    state["US"]["ipv4"].append(cidr_ranges.parse_cidr("1.1.1.0/24", "ipv4"))
+    assert history.record("20250102", state) == "delta"
+
+    checkpoint = (tmp_path / "checkpoints" / "20250101.json.gz").stat().st_size
+    delta = (tmp_path / "deltas" / "20250102.json.gz").stat().st_size
+
+    assert delta * 50 < checkpoint
+
+
+def test_diff_prints_changed_cidrs(tmp_path):
+    history = cidr_history.FsCidrHistory(str(tmp_path))
+    for snapshot, state in SNAPSHOTS:
+        history.record(snapshot, state)
+
+    result = subprocess.run(
+        ["cidre", "cidr", "diff", "20250101", "20250104", "RU", "-hd", str(tmp_path)],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+
+    assert result.stdout.splitlines() == [
+        "- RU 5.3.128.0/17",
+        "- RU 2a00:1fa0::/29",
+        "Total: 0 added, 2 removed CIDRs",
+    ]
@@ -0,0 +1,67 @@
+import pytest
+
+from cidre import CidrLookup
+from cidre.cidrs import cidr_binary, cidr_ranges, cidr_store
+
+
+@pytest.fixture
+def cidrs():
+    return {
+        "DE": {
+            "ipv4": [(cidr_ranges.parse_ip("5.1.0.0", "ipv4"), 16)],
+            "ipv6": [(cidr_ranges.parse_ip("2a00:1::", "ipv6"), 32)],
+        },
+        "RU": {
+            "ipv4": [
+                (cidr_ranges.parse_ip("2.56.90.0", "ipv4"), 23),
+                (cidr_ranges.parse_ip("2.56.88.0", "ipv4"), 23),
+            ],
+            "ipv6": [],
+        },
+    }
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_lookup(tmp_path, cidrs, binary):
+    cidr_store.FsCidrStore(str(tmp_path), binary=binary).save(cidrs)
+
+    index = CidrLookup.load(str(tmp_path))
+
+    assert index.lookup("5.1.255.255") == "DE"
+    assert index.lookup("2.56.88.0") == "RU"
+    assert index.lookup("2.56.91.255") == "RU"
+    assert index.lookup("2.56.92.0") is None
+    assert index.lookup("2a00:1:ffff::1") == "DE"
+    assert index.lookup("2a00:2::") is None
+    assert index.size("ipv4") == 2
+
+    with pytest.raises(ValueError):
+        index.lookup("bogus")
+
+
+def test_lookup_ignores_stale_binary(tmp_path, cidrs):
+    cidr_store.FsCidrStore(str(tmp_path)).save(cidrs)
+
+    (tmp_path / "ipv4" / "ru.cidr").write_text("2.56.88.0/22\n5.0.0.0/16\n")
+
+    index = CidrLookup.load(str(tmp_path))
+
+    assert index.lookup("5.0.1.1") == "RU"
+    assert index.lookup("5.1.255.255") == "DE"
+
+    # A new save brings the binary in line with the files again.
+    cidr_store.FsCidrStore(str(tmp_path)).save(cidrs)
+
+    with cidr_binary.open_fresh(str(tmp_path)) as reader:
+        assert reader.countries() == ["DE", "RU"]
+
+    assert CidrLookup.load(str(tmp_path)).lookup("5.0.1.1") is None
+
+
+def test_lookup_overlapping_ranges():
+    index = CidrLookup({"ipv4": [(10, 20, "DE"), (15, 30, "RU"), (31, 40, "RU")]})
+
+    assert index.lookup_int(20, "ipv4") == "DE"
+    assert index.lookup_int(21, "ipv4") == "RU"
+    assert index.lookup_int(40, "ipv4") == "RU"
+    assert index.table("ipv4") == ([10, 21], [20, 40], ["DE", "RU"])
@@ -0,0 +1,131 @@
+import random
+
+import netaddr
+import pytest
+
+from cidre.cidrs import cidr_ranges
+
+
+def test_range_to_cidrs_matches_netaddr():
+    rng = random.Random(0)
+
+    for ip_version, bits in [("ipv4", 32), ("ipv6", 128)]:
+        for _ in range(500):
+            start = rng.getrandbits(bits - 1)
+            count = rng.randint(1, 1 << rng.randint(0, 20))
+
+            expected = [
+                str(cidr)
+                for cidr in netaddr.iprange_to_cidrs(
+                    netaddr.IPAddress(start), netaddr.IPAddress(start + count - 1)
+                )
+            ]
+            actual = [
+                cidr_ranges.format_cidr(network, prefixlen, ip_version)
+                for network, prefixlen in cidr_ranges.range_to_cidrs(
+                    start, count, ip_version
+                )
+            ]
+
+            assert actual == expected
+
+
+def test_range_to_cidrs_rejects_out_of_space():
+    with pytest.raises(ValueError):
+        cidr_ranges.range_to_cidrs(
+            cidr_ranges.parse_ip("255.255.255.0", "ipv4"), 512, "ipv4"
+        )
+
+
+def test_parse_cidr():
+    assert cidr_ranges.parse_cidr("10.0.0.0/8", "ipv4") == (10 << 24, 8)
+    assert cidr_ranges.parse_cidr("2001:db8::/32", "ipv6") == (0x20010DB8 << 96, 32)
+
+    with pytest.raises(ValueError):
+        cidr_ranges.parse_cidr("10.0.0.0/33", "ipv4")
+
+
+def test_merge_cidrs_matches_ipset():
+    rng = random.Random(1)
+
+    for ip_version, bits, version in [("ipv4", 32, 4), ("ipv6", 128, 6)]:
+        cidrs = set()
+        for _ in range(2000):
+            prefixlen = rng.randint(bits - 16, bits)
+            start = (rng.getrandbits(20) << (bits - 20)) >> (bits - prefixlen)
+            cidrs.add((start << (bits - prefixlen), prefixlen))
+
+        expected = [
+            str(cidr)
+            for cidr in sorted(
+                netaddr.IPSet(
+                    netaddr.IPNetwork((start, prefixlen), version=version)
+                    for start, prefixlen in cidrs
+                ).iter_cidrs()
+            )
+        ]
+        actual = [
+            cidr_ranges.format_cidr(start, prefixlen, ip_version)
+            for start, prefixlen in cidr_ranges.merge_cidrs(cidrs, ip_version)
+        ]
+
+        assert actual == expected
+
+
+def test_complement_cidrs_matches_ipset():
+    rng = random.Random(2)
+
+    for ip_version, bits, version, everything in [
+        ("ipv4", 32, 4, "0.0.0.0/0"),
+        ("ipv6", 128, 6, "::/0"),
+    ]:
+        cidrs = set()
+        for _ in range(500):
+            prefixlen = rng.randint(8, bits)
+            start = rng.getrandbits(bits) >> (bits - prefixlen) << (bits - prefixlen)
+            cidrs.add((start, prefixlen))
+
+        covered = netaddr.IPSet(
+            netaddr.IPNetwork((start, prefixlen), version=version)
+            for start, prefixlen in cidrs
+        )
+        reserved = netaddr.IPSet(cidr_ranges.RESERVED_CIDRS[ip_version])
+
+        for include_reserved, expected in [
+            (True, netaddr.IPSet([everything]) - covered),
+            (False, netaddr.IPSet([everything]) - covered - reserved),
+        ]:
+            actual = [
+                cidr_ranges.format_cidr(start, prefixlen, ip_version)
+                for start, prefixlen in cidr_ranges.complement_cidrs(
+                    cidrs, ip_version, include_reserved
+                )
+            ]
+
+            assert actual == [str(cidr) for cidr in expected.iter_cidrs()]
+
+
+def test_diff_intervals_matches_set_difference():
+    rng = random.Random(3)
+
+    for _ in range(50):
+        old = [
+            (start, start + rng.randint(1, 20)) for start in rng.sample(range(200), 15)
+        ]
+        new = [
+            (start, start + rng.randint(1, 20)) for start in rng.sample(range(200), 15)
+        ]
+
+        old_points = {point for start, stop in old for point in range(start, stop)}
+        new_points = {point for start, stop in new for point in range(start, stop)}
+
+        added, removed = cidr_ranges.diff_intervals(old, new)
+
+        assert {p for start, stop in added for p in range(start, stop)} == (
+            new_points - old_points
+        )
+        assert {p for start, stop in removed for p in range(start, stop)} == (
+            old_points - new_points
+        )
+        assert added == cidr_ranges.merge_intervals(added)
+        assert removed == cidr_ranges.merge_intervals(removed)
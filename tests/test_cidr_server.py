@@ -0,0 +1,56 @@
+import json
+import asyncio
+
+from cidre.cidrs import cidr_ranges, cidr_server, cidr_store
+
+
+def save(path, country_code, cidr):
+    cidr_store.FsCidrStore(str(path)).save(
+        {
+            country_code: {
+                "ipv4": [cidr_ranges.parse_cidr(cidr, "ipv4")],
+                "ipv6": [],
+            }
+        }
+    )
+
+
+def test_serve_and_reload(tmp_path):
+    store = tmp_path / "cidr"
+    socket_path = str(tmp_path / "cidre.sock")
+    save(store, "DE", "5.1.0.0/16")
+
+    server = cidr_server.CidrServer(str(store), socket_path, reload_interval=3600)
+
+    async def query(request):
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write(f"{request}\n".encode())
+        await writer.drain()
+        response = (await reader.readline()).decode().strip()
+        writer.close()
+        return response
+
+    async def scenario():
+        task = asyncio.create_task(server.run())
+        while not (tmp_path / "cidre.sock").exists():
+            await asyncio.sleep(0.01)
+
+        try:
+            assert await query("5.1.2.3 1.1.1.1 bogus") == "DE - ?"
+
+            save(store, "RU", "1.1.1.0/24")
+            assert await server.reload()
+            assert not await server.reload()
+
+            # DE was not saved again, but its CIDRs are kept in the store.
+            assert await query("5.1.2.3 1.1.1.1") == "DE RU"
+
+            stats = json.loads(await query("STATS"))
+            assert stats["requests"] == 2
+            assert stats["queries"] == 5
+            assert stats["reloads"] == 2
+            assert set(stats["latency_ms"]) == {"p50", "p90", "p99"}
+        finally:
+            task.cancel()
+
+    asyncio.run(scenario())
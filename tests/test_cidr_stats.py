@@ -0,0 +1,126 @@
+import json
+import pickle
+import contextlib
+import subprocess
+
+from cidre.cidrs import cidr_ranges, cidr_stats, cidr_store
+
+
+def save_store(path):
+    cidr_store.FsCidrStore(str(path)).save(
+        {
+            "DE": {
+                "ipv4": [cidr_ranges.parse_cidr("5.1.0.0/16", "ipv4")],
+                "ipv6": [cidr_ranges.parse_cidr("2a00:1::/32", "ipv6")],
+            },
+            "RU": {
+                "ipv4": [cidr_ranges.parse_cidr("2.56.88.0/22", "ipv4")],
+                "ipv6": [],
+            },
+        }
+    )
+
+
+def test_stage_runs_hooks_and_renders_prometheus():
+    calls = []
+
+    @contextlib.contextmanager
+    def hook(stage, labels):
+        calls.append(("enter", stage, labels))
+        yield
+        calls.append(("exit", stage, labels))
+
+    stats = cidr_stats.CidrStats("pull")
+    stats.add_hook(hook)
+
+    with stats.stage("convert", {"registry": 'ri"pe'}) as stage:
+        stage.add(records_in=10, records_out=4, transferred=512)
+
+    stats.success = True
+
+    assert calls == [
+        ("enter", "convert", {"registry": 'ri"pe'}),
+        ("exit", "convert", {"registry": 'ri"pe'}),
+    ]
+    assert stage.seconds > 0
+
+    metrics = stats.render_prometheus().splitlines()
+
+    assert (
+        'cidre_stage_records_in{command="pull",stage="convert",registry="ri\\"pe"} 10'
+        in metrics
+    )
+    assert (
+        'cidre_stage_bytes{command="pull",stage="convert",registry="ri\\"pe"} 512'
+        in metrics
+    )
+    assert 'cidre_last_run_success{command="pull"} 1' in metrics
+
+    # Stages recorded by process pool workers are not carried back.
+    assert pickle.loads(pickle.dumps(stats)).stages == []
+
+
+def test_count_writes_stats_json(tmp_path):
+    save_store(tmp_path / "cidr")
+
+    result = subprocess.run(
+        [
+            "cidre",
+            "cidr",
+            "count",
+            "DE",
+            "RU",
+            "-cs",
+            str(tmp_path / "cidr"),
+            "--stats",
+            "json",
+            "--stats-output",
+            str(tmp_path / "stats.json"),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+
+    stats = json.loads((tmp_path / "stats.json").read_text())
+
+    assert stats["command"] == "count"
+    assert stats["success"] is True
+    assert [stage["stage"] for stage in stats["stages"]] == ["count"]
+    assert stats["stages"][0]["records_in"] == 4
+    assert stats["stages"][0]["records_out"] == 2
+
+
+def test_firewall_writes_prometheus_textfile(tmp_path):
+    save_store(tmp_path / "cidr")
+
+    result = subprocess.run(
+        [
+            "cidre",
+            "firewall",
+            "deny",
+            "de",
+            "-f",
+            "nftables",
+            "-cs",
+            str(tmp_path / "cidr"),
+            "--dry-run",
+            str(tmp_path / "ruleset.nft"),
+            "--stats",
+            "prometheus",
+            "--stats-output",
+            str(tmp_path / "cidre.prom"),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+
+    metrics = (tmp_path / "cidre.prom").read_text().splitlines()
+    labels = 'command="firewall",stage="firewall",backend="nftables",action="deny"'
+
+    assert f"cidre_stage_records_in{{{labels}}} 2" in metrics
+    assert (
+        f"cidre_stage_bytes{{{labels}}} {(tmp_path / 'ruleset.nft').stat().st_size}"
+        in metrics
+    )
@@ -0,0 +1,74 @@
+import os
+
+from cidre import CidrLookup
+from cidre.cidrs import cidr_counter, cidr_manifest, cidr_ranges, cidr_store
+
+
+def networks(*cidrs):
+    return {
+        "ipv4": [cidr_ranges.parse_cidr(cidr, "ipv4") for cidr in cidrs],
+        "ipv6": [],
+    }
+
+
+def test_save_skips_unchanged_files(tmp_path):
+    store = cidr_store.FsCidrStore(str(tmp_path), workers=2)
+    store.save({"DE": networks("5.1.0.0/16"), "RU": networks("2.56.88.0/22")})
+
+    for path in [tmp_path / "ipv4" / "de.cidr", tmp_path / "ipv4" / "ru.cidr"]:
+        os.utime(path, ns=(0, 0))
+
+    store.save({"DE": networks("5.1.0.0/16"), "RU": networks("2.56.88.0/21")})
+
+    assert (tmp_path / "ipv4" / "de.cidr").stat().st_mtime_ns == 0
+    assert (tmp_path / "ipv4" / "ru.cidr").stat().st_mtime_ns != 0
+    assert (tmp_path / "ipv4" / "ru.cidr").read_text() == "2.56.88.0/21\n"
+    assert not (tmp_path / cidr_store.STAGING_FOLDER).exists()
+
+
+def test_save_swaps_symlink(tmp_path):
+    base = tmp_path / "cidr"
+    store = cidr_store.FsCidrStore(str(base), swap=True)
+
+    store.save({"DE": networks("5.1.0.0/16"), "RU": networks("2.56.88.0/22")})
+    first = base.resolve()
+
+    store.save({"RU": networks("2.56.88.0/21")})
+    second = base.resolve()
+
+    assert base.is_symlink()
+    assert first != second
+    assert not first.exists()
+    assert (base / "ipv4" / "de.cidr").read_text() == "5.1.0.0/16\n"
+    assert (base / "ipv4" / "ru.cidr").read_text() == "2.56.88.0/21\n"
+    assert sorted(path.name for path in tmp_path.iterdir()) == [second.name, "cidr"]
+
+
+def test_save_without_symlink_falls_back_to_in_place(tmp_path):
+    cidr_store.FsCidrStore(str(tmp_path), swap=True).save(
+        {"DE": networks("5.1.0.0/16")}
+    )
+
+    assert not tmp_path.is_symlink()
+    assert (tmp_path / "ipv4" / "de.cidr").read_text() == "5.1.0.0/16\n"
+
+
+def test_save_keeps_countries_not_saved_in_binary_and_manifest(tmp_path):
+    base = tmp_path / "cidr"
+    store = cidr_store.FsCidrStore(str(base), swap=True)
+
+    store.save({"DE": networks("5.1.0.0/16"), "RU": networks("2.56.88.0/22")})
+    store.save({"RU": networks("2.56.88.0/21")})
+
+    index = CidrLookup.load(str(base))
+
+    assert index.lookup("5.1.0.1") == "DE"
+    assert index.lookup("2.56.95.1") == "RU"
+
+    manifest = cidr_manifest.FsCidrManifest(str(base)).load()
+
+    assert manifest["DE"]["ipv4"]["addresses"] == 65536
+    assert manifest["RU"]["ipv4"]["addresses"] == 2048
+    assert cidr_counter.CidrCounter(str(base)).count(["DE"]) == {
+        "DE": {"ipv4": 65536, "ipv6": 0}
+    }
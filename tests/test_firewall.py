@@ -0,0 +1,460 @@
+import os
+import stat
+import subprocess
+
+import pytest
+
+from cidre.firewalls import iptables_firewall, ufw_firewall
+
+
+@pytest.fixture
+def stubs(tmp_path):
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+
+    log_path = tmp_path / "calls.log"
+
+    for binary in ["ipset", "iptables", "ip6tables", "ufw"]:
+        stub = bin_path / binary
+        stub.write_text(
+            "#!/bin/sh\n"
+            f'echo "{binary} $*" >> {log_path}\n'
+            f'if [ "$1" = "restore" ]; then cat >> {log_path}; fi\n'
+            # Checked rules and chains don't exist yet.
+            'case " $* " in *" -C "*|*" -S "*) exit 1;; esac\n'
+        )
+        stub.chmod(stub.stat().st_mode | stat.S_IEXEC)
+
+    env = dict(os.environ, PATH=f"{bin_path}{os.pathsep}{os.environ['PATH']}")
+
+    return env, log_path
+
+
+@pytest.fixture
+def store(tmp_path):
+    store_path = tmp_path / "cidr"
+
+    (store_path / "ipv4").mkdir(parents=True)
+    (store_path / "ipv6").mkdir(parents=True)
+    (store_path / "ipv4" / "ru.cidr").write_text("2.56.88.0/22\n5.3.0.0/16\n")
+    (store_path / "ipv6" / "ru.cidr").write_text("2a00:1fa0::/29\n")
+
+    return store_path
+
+
+def test_iptables_loads_ipset_with_restore_and_swap(stubs, store):
+    env, log_path = stubs
+
+    result = subprocess.run(
+        ["cidre", "firewall", "deny", "ru", "-f", "iptables", "-cs", str(store)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    assert result.returncode == 0
+    assert "Applying complete ✅" in result.stdout
+
+    calls = log_path.read_text().splitlines()
+
+    assert calls.count("ipset restore") == 2
+    assert "add cidre_ru_blocklist_ipv4_tmp 5.3.0.0/16 -exist" in calls
+    assert "add cidre_ru_blocklist_ipv6_tmp 2a00:1fa0::/29 -exist" in calls
+    assert "ipset swap cidre_ru_blocklist_ipv4_tmp cidre_ru_blocklist_ipv4" in calls
+    assert "ipset destroy cidre_ru_blocklist_ipv4_tmp" in calls
+    assert not any(call.startswith("ipset add") for call in calls)
+
+
+def test_iptables_pushes_only_changes_since_last_apply(stubs, store, tmp_path):
+    env, log_path = stubs
+    command = ["cidre", "firewall", "deny", "ru", "-f", "iptables", "-cs", str(store)]
+
+    assert subprocess.run(command, capture_output=True, env=env).returncode == 0
+    assert (tmp_path / "state" / "iptables" / "deny" / "ipv4" / "ru.cidr").exists()
+
+    (store / "ipv4" / "ru.cidr").write_text("5.3.0.0/16\n5.8.0.0/19\n")
+    log_path.write_text("")
+
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert "RU (ipv4): 1 added, 1 removed, 1 unchanged." in result.stderr
+    assert "RU (ipv6): 0 added, 0 removed, 1 unchanged." in result.stderr
+
+    calls = log_path.read_text().splitlines()
+
+    assert "del cidre_ru_blocklist_ipv4 2.56.88.0/22 -exist" in calls
+    assert "add cidre_ru_blocklist_ipv4 5.8.0.0/19 -exist" in calls
+    assert "ipset swap cidre_ru_blocklist_ipv4_tmp cidre_ru_blocklist_ipv4" not in calls
+
+
+def test_iptables_combined_set_is_matched_once_across_runs(stubs, store, tmp_path):
+    env, log_path = stubs
+
+    (store / "ipv4" / "ir.cidr").write_text("2.144.0.0/14\n")
+    (store / "ipv6" / "ir.cidr").write_text("")
+
+    # Keeps the rules, so checks find the ones inserted by earlier runs.
+    rules_path = tmp_path / "rules"
+    rules_path.touch()
+
+    for binary in ["iptables", "ip6tables"]:
+        (tmp_path / "bin" / binary).write_text(
+            "#!/bin/sh\n"
+            f'echo "{binary} $*" >> {log_path}\n'
+            'op="$1"; shift\n'
+            'case "$op" in\n'
+            f'  -C|-S) grep -qxF "{binary} $*" {rules_path};;\n'
+            f'  -N|-I) echo "{binary} $*" >> {rules_path};;\n'
+            "esac\n"
+        )
+
+    command = ["cidre", "firewall", "deny", "ru", "ir", "-f", "iptables"]
+    command += ["--combined", "-cs", str(store)]
+
+    for _ in range(2):
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        assert result.returncode == 0
+        assert "Applying complete ✅" in result.stdout
+
+    assert rules_path.read_text().splitlines() == [
+        "iptables CIDRE",
+        "iptables INPUT -j CIDRE",
+        "iptables CIDRE -m set --match-set cidre_deny_ipv4 src -j DROP",
+        "ip6tables CIDRE",
+        "ip6tables INPUT -j CIDRE",
+        "ip6tables CIDRE -m set --match-set cidre_deny_ipv6 src -j DROP",
+    ]
+
+    calls = log_path.read_text().splitlines()
+
+    assert "add cidre_deny_ipv4_tmp 5.3.0.0/16 -exist" in calls
+    assert "add cidre_deny_ipv4_tmp 2.144.0.0/14 -exist" in calls
+    assert "add cidre_deny_ipv6_tmp 2a00:1fa0::/29 -exist" in calls
+    assert calls.count("ipset restore") == 2
+
+
+def test_iptables_combined_changes_nothing_when_a_file_is_missing(stubs, store):
+    env, log_path = stubs
+
+    (store / "ipv4" / "ir.cidr").write_text("2.144.0.0/14\n")
+
+    command = ["cidre", "firewall", "deny", "ru", "ir", "-f", "iptables"]
+    command += ["--combined", "-cs", str(store)]
+
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    assert "Applying failed ❌" in result.stdout
+    assert "CIDR file not found for IR in ipv6." in result.stderr
+    assert not log_path.exists()
+
+
+def test_ipset_size_scales_with_cidr_count():
+    small = iptables_firewall.ipset_size(["5.3.0.0/16", "2.56.88.0/22"], "ipv4")
+
+    assert small["hashsize"] == 1024
+    assert small["maxelem"] == 65536
+    assert small["prefixes"] == 2
+
+    cidr_blocks = [f"10.{i >> 8}.{i & 255}.0/24" for i in range(60000)]
+    large = iptables_firewall.ipset_size(cidr_blocks, "ipv4")
+
+    assert large["hashsize"] == 32768
+    assert large["maxelem"] == 131072
+    assert large["prefixes"] == 1
+    assert large["memory"] > 60000 * iptables_firewall.IPSET_ELEMENT_BYTES["ipv4"]
+
+
+def test_iptables_rebuilds_sets_smaller_than_needed(stubs, store):
+    env, log_path = stubs
+    command = ["cidre", "firewall", "deny", "ru", "-f", "iptables", "-cs", str(store)]
+
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert "hashsize 1024, maxelem 65536" in result.stderr
+    assert "2 hash probes per lookup" in result.stderr
+
+    calls = log_path.read_text().splitlines()
+
+    assert (
+        "create cidre_ru_blocklist_ipv4_tmp hash:net family inet "
+        "hashsize 1024 maxelem 65536 -exist"
+    ) in calls
+
+    # Existing sets report their current size, grown by the kernel here.
+    ipset = log_path.parent / "bin" / "ipset"
+    stub = ipset.read_text()
+    ipset.write_text(
+        stub + 'if [ "$1" = "list" ]; then echo "Header: family inet hashsize 4096 '
+        'maxelem 65536 bucketsize 12"; fi\n'
+    )
+    log_path.write_text("")
+
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert "Rebuilding" not in result.stderr
+    assert "ipset restore" not in log_path.read_text().splitlines()
+
+    ipset.write_text(
+        stub + 'if [ "$1" = "list" ]; then echo "Header: family inet hashsize 1024 '
+        'maxelem 1024 bucketsize 12"; fi\n'
+    )
+    log_path.write_text("")
+
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert "Rebuilding from hashsize 1024, maxelem 1024" in result.stderr
+
+    calls = log_path.read_text().splitlines()
+
+    # The state is ignored, so the rebuilt set is loaded in full.
+    assert "add cidre_ru_blocklist_ipv4_tmp 5.3.0.0/16 -exist" in calls
+    assert "ipset swap cidre_ru_blocklist_ipv4_tmp cidre_ru_blocklist_ipv4" in calls
+
+
+def test_ufw_pushes_only_changes_since_last_apply(stubs, store):
+    env, log_path = stubs
+    command = ["cidre", "firewall", "reject", "ru", "-cs", str(store)]
+
+    assert subprocess.run(command, capture_output=True, env=env).returncode == 0
+
+    (store / "ipv6" / "ru.cidr").write_text("2a00:1fa0::/30\n")
+    log_path.write_text("")
+
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert "UFW: 1 added, 1 removed, 2 unchanged." in result.stderr
+
+    calls = log_path.read_text().splitlines()
+
+    assert calls == [
+        "ufw delete reject from 2a00:1fa0::/29",
+        "ufw reject from 2a00:1fa0::/30",
+    ]
+
+
+def test_ufw_full_still_deletes_removed_rules(stubs, store):
+    env, log_path = stubs
+    command = ["cidre", "firewall", "reject", "ru", "-cs", str(store)]
+
+    assert subprocess.run(command, capture_output=True, env=env).returncode == 0
+
+    (store / "ipv6" / "ru.cidr").write_text("2a00:1fa0::/30\n")
+    log_path.write_text("")
+
+    result = subprocess.run(command + ["--full"], capture_output=True, env=env)
+    assert result.returncode == 0
+
+    assert log_path.read_text().splitlines() == [
+        "ufw reject from 2.56.88.0/22",
+        "ufw reject from 5.3.0.0/16",
+        "ufw delete reject from 2a00:1fa0::/29",
+        "ufw reject from 2a00:1fa0::/30",
+    ]
+
+
+USER_RULES = """*filter
+:ufw-user-input - [0:0]
+### RULES ###
+
+### tuple ### allow tcp 22 0.0.0.0/0 any 0.0.0.0/0 in
+-A ufw-user-input -p tcp --dport 22 -j ACCEPT
+
+### END RULES ###
+COMMIT
+"""
+
+
+def test_ufw_bulk_writes_rules_files_and_reloads_once(
+    stubs, store, tmp_path, monkeypatch
+):
+    env, log_path = stubs
+
+    rules_path = tmp_path / "ufw"
+    rules_path.mkdir()
+    (rules_path / "user.rules").write_text(USER_RULES)
+    (rules_path / "user6.rules").write_text(USER_RULES.replace("ufw-", "ufw6-"))
+
+    firewall = ufw_firewall.UfwFirewall(
+        str(store), str(tmp_path / "state"), bulk=True, rules_folder=str(rules_path)
+    )
+
+    monkeypatch.setenv("PATH", env["PATH"])
+
+    assert firewall.apply("deny", ["RU"])
+
+    (store / "ipv4" / "ru.cidr").write_text("5.3.0.0/16\n")
+    assert firewall.apply("deny", ["RU"])
+
+    assert log_path.read_text().splitlines() == ["ufw reload", "ufw reload"]
+
+    rules = (rules_path / "user.rules").read_text()
+
+    assert "### tuple ### deny any any 0.0.0.0/0 any 2.56.88.0/22 in" not in rules
+    assert rules.count("### tuple ### deny any any 0.0.0.0/0 any 5.3.0.0/16 in") == 1
+    assert "-A ufw-user-input -s 5.3.0.0/16 -j DROP\n\n### END RULES ###" in rules
+    assert "-A ufw-user-input -p tcp --dport 22 -j ACCEPT" in rules
+
+    rules6 = (rules_path / "user6.rules").read_text()
+
+    assert "### tuple ### deny any any ::/0 any 2a00:1fa0::/29 in" in rules6
+    assert "-A ufw6-user-input -s 2a00:1fa0::/29 -j DROP" in rules6
+
+
+def test_ufw_bulk_fails_without_rules_file(stubs, store, tmp_path, monkeypatch):
+    env, log_path = stubs
+
+    rules_path = tmp_path / "ufw"
+    rules_path.mkdir()
+    (rules_path / "user.rules").write_text(USER_RULES)
+
+    firewall = ufw_firewall.UfwFirewall(
+        str(store), str(tmp_path / "state"), bulk=True, rules_folder=str(rules_path)
+    )
+
+    monkeypatch.setenv("PATH", env["PATH"])
+
+    assert not firewall.apply("deny", ["RU"])
+
+    state_path = tmp_path / "state" / "ufw" / "deny"
+
+    assert (state_path / "ipv4" / "ru.cidr").exists()
+    assert not (state_path / "ipv6" / "ru.cidr").exists()
+
+
+def test_backend_specific_options_fail_on_other_backends(stubs, store, tmp_path):
+    env, log_path = stubs
+    ruleset_path = tmp_path / "cidre.nft"
+
+    for options, error in [
+        (["--dry-run", str(ruleset_path)], "ufw can't write a dry run."),
+        (["-f", "iptables", "--bulk"], "iptables can't write rules in bulk."),
+        (["-f", "nftables", "--combined"], "nftables can't combine countries"),
+    ]:
+        result = subprocess.run(
+            ["cidre", "firewall", "deny", "ru", "-cs", str(store), *options],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        assert "Oh no! Applying failed ❌" in result.stdout
+        assert error in result.stderr
+
+    # Nothing was applied, live or dry.
+    assert not log_path.exists()
+    assert not ruleset_path.exists()
+
+
+def test_nftables_dry_run_renders_interval_sets(store, tmp_path):
+    ruleset_path = tmp_path / "cidre.nft"
+
+    result = subprocess.run(
+        ["cidre", "firewall", "deny", "ru", "-f", "nftables"]
+        + ["-cs", str(store), "--dry-run", str(ruleset_path)],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+    assert "Applying complete ✅" in result.stdout
+
+    ruleset = ruleset_path.read_text()
+
+    assert "set deny_ipv4 { type ipv4_addr; flags interval; auto-merge; }" in ruleset
+    assert "add rule inet cidre input ip saddr @deny_ipv4 drop" in ruleset
+    assert "add rule inet cidre input ip6 saddr @deny_ipv6 drop" in ruleset
+    assert "flush set inet cidre deny_ipv4" in ruleset
+    assert "    2.56.88.0/22,\n    5.3.0.0/16,\n" in ruleset
+    assert "    2a00:1fa0::/29,\n" in ruleset
+
+
+def test_nftables_keeps_countries_of_earlier_runs(stubs, store, tmp_path):
+    env, log_path = stubs
+
+    nft = tmp_path / "bin" / "nft"
+    nft.write_text(f"#!/bin/sh\ncat > {tmp_path / 'ruleset.nft'}\n")
+    nft.chmod(nft.stat().st_mode | stat.S_IEXEC)
+
+    (store / "ipv4" / "ir.cidr").write_text("2.144.0.0/14\n")
+    (store / "ipv6" / "ir.cidr").write_text("")
+
+    command = ["cidre", "firewall", "deny", "-f", "nftables", "-cs", str(store)]
+
+    assert (
+        subprocess.run(command + ["ru"], capture_output=True, env=env).returncode == 0
+    )
+
+    result = subprocess.run(command + ["ir"], capture_output=True, text=True, env=env)
+    assert "Applying complete ✅" in result.stdout
+
+    ruleset = (tmp_path / "ruleset.nft").read_text()
+
+    assert "    2.144.0.0/14,\n" in ruleset
+    assert "    5.3.0.0/16,\n" in ruleset
+    assert "    2a00:1fa0::/29,\n" in ruleset
+
+    # A missing country fails before anything is applied.
+    result = subprocess.run(
+        command + ["ir", "cn"], capture_output=True, text=True, env=env
+    )
+    assert "Oh no! Applying failed ❌" in result.stdout
+    assert "CIDR file not found for CN in ipv4." in result.stderr
+
+
+def test_iptables_allow_drop_rest(stubs, store):
+    env, log_path = stubs
+
+    result = subprocess.run(
+        ["cidre", "firewall", "allow", "ru", "--drop-rest", "-f", "iptables"]
+        + ["-cs", str(store)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    assert result.returncode == 0
+    assert "Applying complete ✅" in result.stdout
+
+    calls = log_path.read_text().splitlines()
+
+    assert "add cidre_allowlist_ipv4_tmp 5.3.0.0/16 -exist" in calls
+    assert "add cidre_reserved_ipv4_tmp 10.0.0.0/8 -exist" in calls
+    drop = calls.index(
+        "iptables -I INPUT -m set ! --match-set cidre_allowlist_ipv4 src "
+        "-m set ! --match-set cidre_reserved_ipv4 src -j DROP"
+    )
+    established = calls.index(
+        "iptables -I INPUT -m conntrack --ctstate ESTABLISHED,RELATED -j ACCEPT"
+    )
+
+    # Inserted later, so replies are accepted before the rest is dropped.
+    assert established > drop
+    assert (
+        "ip6tables -I INPUT -m set --match-set cidre_allowlist_ipv6 src -j ACCEPT"
+        in calls
+    )
+
+
+def test_nftables_allow_drop_rest_renders_set_pair(store, tmp_path):
+    ruleset_path = tmp_path / "cidre.nft"
+
+    result = subprocess.run(
+        ["cidre", "firewall", "allow", "ru", "--drop-rest", "-f", "nftables"]
+        + ["-cs", str(store), "--dry-run", str(ruleset_path)],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+
+    ruleset = ruleset_path.read_text()
+
+    assert "add element inet cidre allowlist_ipv4 {\n    2.56.88.0/22,\n" in ruleset
+    assert "    1.0.0.0-2.56.87.255,\n" in ruleset
+    assert "    2.56.92.0-5.2.255.255,\n" in ruleset
+    assert "10.0.0.0" not in ruleset.split("droprest_ipv4 {")[-1].split("}")[0]
+
+    # Sets of earlier allow and deny runs are left alone.
+    assert "flush set inet cidre deny_ipv4" not in ruleset
+    assert "flush set inet cidre allow_ipv4" not in ruleset
+
+    established = ruleset.index(
+        "add rule inet cidre input ct state established,related accept"
+    )
+
+    assert ruleset.index("ip saddr @allowlist_ipv4 accept") < established
+    assert established < ruleset.index("ip saddr @droprest_ipv4 drop")
@@ -0,0 +1,25 @@
+from cidre.cidrs.rir_cache import FsRirCache
+
+
+def test_rir_cache_skips_unchanged(tmp_path):
+    cache = FsRirCache(str(tmp_path), fingerprint={"merge": True})
+
+    assert cache.headers("arin") == {}
+    assert cache.save("arin", "https://arin", [b"arin|US|ipv4|"], '"v1"', None)
+    assert cache.headers("arin") == {"If-None-Match": '"v1"'}
+    assert cache.is_changed(["arin"])
+
+    cache.commit(["arin"])
+    assert not cache.is_changed(["arin"])
+
+    assert not cache.save("arin", "https://arin", [b"arin|US|ipv4|"], '"v2"', None)
+    assert not cache.is_changed(["arin"])
+
+    assert cache.save("arin", "https://arin", [b"arin|CA|ipv4|"], '"v3"', None)
+    assert cache.is_changed(["arin"])
+
+
+def test_rir_cache_detects_fingerprint_change(tmp_path):
+    FsRirCache(str(tmp_path), fingerprint={"merge": True}).commit(["arin"])
+
+    assert FsRirCache(str(tmp_path), fingerprint={"merge": False}).is_changed(["arin"])
@@ -0,0 +1,104 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from cidre import RirFetcher
+from cidre.cidrs import cidr_ranges, cidr_stats, rir_sources
+
+REGISTRIES = ["apnic", "ripencc"]
+
+
+def delegated(registry, cc, start_ip, value):
+    return (
+        f"2|{registry}|20250101|1|19830705|20250101|+0000\n"
+        f"{registry}|*|ipv4|*|1|summary\n"
+        f"{registry}|{cc}|ipv4|{start_ip}|{value}|20100101|allocated|x\n"
+    )
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, bz2.compress, lzma.compress])
+def test_open_text_decompresses_by_magic(tmp_path, compress):
+    path = tmp_path / "delegated-apnic-extended-20250101"
+    path.write_bytes(compress(delegated("apnic", "JP", "1.0.16.0", 4096).encode()))
+
+    with rir_sources.open_text(str(path)) as f:
+        assert f.read().splitlines()[-1].startswith("apnic|JP|ipv4|1.0.16.0|4096|")
+
+
+def test_sources_pick_latest_archive_on_or_before_date(tmp_path):
+    (tmp_path / "apnic" / "2025").mkdir(parents=True)
+    for date in ["20250101", "20250103"]:
+        (
+            tmp_path / "apnic" / "2025" / f"delegated-apnic-extended-{date}.gz"
+        ).write_bytes(
+            gzip.compress(delegated("apnic", "JP", "1.0.16.0", 4096).encode())
+        )
+    (tmp_path / "delegated-ripencc-extended-20250102.bz2").write_bytes(
+        bz2.compress(delegated("ripencc", "DE", "5.1.0.0", 65536).encode())
+    )
+    (tmp_path / "delegated-ripencc-extended-20250102.bz2.md5").write_text("x")
+
+    sources = rir_sources.FsRirSources([f"file://{tmp_path}"], REGISTRIES)
+
+    assert sources.dates() == ["20250101", "20250102", "20250103"]
+    assert sources.dates("20250102", None) == ["20250102", "20250103"]
+
+    assert sources.snapshot("20250101") == {
+        "apnic": str(
+            tmp_path / "apnic" / "2025" / "delegated-apnic-extended-20250101.gz"
+        )
+    }
+    assert sources.snapshot("20250102")["apnic"].endswith("-20250101.gz")
+    assert sources.latest()["apnic"].endswith("-20250103.gz")
+    assert sources.latest()["ripencc"].endswith("-20250102.bz2")
+
+    pinned = tmp_path / "ripe.txt"
+    pinned.write_text(delegated("ripencc", "FR", "2.0.0.0", 256))
+
+    sources = rir_sources.FsRirSources(
+        [str(tmp_path), f"ripencc=file://{pinned}"], REGISTRIES
+    )
+    assert sources.snapshot("20250101")["ripencc"] == str(pinned)
+
+    with pytest.raises(ValueError):
+        rir_sources.FsRirSources([f"arin={pinned}"], REGISTRIES)
+
+    with pytest.raises(ValueError):
+        rir_sources.FsRirSources([str(pinned)], REGISTRIES)
+
+
+def test_fetch_many_compiles_every_snapshot(tmp_path):
+    for date, value in [("20250101", 256), ("20250102", 512)]:
+        (tmp_path / f"delegated-ripencc-extended-{date}.xz").write_bytes(
+            lzma.compress(delegated("ripencc", "DE", "5.1.0.0", value).encode())
+        )
+
+    sources = rir_sources.FsRirSources([str(tmp_path)], REGISTRIES)
+    stats = cidr_stats.CidrStats("pull")
+    fetcher = RirFetcher(merge=True, proxy=None, stats=stats)
+
+    snapshots = dict(
+        fetcher.fetch_many((date, sources.snapshot(date)) for date in sources.dates())
+    )
+
+    assert snapshots["20250101"]["DE"]["ipv4"] == [
+        cidr_ranges.parse_cidr("5.1.0.0/24", "ipv4")
+    ]
+    assert snapshots["20250102"]["DE"]["ipv4"] == [
+        cidr_ranges.parse_cidr("5.1.0.0/23", "ipv4")
+    ]
+
+    # Every snapshot gets its own series, which the textfile collector requires.
+    series = [
+        line.rsplit(" ", 1)[0]
+        for line in stats.render_prometheus().splitlines()
+        if not line.startswith("#")
+    ]
+
+    assert len(series) == len(set(series))
+    assert (
+        'cidre_stage_records_out{command="pull",stage="convert",'
+        'snapshot="20250102",registry="ripencc"} 1'
+    ) in stats.render_prometheus()